@@ -1,39 +1,108 @@
+
 # my_flask_app/app/__init__.py
+#
+# Importing the package only pulls in Flask, SQLAlchemy and the config.
+# Everything else is imported inside the factories, so scripts that only
+# need the database (create_master_admin.py) don't pay for routes, JWT,
+# Socket.IO or Alembic. See benchmarks/startup.py.
+
+import os
 
 from flask import Flask
-from flask_jwt_extended import JWTManager
-from flask_cors import CORS
-from flask_socketio import SocketIO
 from .config import Config
-from .routes import bp as routes_bp, is_token_revoked
-from .jwt_handlers import (
-    revoked_token_handler,
-    expired_token_handler,
-    invalid_token_handler,
-    unauthorized_handler
-)
-from .error_handlers import register_error_handlers
-from .sockets import register_socket_handlers
-from .db import db
-import logging
-from flask_migrate import Migrate
-
-socketio = SocketIO(cors_allowed_origins="*")  # Singleton SocketIO instance
-
-def create_app():
+from .db import db, init_db
+
+_socket_handlers_registered = False
+
+
+def __getattr__(name):
+    # `from app import socketio` creates the singleton on first use, so
+    # DB-only scripts never import Flask-SocketIO
+    if name == "socketio":
+        global socketio
+        from flask_socketio import SocketIO
+        socketio = SocketIO(cors_allowed_origins="*")  # Singleton SocketIO instance
+        return socketio
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def create_db_app():
+    """
+    Minimal app for admin scripts: config, the database and the password
+    hasher. No blueprints, JWT, Socket.IO, migrations or
+    background workers.
+    """
+    from .passwords import password_hasher
+
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    init_db(app)
+    password_hasher.init_app(app)
+    return app
+
+
+def create_app(cli=None):
+    """
+    Full app for gunicorn/run.py. cli=True also registers CLI-only extensions
+    (Flask-Migrate's `flask db` commands); by default that happens only when
+    the app is loaded by the `flask` command.
+    """
+    from flask_cors import CORS
+    from .routes import bp as routes_bp
+    from .jwt_handlers import (
+        revoked_token_handler,
+        expired_token_handler,
+        invalid_token_handler,
+        unauthorized_handler
+    )
+    from .error_handlers import register_error_handlers
+    from .sockets import presence, chat_sessions, forget_socket
+    from .connections import connection_manager
+    from .bus import init_socket_backend
+    from .moderation import init_moderation_cache
+    from .dashboard import dashboard_cache
+    from .revocation import revocation_store, is_token_revoked
+    from .tokens import CachingJWTManager, verified_tokens
+    from .passwords import password_hasher
+    from .mailbox import mailbox
+    from .report_queue import report_queue
+    from .history import message_history
+    from .admin_feed import admin_feed
+    from .ratelimit import socket_limiter
+    from .metrics import init_metrics
+    from .logs import log_pipeline
+    from . import socketio
+
+    if cli is None:
+        cli = os.environ.get("FLASK_RUN_FROM_CLI") == "true"
+
     app = Flask(__name__)
     app.config.from_object(Config)
-    
-    db.init_app(app)  # Initialize SQLAlchemy with app
-    migrate = Migrate(app, db) 
-    
-    app.logger.setLevel(logging.DEBUG)
+    log_pipeline.init_app(app)
+
+    init_db(app)  # SQLAlchemy with pool settings from config
+    if cli:
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    init_moderation_cache(app)
+    dashboard_cache.init_app(app)
+    revocation_store.init_app(app)
+    password_hasher.init_app(app)
 
     CORS(app)
 
-    socketio.init_app(app)  # Initialize with app
+    _register_socket_handlers_once()  # before init_app, which replays them onto each new server
+    init_socket_backend(app, socketio, presence, chat_sessions)  # Initialize with app
+    mailbox.init_app(app, socketio)
+    report_queue.init_app(app, socketio)
+    message_history.init_app(app, socketio)
+    admin_feed.init_app(app, socketio, presence)
+    connection_manager.init_app(app, socketio, presence, on_stale=lambda sid: forget_socket(socketio, sid))
+    socket_limiter.init_app(app)
+    init_metrics(app, presence, chat_sessions)
 
-    jwt = JWTManager(app)
+    verified_tokens.init_app(app)
+    jwt = CachingJWTManager(app)
     @jwt.user_identity_loader
     def user_identity_lookup(user):
         # Return a string for the subject claim — use user_id as string
@@ -47,9 +116,10 @@ def create_app():
             "username": identity["username"],
             "role": identity["role"],
             "chat_id": identity["chat_id"],
-            "is_master_admin": identity["is_master_admin"]
+            "is_master_admin": identity["is_master_admin"],
+            "mv": identity.get("moderation_version", 0),
         }
-        
+
     jwt.token_in_blocklist_loader(is_token_revoked)
     jwt.revoked_token_loader(revoked_token_handler)
     jwt.expired_token_loader(expired_token_handler)
@@ -61,4 +131,13 @@ def create_app():
 
     return app
 
-register_socket_handlers(socketio)  # Register handlers once here
+
+def _register_socket_handlers_once():
+    # create_app may run several times in one process (benchmarks, tests);
+    # SocketIO keeps the handler list across init_app calls.
+    global _socket_handlers_registered
+    if not _socket_handlers_registered:
+        from . import socketio
+        from .sockets import register_socket_handlers
+        register_socket_handlers(socketio)
+        _socket_handlers_registered = True
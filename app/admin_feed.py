@@ -0,0 +1,164 @@
+# my_flask_app/app/admin_feed.py
+
+import logging
+import threading
+import time
+
+from .dashboard import dashboard_counts
+from .moderation import get_users_by_chat_ids
+from .revocation import is_token_revoked
+
+log = logging.getLogger(__name__)
+
+ADMIN_ROOM = "admins"
+
+
+class AdminFeed:
+    """
+    Pushes dashboard changes to admin sockets instead of having every open
+    admin tab poll for them.
+
+    Report ingestion and moderation only record what changed. A background
+    task turns whatever piled up during ADMIN_FEED_INTERVAL into one
+    "admin_feed" frame for the admin room:
+
+        {"reports": [...new rows, newest first...],
+         "users": {username: {"is_banned": ..., "is_muted": ..., "deleted": ...}},
+         "counts": {...dashboard counts...},
+         "online": n}
+
+    Keys are only present when something changed. A burst of reports or bulk
+    moderation therefore costs one frame and one counts query per interval,
+    however many tabs are open. More than ADMIN_FEED_MAX_REPORTS new reports
+    in one interval are sent as {"reports_dropped": n} and the client reloads
+    the dashboard instead.
+
+    Each worker emits the changes it made to the whole room (through the
+    client manager), and the online count only to its own subscribers, so
+    no tab gets the same count twice. Subscriptions end when the access
+    token they were made with expires or is revoked, or its user is
+    banned, demoted or deleted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reports = []
+        self._reports_dropped = 0
+        self._users = {}
+        self._subscribers = {}  # sid -> claims of the token it subscribed with
+        self._last_online = None
+        self._socketio = None
+        self._app = None
+        self._presence = None
+        self.interval = 1.0
+        self.max_reports = 50
+
+    def init_app(self, app, socketio, presence):
+        self._app = app
+        self._socketio = socketio
+        self._presence = presence
+        self.interval = app.config["ADMIN_FEED_INTERVAL"]
+        self.max_reports = app.config["ADMIN_FEED_MAX_REPORTS"]
+        socketio.start_background_task(self._flush_loop)
+
+    def subscribe(self, sid, claims):
+        with self._lock:
+            self._subscribers[sid] = claims
+            self._last_online = None  # the new tab gets the count on the next frame
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            return self._subscribers.pop(sid, None) is not None
+
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def reports_added(self, rows):
+        """rows: report dicts as written, with "id" set. Newest last."""
+        with self._lock:
+            self._reports.extend(rows)
+            overflow = len(self._reports) - self.max_reports
+            if overflow > 0:
+                del self._reports[:overflow]
+                self._reports_dropped += overflow
+
+    def reports_dropped(self, count):
+        """New reports the feed can't describe (no ids); clients reload instead."""
+        with self._lock:
+            self._reports_dropped += count
+
+    def user_changed(self, username, **fields):
+        """Records is_banned / is_muted / deleted for username; later calls win."""
+        with self._lock:
+            self._users.setdefault(username, {}).update(fields)
+
+    def user_moderated(self, user):
+        """After a committed ban/mute change to a User row."""
+        self.user_changed(user.username, is_banned=bool(user.is_banned), is_muted=bool(user.is_muted))
+
+    def _take(self):
+        with self._lock:
+            reports, self._reports = self._reports, []
+            dropped, self._reports_dropped = self._reports_dropped, 0
+            users, self._users = self._users, {}
+        return reports, dropped, users
+
+    def _report_rows(self, reports):
+        flags = get_users_by_chat_ids([r["reported_id"] for r in reports])
+        rows = []
+        for r in reversed(reports):
+            user = flags.get(r["reported_id"])
+            rows.append({
+                "id": r["id"],
+                "reporter_id": r["reporter_id"],
+                "reported_id": r["reported_id"],
+                "reason": r["reason"],
+                "timestamp": r["timestamp"].isoformat(),
+                "reported_username": user["username"] if user else None,
+                "reported_is_banned": bool(user["is_banned"]) if user else False,
+                "reported_is_muted": bool(user["is_muted"]) if user else False,
+            })
+        return rows
+
+    def flush(self):
+        """Emits what changed since the last flush. Needs an app context."""
+        reports, dropped, users = self._take()
+        if reports or dropped or users:
+            frame = {"counts": dashboard_counts()}
+            if reports:
+                frame["reports"] = self._report_rows(reports)
+            if dropped:
+                frame["reports_dropped"] = dropped
+            if users:
+                frame["users"] = users
+            self._socketio.emit("admin_feed", frame, to=ADMIN_ROOM)
+
+        if not self._subscribers:
+            return
+        self._drop_stale_subscribers()
+        local = list(self._subscribers)
+        online = self._presence.online_count()
+        if local and online != self._last_online:
+            self._last_online = online
+            self._socketio.emit("admin_feed", {"online": online}, to=local)
+
+    def _drop_stale_subscribers(self):
+        now = time.time()
+        for sid, claims in list(self._subscribers.items()):
+            if claims["exp"] > now and not is_token_revoked(None, claims):
+                continue
+            if self.unsubscribe(sid):
+                self._socketio.server.leave_room(sid, ADMIN_ROOM)
+                self._socketio.emit("admin_feed_closed", {"reason": "Token expired or revoked."}, to=sid)
+
+    def _flush_loop(self):
+        while True:
+            self._socketio.sleep(self.interval)
+            with self._app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    log.exception("Admin feed flush failed")
+
+
+admin_feed = AdminFeed()
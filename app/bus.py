@@ -0,0 +1,365 @@
+# my_flask_app/app/bus.py
+#
+# Pluggable backends that let several Socket.IO workers behave like one:
+#   - a client manager (pub/sub) so emit(..., to=sid) reaches a sid that is
+#     connected to another worker
+#   - a shared presence store so every worker can resolve chat_id -> sids
+#   - a shared chat session store so a request made on one worker can be
+#     accepted and routed on another
+#
+# SOCKETIO_BACKEND = "memory"  single process, nothing shared (default)
+# SOCKETIO_BACKEND = "sqlite"  workers on one host share a SQLite file
+#
+# A multi-host backend (e.g. Redis) only needs the same three pieces: a
+# PubSubManager subclass, a presence store with
+# bind/unbind/sids_for/is_online/online_count/is_binary/has_binary and a chat session store with the
+# methods of chat_sessions.MemoryChatSessionStore.
+
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+
+import socketio as python_socketio
+
+from .connections import socketio_options
+
+log = logging.getLogger(__name__)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+    # Switching to WAL skips the busy timeout, so workers starting at the
+    # same moment can see "database is locked" here; retry briefly.
+    for attempt in range(50):
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            break
+        except sqlite3.OperationalError:
+            if attempt == 49:
+                raise
+            time.sleep(0.1)
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SQLiteManager(python_socketio.PubSubManager):
+    """
+    Socket.IO client manager that publishes through an append-only SQLite
+    table and polls it for messages from the other workers.
+    """
+    name = "sqlite"
+
+    def __init__(self, path, channel="flask-socketio", write_only=False,
+                 logger=None, poll_interval=0.05, retention=60):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS bus_messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " channel TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_bus_messages_channel_id ON bus_messages (channel, id)"
+        )
+        # Only deliver what is published after this worker started
+        self._last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM bus_messages").fetchone()[0]
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def _publish(self, data):
+        self._conn().execute(
+            "INSERT INTO bus_messages (channel, payload, created) VALUES (?, ?, ?)",
+            (self.channel, json.dumps(data), time.time()),
+        )
+
+    def _listen(self):
+        conn = _connect(self.path)
+        next_prune = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, payload FROM bus_messages WHERE channel = ? AND id > ? ORDER BY id",
+                (self.channel, self._last_id),
+            ).fetchall()
+            for row_id, payload in rows:
+                self._last_id = row_id
+                yield payload
+
+            now = time.time()
+            if now >= next_prune:
+                conn.execute("DELETE FROM bus_messages WHERE created < ?", (now - self.retention,))
+                next_prune = now + self.retention / 2
+            if not rows:
+                self.server.sleep(self.poll_interval)
+
+
+class SQLitePresenceStore:
+    """
+    chat_id -> sids index shared by every worker that opens the same file.
+    Each worker heartbeats under its host_id; rows left behind by a worker
+    that stopped heartbeating are purged by the survivors.
+    """
+
+    def __init__(self, path, host_id, host_timeout=30):
+        self.path = path
+        self.host_id = host_id
+        self.host_timeout = host_timeout
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS presence ("
+            " sid TEXT PRIMARY KEY,"
+            " chat_id TEXT NOT NULL,"
+            " host_id TEXT NOT NULL,"
+            " wire_binary INTEGER NOT NULL DEFAULT 0)"
+        )
+        try:
+            # Bus files created before binary frames existed
+            conn.execute("ALTER TABLE presence ADD COLUMN wire_binary INTEGER NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass  # already there
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_presence_chat_id ON presence (chat_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_presence_host_id ON presence (host_id)")
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_presence_binary ON presence (wire_binary) WHERE wire_binary = 1"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS presence_hosts ("
+            " host_id TEXT PRIMARY KEY,"
+            " last_seen REAL NOT NULL)"
+        )
+        self.heartbeat()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def bind(self, sid, chat_id, binary=False):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO presence (sid, chat_id, host_id, wire_binary) VALUES (?, ?, ?, ?)",
+            (sid, chat_id, self.host_id, int(binary)),
+        )
+
+    def unbind(self, sid):
+        self._conn().execute("DELETE FROM presence WHERE sid = ?", (sid,))
+
+    def sids_for(self, chat_id):
+        rows = self._conn().execute("SELECT sid FROM presence WHERE chat_id = ?", (chat_id,))
+        return [row[0] for row in rows]
+
+    def is_online(self, chat_id):
+        row = self._conn().execute("SELECT 1 FROM presence WHERE chat_id = ? LIMIT 1", (chat_id,))
+        return row.fetchone() is not None
+
+    def is_binary(self, sid):
+        row = self._conn().execute("SELECT wire_binary FROM presence WHERE sid = ?", (sid,))
+        found = row.fetchone()
+        return bool(found and found[0])
+
+    def has_binary(self):
+        row = self._conn().execute("SELECT 1 FROM presence WHERE wire_binary = 1 LIMIT 1")
+        return row.fetchone() is not None
+
+    def online_count(self):
+        return self._conn().execute("SELECT COUNT(DISTINCT chat_id) FROM presence").fetchone()[0]
+
+    def heartbeat(self):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO presence_hosts (host_id, last_seen) VALUES (?, ?)",
+            (self.host_id, now),
+        )
+        dead = [row[0] for row in conn.execute(
+            "SELECT host_id FROM presence_hosts WHERE last_seen < ?", (now - self.host_timeout,)
+        )]
+        for host_id in dead:
+            conn.execute("DELETE FROM presence WHERE host_id = ?", (host_id,))
+            conn.execute("DELETE FROM presence_hosts WHERE host_id = ?", (host_id,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM presence WHERE host_id = ?", (self.host_id,))
+
+
+class SQLiteChatSessionStore:
+    """
+    Shared version of chat_sessions.MemoryChatSessionStore, so a request made
+    on one worker can be accepted on another and either side's worker can
+    route messages for the session.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_requests ("
+            " requester TEXT NOT NULL,"
+            " target TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (requester, target))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_requests_target ON chat_requests (target)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " a TEXT NOT NULL,"
+            " b TEXT NOT NULL,"
+            " lo TEXT NOT NULL,"   # min(a, b), max(a, b): one session per pair
+            " hi TEXT NOT NULL,"
+            " UNIQUE (lo, hi))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_sessions_a ON chat_sessions (a)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_sessions_b ON chat_sessions (b)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_contacts ("
+            " lo TEXT NOT NULL,"
+            " hi TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " PRIMARY KEY (lo, hi))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_chat_contacts_expires_at ON chat_contacts (expires_at)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def add_request(self, requester, target, expires_at):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO chat_requests (requester, target, expires_at) VALUES (?, ?, ?)",
+            (requester, target, expires_at),
+        )
+
+    def take_request(self, requester, target, now):
+        cur = self._conn().execute(
+            "DELETE FROM chat_requests WHERE requester = ? AND target = ? AND expires_at > ?",
+            (requester, target, now),
+        )
+        return cur.rowcount > 0
+
+    def create_session(self, a, b):
+        lo, hi = sorted((a, b))
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR IGNORE INTO chat_sessions (session_id, a, b, lo, hi) VALUES (?, ?, ?, ?, ?)",
+            (secrets.token_hex(8), a, b, lo, hi),
+        )
+        return self.session_between(a, b)
+
+    def add_contact(self, a, b, expires_at):
+        lo, hi = sorted((a, b))
+        conn = self._conn()
+        conn.execute("DELETE FROM chat_contacts WHERE expires_at <= ?", (time.time(),))
+        conn.execute(
+            "INSERT OR REPLACE INTO chat_contacts (lo, hi, expires_at) VALUES (?, ?, ?)",
+            (lo, hi, expires_at),
+        )
+
+    def is_contact(self, a, b, now):
+        lo, hi = sorted((a, b))
+        row = self._conn().execute(
+            "SELECT 1 FROM chat_contacts WHERE lo = ? AND hi = ? AND expires_at > ?", (lo, hi, now)
+        ).fetchone()
+        return row is not None
+
+    def drop_contact(self, a, b):
+        lo, hi = sorted((a, b))
+        self._conn().execute("DELETE FROM chat_contacts WHERE lo = ? AND hi = ?", (lo, hi))
+
+    def get(self, session_id):
+        row = self._conn().execute(
+            "SELECT a, b FROM chat_sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return tuple(row) if row else None
+
+    def session_between(self, a, b):
+        lo, hi = sorted((a, b))
+        row = self._conn().execute(
+            "SELECT session_id FROM chat_sessions WHERE lo = ? AND hi = ?", (lo, hi)
+        ).fetchone()
+        return row[0] if row else None
+
+    def remove(self, session_id):
+        pair = self.get(session_id)
+        if pair is not None:
+            self._conn().execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+        return pair
+
+    def sessions_for(self, chat_id):
+        rows = self._conn().execute(
+            "SELECT session_id FROM chat_sessions WHERE a = ? UNION ALL "
+            "SELECT session_id FROM chat_sessions WHERE b = ?", (chat_id, chat_id)
+        )
+        return [row[0] for row in rows]
+
+    def forget(self, chat_id):
+        conn = self._conn()
+        conn.execute("DELETE FROM chat_requests WHERE requester = ? OR target = ?", (chat_id, chat_id))
+        rows = conn.execute(
+            "SELECT session_id, a, b FROM chat_sessions WHERE a = ? UNION ALL "
+            "SELECT session_id, a, b FROM chat_sessions WHERE b = ?", (chat_id, chat_id)
+        ).fetchall()
+        ended = []
+        for session_id, a, b in rows:
+            conn.execute("DELETE FROM chat_sessions WHERE session_id = ?", (session_id,))
+            ended.append((session_id, b if a == chat_id else a))
+        return ended
+
+    def counts(self):
+        conn = self._conn()
+        return (conn.execute("SELECT COUNT(*) FROM chat_requests").fetchone()[0],
+                conn.execute("SELECT COUNT(*) FROM chat_sessions").fetchone()[0])
+
+    def clear(self):
+        conn = self._conn()
+        conn.execute("DELETE FROM chat_requests")
+        conn.execute("DELETE FROM chat_sessions")
+        conn.execute("DELETE FROM chat_contacts")
+
+
+def init_socket_backend(app, socketio, presence, chat_sessions):
+    """Initializes socketio, presence and chat sessions with the backend chosen in config."""
+    backend = app.config["SOCKETIO_BACKEND"]
+    chat_sessions.request_ttl = app.config["CHAT_REQUEST_TTL"]
+    chat_sessions.contact_ttl = app.config["CHAT_CONTACT_TTL"]
+    options = socketio_options(app)  # heartbeat and buffer limits
+
+    if backend == "memory":
+        socketio.init_app(app, client_manager=None, **options)
+        presence.store = None
+        chat_sessions.store = None
+    elif backend == "sqlite":
+        path = app.config["SOCKETIO_BACKEND_PATH"]
+        manager = SQLiteManager(path, poll_interval=app.config["SOCKETIO_BUS_POLL_INTERVAL"])
+        socketio.init_app(app, client_manager=manager, **options)
+        presence.store = SQLitePresenceStore(path, manager.host_id)
+        chat_sessions.store = SQLiteChatSessionStore(path)
+        socketio.start_background_task(_heartbeat_loop, socketio, presence.store)
+    else:
+        raise ValueError(f"Unknown SOCKETIO_BACKEND: {backend!r}")
+
+
+def _heartbeat_loop(socketio, store):
+    interval = store.host_timeout / 3
+    while True:
+        socketio.sleep(interval)
+        try:
+            store.heartbeat()
+        except sqlite3.Error:
+            log.exception("Presence heartbeat failed")
@@ -0,0 +1,221 @@
+# my_flask_app/app/chat_sessions.py
+
+import secrets
+import threading
+import time
+
+
+def room_for(session_id):
+    """Socket.IO room holding every socket of both users in a chat session."""
+    return f"chat:{session_id}"
+
+
+def binary_room_for(session_id):
+    """Same, for the sockets that asked for binary private_message frames."""
+    return f"chat:{session_id}:bin"
+
+
+class MemoryChatSessionStore:
+    """
+    Chat requests and accepted pairs for a single worker. Every operation is
+    a dict/set lookup:
+      (requester, target) -> expires_at      pending requests
+      session_id -> (chat_id, chat_id)       accepted pairs
+      chat_id -> {session_id, ...}           for cleanup on disconnect
+      frozenset(pair) -> session_id          one session per pair
+      frozenset(pair) -> expires_at          pairs that have had a chat
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._requests_by_chat_id = {}
+        self._sessions = {}
+        self._sessions_by_chat_id = {}
+        self._session_by_pair = {}
+        self._contacts = {}
+        self._next_contact_sweep = 1000
+
+    def add_request(self, requester, target, expires_at):
+        with self._lock:
+            key = (requester, target)
+            self._requests[key] = expires_at
+            self._requests_by_chat_id.setdefault(requester, set()).add(key)
+            self._requests_by_chat_id.setdefault(target, set()).add(key)
+
+    def take_request(self, requester, target, now):
+        with self._lock:
+            expires_at = self._drop_request((requester, target))
+            return expires_at is not None and expires_at > now
+
+    def _drop_request(self, key):
+        # Caller holds the lock
+        expires_at = self._requests.pop(key, None)
+        for chat_id in key:
+            keys = self._requests_by_chat_id.get(chat_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._requests_by_chat_id[chat_id]
+        return expires_at
+
+    def create_session(self, a, b):
+        with self._lock:
+            pair = frozenset((a, b))
+            session_id = self._session_by_pair.get(pair)
+            if session_id is None:
+                session_id = secrets.token_hex(8)
+                self._sessions[session_id] = (a, b)
+                self._session_by_pair[pair] = session_id
+                self._sessions_by_chat_id.setdefault(a, set()).add(session_id)
+                self._sessions_by_chat_id.setdefault(b, set()).add(session_id)
+            return session_id
+
+    def add_contact(self, a, b, expires_at):
+        with self._lock:
+            self._contacts[frozenset((a, b))] = expires_at
+            if len(self._contacts) >= self._next_contact_sweep:
+                now = time.time()
+                for pair in [p for p, exp in self._contacts.items() if exp <= now]:
+                    del self._contacts[pair]
+                self._next_contact_sweep = len(self._contacts) * 2 + 1000
+
+    def is_contact(self, a, b, now):
+        return self._contacts.get(frozenset((a, b)), 0) > now
+
+    def drop_contact(self, a, b):
+        with self._lock:
+            self._contacts.pop(frozenset((a, b)), None)
+
+    def get(self, session_id):
+        return self._sessions.get(session_id)
+
+    def session_between(self, a, b):
+        return self._session_by_pair.get(frozenset((a, b)))
+
+    def remove(self, session_id):
+        with self._lock:
+            return self._remove(session_id)
+
+    def _remove(self, session_id):
+        # Caller holds the lock
+        pair = self._sessions.pop(session_id, None)
+        if pair is None:
+            return None
+        self._session_by_pair.pop(frozenset(pair), None)
+        for chat_id in pair:
+            ids = self._sessions_by_chat_id.get(chat_id)
+            if ids is not None:
+                ids.discard(session_id)
+                if not ids:
+                    del self._sessions_by_chat_id[chat_id]
+        return pair
+
+    def sessions_for(self, chat_id):
+        return list(self._sessions_by_chat_id.get(chat_id, ()))
+
+    def forget(self, chat_id):
+        """Drops chat_id's requests and sessions; returns [(session_id, partner)]."""
+        with self._lock:
+            for key in list(self._requests_by_chat_id.get(chat_id, ())):
+                self._drop_request(key)
+            ended = []
+            for session_id in list(self._sessions_by_chat_id.get(chat_id, ())):
+                a, b = self._remove(session_id)
+                ended.append((session_id, b if a == chat_id else a))
+            return ended
+
+    def counts(self):
+        return len(self._requests), len(self._sessions)
+
+    def clear(self):
+        with self._lock:
+            self._requests.clear()
+            self._requests_by_chat_id.clear()
+            self._sessions.clear()
+            self._sessions_by_chat_id.clear()
+            self._session_by_pair.clear()
+            self._contacts.clear()
+
+
+class ChatSessionTable:
+    """
+    Server-side pairing state for private chats.
+
+    message_request records a pending request; request_response can only
+    accept a request that was actually made and hasn't expired; the accepted
+    pair gets a session_id and a Socket.IO room. private_message then names
+    the session, and the server checks the sender belongs to it instead of
+    trusting a client-supplied recipient. Everything a user is part of is
+    dropped when their last socket disconnects.
+
+    The pair is also remembered as contacts for contact_ttl seconds, unless
+    one of them ends the chat. Only contacts can leave each other messages
+    while the other is offline.
+
+    State lives in an in-process store by default. With several workers,
+    init_socket_backend attaches a shared store (see app/bus.py) with the same
+    methods.
+    """
+
+    def __init__(self, request_ttl=120, contact_ttl=7 * 86400, store=None):
+        self.request_ttl = request_ttl
+        self.contact_ttl = contact_ttl
+        self.store = store
+        self._memory = MemoryChatSessionStore()
+
+    @property
+    def _backend(self):
+        return self.store if self.store is not None else self._memory
+
+    def request(self, requester, target):
+        self._backend.add_request(requester, target, time.time() + self.request_ttl)
+
+    def decline(self, requester, target):
+        return self._backend.take_request(requester, target, time.time())
+
+    def accept(self, requester, responder):
+        """Returns the new session_id, or None if there was no live request."""
+        now = time.time()
+        if not self._backend.take_request(requester, responder, now):
+            return None
+        self._backend.add_contact(requester, responder, now + self.contact_ttl)
+        return self._backend.create_session(requester, responder)
+
+    def partner(self, session_id, chat_id):
+        """The other member of session_id, or None if chat_id isn't in it."""
+        pair = self._backend.get(session_id) if session_id else None
+        if pair is None or chat_id not in pair:
+            return None
+        return pair[1] if pair[0] == chat_id else pair[0]
+
+    def session_between(self, a, b):
+        return self._backend.session_between(a, b)
+
+    def are_contacts(self, a, b):
+        """True if a and b accepted a chat within contact_ttl and neither ended it."""
+        return self._backend.is_contact(a, b, time.time())
+
+    def drop_contact(self, a, b):
+        self._backend.drop_contact(a, b)
+
+    def end(self, session_id):
+        """Ends the chat on purpose, which also ends the pair's contact."""
+        pair = self._backend.remove(session_id)
+        if pair is not None:
+            self._backend.drop_contact(*pair)
+        return pair
+
+    def sessions_for(self, chat_id):
+        return self._backend.sessions_for(chat_id)
+
+    def went_offline(self, chat_id):
+        """Ends everything chat_id was part of; returns [(session_id, partner)]."""
+        return self._backend.forget(chat_id)
+
+    def counts(self):
+        """(pending requests, active sessions)"""
+        return self._backend.counts()
+
+    def clear(self):
+        self._backend.clear()
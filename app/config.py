@@ -3,6 +3,9 @@
 import os
 from datetime import timedelta
 
+# "production" unless told otherwise; run.py sets "development"
+APP_ENV = os.environ.get("APP_ENV", "production")
+
 class Config:
     SECRET_KEY = os.environ.get("SECRET_KEY", "dev-secret-key")
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "supersecret")
@@ -13,9 +16,136 @@ class Config:
     CORS_HEADERS = "Content-Type"
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "sqlite:///users.db")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        "pool_pre_ping": True,   # Checks connection before using it
-        "pool_recycle": 299,     # Recycle connections at just under 5 minutes
+    # Connection pool (see app/db.py). pool_recycle already retires connections
+    # before typical server idle timeouts, so the extra round trip per
+    # checkout that pool_pre_ping costs is opt-in.
+    DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10 if APP_ENV == "production" else 5))
+    DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20 if APP_ENV == "production" else 5))
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 5))   # seconds to wait for a connection
+    DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 299))   # just under 5 minutes
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "0") == "1"
+    # Per-process cache of ban/mute flags used by the socket message path
+    MODERATION_CACHE_SIZE = int(os.environ.get("MODERATION_CACHE_SIZE", 10000))
+    MODERATION_CACHE_TTL = float(os.environ.get("MODERATION_CACHE_TTL", 30))
+    # Verified JWTs (see app/tokens.py); entries also expire with their token
+    TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+    TOKEN_CACHE_TTL = float(os.environ.get("TOKEN_CACHE_TTL", 300))
+    # Presence/pub-sub backend shared by Socket.IO workers (see app/bus.py):
+    # "memory" for a single worker, "sqlite" for several workers on one host
+    SOCKETIO_BACKEND = os.environ.get("SOCKETIO_BACKEND", "memory")
+    SOCKETIO_BACKEND_PATH = os.environ.get("SOCKETIO_BACKEND_PATH", "socketio_bus.db")
+    SOCKETIO_BUS_POLL_INTERVAL = float(os.environ.get("SOCKETIO_BUS_POLL_INTERVAL", 0.05))
+    # Seconds a chat request can wait for an answer (see app/chat_sessions.py)
+    CHAT_REQUEST_TTL = 120
+    # Seconds two users who accepted a chat may still leave each other offline
+    # messages, unless one of them ended it
+    CHAT_CONTACT_TTL = 7 * 86400
+    # Revoked refresh tokens (see app/revocation.py)
+    REVOCATION_SYNC_INTERVAL = float(os.environ.get("REVOCATION_SYNC_INTERVAL", 2))
+    REVOCATION_PURGE_INTERVAL = float(os.environ.get("REVOCATION_PURGE_INTERVAL", 3600))
+    # Ids re-read on every sync, and a full reload every so often, for rows
+    # that commit out of id order (concurrent writers on Postgres/MySQL)
+    REVOCATION_SYNC_OVERLAP = int(os.environ.get("REVOCATION_SYNC_OVERLAP", 1000))
+    REVOCATION_REBUILD_INTERVAL = float(os.environ.get("REVOCATION_REBUILD_INTERVAL", 600))
+    REVOCATION_BLOOM_CAPACITY = int(os.environ.get("REVOCATION_BLOOM_CAPACITY", 100000))
+    REVOCATION_BLOOM_ERROR_RATE = float(os.environ.get("REVOCATION_BLOOM_ERROR_RATE", 0.001))
+    # /all_users page size (default and upper bound for ?limit=)
+    USERS_PAGE_SIZE = 100
+    USERS_PAGE_SIZE_MAX = 500
+    # Max chat_ids per /users/lookup request
+    USER_LOOKUP_MAX = 200
+    # Max actions per /moderation/bulk request
+    MODERATION_BULK_MAX = 500
+    # /all_reports page size (default and upper bound for ?limit=)
+    REPORTS_PAGE_SIZE = 50
+    REPORTS_PAGE_SIZE_MAX = 200
+    # Admin dashboard snapshot (see app/dashboard.py); changes made by other
+    # workers show up after at most this many seconds
+    DASHBOARD_CACHE_TTL = 10
+    # Admin socket feed (see app/admin_feed.py): changes are batched into one
+    # frame per interval; beyond this many new reports admins reload instead
+    ADMIN_FEED_INTERVAL = 1.0
+    ADMIN_FEED_MAX_REPORTS = 50
+    # Password hashing (see app/passwords.py). The method must be the full
+    # werkzeug form so outdated hashes can be detected and upgraded on login.
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 4))
+    PASSWORD_HASH_OFFLOAD = True
+    # Longest private_message accepted, in characters
+    MESSAGE_MAX_LENGTH = int(os.environ.get("MESSAGE_MAX_LENGTH", 4000))
+    # Offline mailbox (see app/mailbox.py)
+    MAILBOX_MAX_PER_RECIPIENT = int(os.environ.get("MAILBOX_MAX_PER_RECIPIENT", 100))
+    MAILBOX_MAX_AGE = timedelta(days=int(os.environ.get("MAILBOX_MAX_AGE_DAYS", 7)))
+    MAILBOX_FLUSH_INTERVAL = 0.5   # seconds between write-behind flushes
+    MAILBOX_BATCH_SIZE = 500       # flush early once this many are buffered
+    # Report ingestion (see app/report_queue.py)
+    REPORT_QUEUE_MAX = int(os.environ.get("REPORT_QUEUE_MAX", 1000))
+    REPORT_BATCH_SIZE = 200
+    REPORT_FLUSH_INTERVAL = 0.25
+    REPORT_CHAT_LOG_COMPRESS_MIN = 1024  # bytes; smaller logs are stored as-is
+    REPORT_REASON_MAX_LENGTH = 1000       # characters
+    REPORT_CHAT_LOG_MAX_LENGTH = 200_000  # characters, for clients that send their own copy
+    # Optional server-side message history (see app/history.py). Segments are
+    # rolled at least daily, so keep HISTORY_RETENTION above a day.
+    HISTORY_ENABLED = os.environ.get("HISTORY_ENABLED", "0") == "1"
+    HISTORY_DIR = os.environ.get("HISTORY_DIR", "history")
+    HISTORY_SEGMENT_BYTES = 64 * 1024 * 1024
+    HISTORY_SEGMENT_MAX_AGE = timedelta(days=1)
+    HISTORY_RETENTION = timedelta(days=int(os.environ.get("HISTORY_RETENTION_DAYS", 30)))
+    HISTORY_COMPACT_INTERVAL = 3600       # seconds between retention sweeps
+    HISTORY_REPORT_MAX_RECORDS = 200      # messages a report points at
+    HISTORY_INDEX_MAX_PER_PAIR = 1000     # newest entries per pair kept in memory
+    HISTORY_CATCH_UP_BYTES = 1024 * 1024  # most segment bytes one read indexes
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_PAGE_SIZE_MAX = 200
+    # Socket event rate limits: {event: (tokens per second, burst)}, applied per
+    # connection and per chat_id. Events not listed are unlimited.
+    SOCKET_RATE_LIMITS = {
+        "identify": (1, 5),
+        "private_message": (5, 20),
+        "message_request": (0.5, 5),
+        "request_response": (1, 5),
+        "chat_ended_notice": (1, 5),
+        "report_user": (0.2, 3),
+        "admin_subscribe": (0.2, 3),
+    }
+    # Disconnect a socket after this many rejected events (0 = never)
+    SOCKET_RATE_LIMIT_DISCONNECT_AFTER = int(os.environ.get("SOCKET_RATE_LIMIT_DISCONNECT_AFTER", 50))
+    # Connection lifecycle (see app/connections.py). Engine.IO pings find dead
+    # transports; the sweeper closes sockets that never identify or, if
+    # SOCKET_IDLE_TIMEOUT is set, that send nothing for that long.
+    SOCKET_PING_INTERVAL = float(os.environ.get("SOCKET_PING_INTERVAL", 25))
+    SOCKET_PING_TIMEOUT = float(os.environ.get("SOCKET_PING_TIMEOUT", 20))
+    SOCKET_MAX_MESSAGE_BYTES = int(os.environ.get("SOCKET_MAX_MESSAGE_BYTES", 1_000_000))
+    SOCKET_IDENTIFY_TIMEOUT = float(os.environ.get("SOCKET_IDENTIFY_TIMEOUT", 30))
+    SOCKET_IDLE_TIMEOUT = float(os.environ.get("SOCKET_IDLE_TIMEOUT", 0))  # seconds, 0 = never
+    SOCKET_SWEEP_INTERVAL = float(os.environ.get("SOCKET_SWEEP_INTERVAL", 30))
+    SOCKET_MAX_PER_USER = int(os.environ.get("SOCKET_MAX_PER_USER", 10))  # 0 = unlimited
+    # Sockets per worker: SOCKET_MAX_CONNECTIONS if set, otherwise the memory
+    # budget divided by the per-connection footprint. `python -m
+    # benchmarks.connections` measured ~80 KiB per identified websocket on
+    # eventlet; the default leaves some headroom (~10900 sockets per GiB).
+    SOCKET_MAX_CONNECTIONS = int(os.environ.get("SOCKET_MAX_CONNECTIONS", 0))
+    SOCKET_MEMORY_BUDGET_MB = int(os.environ.get("SOCKET_MEMORY_BUDGET_MB", 1024))
+    SOCKET_CONNECTION_BYTES = int(os.environ.get("SOCKET_CONNECTION_BYTES", 96 * 1024))
+    # Prometheus-style counters/histograms served at /metrics (see app/metrics.py).
+    # If METRICS_TOKEN is set, scrapes must send "Authorization: Bearer <token>";
+    # without one only scrapes from localhost are answered, unless
+    # METRICS_PUBLIC=1 opens the endpoint to everyone.
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") != "0"
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+    METRICS_PUBLIC = os.environ.get("METRICS_PUBLIC", "0") == "1"
+    # JSON logs written by a background thread (see app/logs.py)
+    LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG" if APP_ENV == "development" else "INFO")
+    LOG_QUEUE_MAX = 10000  # records beyond this are dropped, not waited on
+    # Fraction of these high-frequency events that get logged; others always are
+    LOG_SAMPLE_RATES = {} if APP_ENV == "development" else {
+        "socket.connect": 0.01,
+        "socket.identify": 0.05,
+        "socket.offline": 0.05,
+        "socket.recipient_unknown": 0.01,
+        "socket.muted_message": 0.1,
+        "socket.chat_ended": 0.05,
     }
 
 class ProductionConfig(Config):
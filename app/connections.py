@@ -0,0 +1,137 @@
+# my_flask_app/app/connections.py
+
+import logging
+import threading
+import time
+
+from .logs import log_event
+from .metrics import socket_connections_reaped
+
+log = logging.getLogger(__name__)
+
+
+def socketio_options(app):
+    """Engine.IO heartbeat and buffer settings for socketio.init_app()."""
+    return {
+        "ping_interval": app.config["SOCKET_PING_INTERVAL"],
+        "ping_timeout": app.config["SOCKET_PING_TIMEOUT"],
+        "max_http_buffer_size": app.config["SOCKET_MAX_MESSAGE_BYTES"],
+    }
+
+
+class ConnectionManager:
+    """
+    Keeps this worker's Socket.IO footprint bounded.
+
+    Engine.IO pings (SOCKET_PING_INTERVAL / SOCKET_PING_TIMEOUT) drop dead
+    transports. On top of that:
+      - a worker accepts at most max_connections sockets: SOCKET_MAX_CONNECTIONS,
+        or SOCKET_MEMORY_BUDGET_MB divided by SOCKET_CONNECTION_BYTES (the
+        per-connection footprint measured by benchmarks/connections.py)
+      - a user may have at most SOCKET_MAX_PER_USER identified sockets,
+        counted across workers when presence is shared
+      - every SOCKET_SWEEP_INTERVAL a sweeper disconnects sockets that haven't
+        identified within SOCKET_IDENTIFY_TIMEOUT, and sockets with no events
+        for SOCKET_IDLE_TIMEOUT (0 = never). Sids the server no longer knows
+        (a disconnect handler that never ran) are handed to on_stale so every
+        per-sid structure is cleaned up.
+
+    Per socket this only stores two timestamps, dropped in forget().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._connected_at = {}  # sid -> monotonic time of connect
+        self._last_seen = {}     # sid -> monotonic time of the last event
+        self._socketio = None
+        self._presence = None
+        self._on_stale = None
+        self.max_connections = 0  # 0 = unlimited
+        self.max_per_user = 0
+        self.identify_timeout = 30.0
+        self.idle_timeout = 0.0
+        self.sweep_interval = 30.0
+
+    def init_app(self, app, socketio, presence, on_stale):
+        self._socketio = socketio
+        self._presence = presence
+        self._on_stale = on_stale
+        self.max_connections = app.config["SOCKET_MAX_CONNECTIONS"] or int(
+            app.config["SOCKET_MEMORY_BUDGET_MB"] * 1024 * 1024 // app.config["SOCKET_CONNECTION_BYTES"]
+        )
+        self.max_per_user = app.config["SOCKET_MAX_PER_USER"]
+        self.identify_timeout = app.config["SOCKET_IDENTIFY_TIMEOUT"]
+        self.idle_timeout = app.config["SOCKET_IDLE_TIMEOUT"]
+        self.sweep_interval = app.config["SOCKET_SWEEP_INTERVAL"]
+        self.clear()
+        socketio.start_background_task(self._sweep_loop)
+
+    def admit(self, sid):
+        """Records a new socket; False if the worker is already at max_connections."""
+        now = time.monotonic()
+        with self._lock:
+            if self.max_connections and len(self._connected_at) >= self.max_connections:
+                return False
+            self._connected_at[sid] = now
+            self._last_seen[sid] = now
+        return True
+
+    def user_has_room(self, open_sockets):
+        """False if a user with open_sockets identified sockets may not open another."""
+        return not self.max_per_user or open_sockets < self.max_per_user
+
+    def touch(self, sid):
+        if sid in self._last_seen:  # never re-adds a forgotten sid
+            self._last_seen[sid] = time.monotonic()
+
+    def forget(self, sid):
+        with self._lock:
+            self._connected_at.pop(sid, None)
+            self._last_seen.pop(sid, None)
+
+    def count(self):
+        return len(self._connected_at)
+
+    def clear(self):
+        with self._lock:
+            self._connected_at.clear()
+            self._last_seen.clear()
+
+    def sweep(self, now=None):
+        """One sweeper pass. Returns {"stale": n, "unidentified": n, "idle": n}."""
+        now = time.monotonic() if now is None else now
+        manager = self._socketio.server.manager
+        with self._lock:
+            sockets = [(sid, at, self._last_seen.get(sid, at)) for sid, at in self._connected_at.items()]
+        reaped = {"stale": 0, "unidentified": 0, "idle": 0}
+        for sid, connected_at, last_seen in sockets:
+            if not manager.is_connected(sid, "/"):
+                reason = "stale"
+            elif self._presence.chat_id_for(sid) is None and now - connected_at > self.identify_timeout:
+                reason = "unidentified"
+            elif self.idle_timeout and now - last_seen > self.idle_timeout:
+                reason = "idle"
+            else:
+                continue
+            reaped[reason] += 1
+            socket_connections_reaped.inc(reason)
+            if reason == "stale":
+                self._on_stale(sid)
+            else:
+                self._socketio.emit("error", {"error": "Connection closed after inactivity."}, to=sid)
+                self._socketio.server.disconnect(sid)  # the disconnect handler cleans up
+            self.forget(sid)
+        if any(reaped.values()):
+            log_event(log, logging.INFO, "socket.sweep", **reaped)
+        return reaped
+
+    def _sweep_loop(self):
+        while True:
+            self._socketio.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception:
+                log.exception("Connection sweep failed")
+
+
+connection_manager = ConnectionManager()
@@ -0,0 +1,92 @@
+# my_flask_app/app/dashboard.py
+
+import hashlib
+import json
+import threading
+import time
+
+from sqlalchemy import case, func, select
+
+from .db import db
+from .models import Report, User
+
+
+class DashboardCache:
+    """
+    The admin dashboard snapshot (user/report counts plus the first page of
+    reports), built once and reused until something it shows changes.
+
+    Moderation routes, registration and report ingestion call invalidate(),
+    which bumps a version; a snapshot built at an older version is rebuilt
+    on the next request. Changes made by other workers are picked up when
+    the snapshot is DASHBOARD_CACHE_TTL seconds old.
+
+    etag is a digest of the snapshot, so after a rebuild that found nothing
+    new, clients still get 304s. Only one request builds at a time; the
+    others wait for it and reuse its snapshot.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self.version = 0
+        self.ttl = 10
+        self._snapshot = None  # (version, built_at, data, etag)
+
+    def init_app(self, app):
+        self.ttl = app.config["DASHBOARD_CACHE_TTL"]
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+
+    def _fresh(self):
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot[0] == self.version and time.monotonic() - snapshot[1] < self.ttl:
+            return snapshot
+        return None
+
+    def get(self, build):
+        """(data, etag) for the current snapshot, calling build() if it's stale."""
+        snapshot = self._fresh()
+        if snapshot is None:
+            with self._build_lock:
+                # Whoever held the lock may have just rebuilt it
+                snapshot = self._fresh()
+                if snapshot is None:
+                    # Read the version first: a bump while build() runs leaves this snapshot stale
+                    version = self.version
+                    now = time.monotonic()
+                    data = build()
+                    etag = hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+                    snapshot = self._snapshot = (version, now, data, etag)
+        return snapshot[2], snapshot[3]
+
+
+def dashboard_counts():
+    """Users, banned, muted, reports, and open reports (against users who aren't banned), in two queries."""
+    users, banned, muted = db.session.execute(
+        select(
+            func.count(User.id),
+            func.coalesce(func.sum(case((User.is_banned.is_(True), 1), else_=0)), 0),
+            func.coalesce(func.sum(case((User.is_muted.is_(True), 1), else_=0)), 0),
+        )
+    ).one()
+    reports, open_reports = db.session.execute(
+        select(
+            func.count(Report.id),
+            # Reports against deleted (no row) or banned users need no action
+            func.coalesce(func.sum(case((User.id.is_(None), 0), (User.is_banned.is_(True), 0), else_=1)), 0),
+        ).select_from(Report).outerjoin(User, User.chat_id == Report.reported_id)
+    ).one()
+    return {
+        "users": users,
+        "banned": int(banned),
+        "muted": int(muted),
+        "reports": reports,
+        "open_reports": int(open_reports),
+    }
+
+
+dashboard_cache = DashboardCache()
@@ -1,6 +1,100 @@
 # my_flask_app/app/db.py
 
+import time
+from functools import wraps
+
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
 
 # Create SQLAlchemy DB instance (singleton)
 db = SQLAlchemy()
+
+# fn(wait_seconds, timed_out) callbacks, run after every pool checkout
+_checkout_observers = []
+
+
+def observe_checkouts(fn):
+    """Registers fn(wait_seconds, timed_out) to hear about every checkout."""
+    if fn not in _checkout_observers:
+        _checkout_observers.append(fn)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool that reports how long each checkout waited for a free
+    connection, and checkouts that gave up after pool_timeout. Waits that
+    climb towards pool_timeout mean the pool is too small for the load.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            for observer in _checkout_observers:
+                observer(time.perf_counter() - start, True)
+            raise
+        for observer in _checkout_observers:
+            observer(time.perf_counter() - start, False)
+        return conn
+
+
+def engine_options(config):
+    """
+    Pool settings from the DB_POOL_* config keys. In-memory SQLite keeps
+    Flask-SQLAlchemy's single shared connection, so there is nothing to size.
+    """
+    options = {
+        "pool_pre_ping": config["DB_POOL_PRE_PING"],
+        "pool_recycle": config["DB_POOL_RECYCLE"],
+    }
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options
+    options.update(
+        poolclass=InstrumentedQueuePool,
+        pool_size=config["DB_POOL_SIZE"],
+        max_overflow=config["DB_MAX_OVERFLOW"],
+        pool_timeout=config["DB_POOL_TIMEOUT"],
+    )
+    return options
+
+
+def init_db(app):
+    # Anything set explicitly in SQLALCHEMY_ENGINE_OPTIONS still wins
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        **engine_options(app.config),
+        **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+    }
+    db.init_app(app)
+
+
+def pool_status(engine):
+    """
+    (checked out, capacity) for engines using a QueuePool, else None.
+    Capacity is None when max_overflow is unlimited (-1).
+    """
+    pool = engine.pool
+    if not isinstance(pool, QueuePool):
+        return None
+    max_overflow = pool._max_overflow
+    return pool.checkedout(), (pool.size() + max_overflow if max_overflow >= 0 else None)
+
+
+def released_session(fn):
+    """
+    For Socket.IO handlers: removes the scoped session when the event ends,
+    so the connection goes back to the pool as soon as the handler returns
+    (or raises) rather than whenever the context is torn down. Sessions are
+    scoped to the app context Flask-SocketIO pushes per event, so two events
+    on different green threads never share one.
+    """
+    @wraps(fn)
+    def decorator(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            db.session.remove()
+    return decorator
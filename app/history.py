@@ -0,0 +1,448 @@
+# my_flask_app/app/history.py
+
+import bisect
+import heapq
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from sqlalchemy import select, update
+
+from .db import db
+from .models import Report
+from .report_queue import encode_chat_log
+
+log = logging.getLogger(__name__)
+
+# crc32(body):u32  body_len:u32 | body = timestamp:f64  pair_len:u8 pair  sender_len:u8 sender  message:utf-8
+_RECORD = struct.Struct(">II")
+_BODY = struct.Struct(">dB")
+_SUFFIX = ".seg"
+
+
+def pair_key(a, b):
+    """Order-independent key for the conversation between two chat_ids."""
+    return f"{a}:{b}" if a <= b else f"{b}:{a}"
+
+
+def encode_record(timestamp, pair, sender, message):
+    pair_raw = pair.encode("utf-8")
+    sender_raw = sender.encode("utf-8")
+    body = (_BODY.pack(timestamp, len(pair_raw)) + pair_raw
+            + bytes((len(sender_raw),)) + sender_raw + message.encode("utf-8"))
+    return _RECORD.pack(zlib.crc32(body), len(body)) + body
+
+
+def _decode_body(body):
+    """(timestamp, pair, sender, message) from a record body."""
+    timestamp, pair_len = _BODY.unpack_from(body)
+    pos = _BODY.size
+    pair = bytes(body[pos:pos + pair_len]).decode("utf-8")
+    pos += pair_len
+    sender_len = body[pos]
+    pos += 1
+    sender = bytes(body[pos:pos + sender_len]).decode("utf-8")
+    pos += sender_len
+    return timestamp, pair, sender, bytes(body[pos:]).decode("utf-8")
+
+
+def parse_ref(ref):
+    """"segment:start-end,..." -> [(segment, start, end)]"""
+    ranges = []
+    for part in ref.split(","):
+        segment, _, span = part.rpartition(":")
+        start, _, end = span.partition("-")
+        ranges.append((segment, int(start), int(end)))
+    return ranges
+
+
+class MessageHistory:
+    """
+    Optional server-side log of relayed private messages (HISTORY_ENABLED).
+
+    Each worker appends length-prefixed, checksummed records to its own
+    segment files in HISTORY_DIR and rolls to a new one at
+    HISTORY_SEGMENT_BYTES or HISTORY_SEGMENT_MAX_AGE, so appending is one
+    write() and workers never share a file.
+
+    Reads go through mmap. The per-pair index
+    (pair -> [(timestamp, segment, offset), ...]) is a cache of the segments:
+    before every read it scans whatever bytes were appended since the last
+    read, by this worker or any other, so writes never touch it. It keeps
+    only the newest HISTORY_INDEX_MAX_PER_PAIR entries of each pair; pages
+    older than that are found by scanning the segments. One read scans at
+    most HISTORY_CATCH_UP_BYTES, so a cold index (a fresh worker with 30
+    days of segments) is built by a background task a chunk at a time,
+    never inside a socket handler; until it is, ref_for() returns None and
+    page() returns None.
+
+    Reports store a byte range (history_ref) instead of a copy of the chat.
+    Segments older than HISTORY_RETENTION are deleted by a background task;
+    before a segment goes, reports that still point into it get their slice
+    copied into chat_log.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.directory = None
+        self.segment_bytes = 64 * 1024 * 1024
+        self.segment_max_age = 86400
+        self.retention = 30 * 86400
+        self.report_max_records = 200
+        self.index_max_per_pair = 1000
+        self.catch_up_bytes = 1024 * 1024
+        self._app = None
+        self._write_lock = threading.Lock()
+        self._fd = None
+        self._segment = None
+        self._segment_size = 0
+        self._segment_started = 0.0
+        # Read side, all under _read_lock
+        self._read_lock = threading.Lock()
+        self._index = {}          # pair -> sorted [(timestamp, segment, offset)], newest only
+        self._trimmed = set()     # pairs with older entries left out of the index
+        self._scanned = {}        # segment -> bytes indexed so far
+        self._maps = {}           # segment -> (mmap, mapped size)
+        self.records = 0
+
+    def init_app(self, app, socketio):
+        self._app = app
+        self.enabled = app.config["HISTORY_ENABLED"]
+        self.directory = app.config["HISTORY_DIR"]
+        self.segment_bytes = app.config["HISTORY_SEGMENT_BYTES"]
+        self.segment_max_age = app.config["HISTORY_SEGMENT_MAX_AGE"].total_seconds()
+        self.retention = app.config["HISTORY_RETENTION"].total_seconds()
+        self.report_max_records = app.config["HISTORY_REPORT_MAX_RECORDS"]
+        # Reports need their last records in the index
+        self.index_max_per_pair = max(app.config["HISTORY_INDEX_MAX_PER_PAIR"], self.report_max_records)
+        self.catch_up_bytes = app.config["HISTORY_CATCH_UP_BYTES"]
+        if not self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        socketio.start_background_task(self._warm_up, socketio)
+        socketio.start_background_task(self._compact_loop, socketio,
+                                       app.config["HISTORY_COMPACT_INTERVAL"])
+
+    # --- writing ---
+
+    def append(self, sender, recipient, message):
+        """Records one relayed message. Cheap enough for the socket handler."""
+        if not self.enabled or not isinstance(message, str):
+            return
+        record = encode_record(time.time(), pair_key(sender, recipient), sender, message)
+        with self._write_lock:
+            if (self._fd is None or self._segment_size >= self.segment_bytes
+                    or time.time() - self._segment_started >= self.segment_max_age):
+                self._roll()
+            os.write(self._fd, record)
+            self._segment_size += len(record)
+
+    def _roll(self):
+        # Caller holds _write_lock. Names sort by creation time.
+        if self._fd is not None:
+            os.close(self._fd)
+        self._segment_started = time.time()
+        self._segment = f"{int(self._segment_started * 1000):013d}-{os.getpid()}{_SUFFIX}"
+        self._fd = os.open(os.path.join(self.directory, self._segment),
+                           os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        self._segment_size = 0
+
+    def close(self):
+        with self._write_lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+        with self._read_lock:
+            for mapped, _ in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    # --- reading ---
+
+    def _segments(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name for name in names if name.endswith(_SUFFIX))
+
+    def _map(self, segment):
+        # Caller holds _read_lock. Remaps when the file has grown.
+        path = os.path.join(self.directory, segment)
+        size = os.path.getsize(path)
+        cached = self._maps.get(segment)
+        if cached is not None and cached[1] >= size:
+            return cached[0]
+        if cached is not None:
+            cached[0].close()
+        if size == 0:
+            return None
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[segment] = (mapped, size)
+        return mapped
+
+    def _catch_up(self, budget=None):
+        """
+        Indexes what was appended since the last call, at most budget bytes
+        (None = everything). True if nothing is left. Caller holds _read_lock.
+        """
+        scanned = 0
+        present = self._segments()
+        gone = set(self._scanned) - set(present)
+        if gone:
+            self._forget_segments(gone)
+        for segment in present:
+            try:
+                mapped = self._map(segment)
+            except FileNotFoundError:
+                continue  # compacted by another worker just now
+            if mapped is None:
+                continue
+            offset = self._scanned.get(segment, 0)
+            end = len(mapped)
+            while offset + _RECORD.size <= end:
+                if budget is not None and scanned >= budget:
+                    self._scanned[segment] = offset
+                    return False  # the next call carries on from here
+                crc, length = _RECORD.unpack_from(mapped, offset)
+                body_end = offset + _RECORD.size + length
+                if body_end > end:
+                    break  # still being written
+                scanned += body_end - offset
+                body = mapped[offset + _RECORD.size:body_end]
+                if zlib.crc32(body) != crc:
+                    log.warning("Corrupt history record in %s at %d, skipping the rest", segment, offset)
+                    offset = end
+                    break
+                timestamp, pair, _sender, _message = _decode_body(body)
+                entries = self._index.setdefault(pair, [])
+                entry = (timestamp, segment, offset)
+                if not entries or entries[-1] <= entry:
+                    entries.append(entry)  # the usual case: newer than anything indexed
+                else:
+                    bisect.insort(entries, entry)
+                self.records += 1
+                if len(entries) > self.index_max_per_pair + self.index_max_per_pair // 4:
+                    # Trimmed in chunks so appends stay amortized O(1)
+                    dropped = len(entries) - self.index_max_per_pair
+                    del entries[:dropped]
+                    self.records -= dropped
+                    self._trimmed.add(pair)
+                offset = body_end
+            self._scanned[segment] = offset
+        return True
+
+    def _warm_up(self, socketio):
+        # Builds the index a chunk at a time, letting other green threads run in between
+        while True:
+            with self._read_lock:
+                done = self._catch_up(self.catch_up_bytes)
+            if done:
+                return
+            socketio.sleep(0)
+
+    def _ready(self):
+        # Caller holds _read_lock. A read only waits on a bounded scan.
+        return self._catch_up(self.catch_up_bytes)
+
+    def _forget_segments(self, segments):
+        # Caller holds _read_lock
+        for segment in segments:
+            self._scanned.pop(segment, None)
+            cached = self._maps.pop(segment, None)
+            if cached is not None:
+                cached[0].close()
+        for pair in list(self._index):
+            entries = [entry for entry in self._index[pair] if entry[1] not in segments]
+            self.records -= len(self._index[pair]) - len(entries)
+            if entries:
+                self._index[pair] = entries
+            else:
+                del self._index[pair]
+                self._trimmed.discard(pair)
+
+    def _scan_older(self, pair, before, count):
+        """
+        Up to count + 1 entries of pair older than before, oldest first,
+        read from the segments for pages beyond the index. Caller holds
+        _read_lock and has just run _catch_up.
+        """
+        newest = []  # min-heap of the newest count + 1 seen so far
+        for segment, scanned in self._scanned.items():
+            mapped = self._maps.get(segment, (None,))[0]
+            offset = 0
+            while mapped is not None and offset < scanned:
+                _crc, length = _RECORD.unpack_from(mapped, offset)
+                body_start = offset + _RECORD.size
+                timestamp, record_pair, _sender, _message = _decode_body(
+                    mapped[body_start:body_start + length])
+                entry = (timestamp, segment, offset)
+                if record_pair == pair and entry < before:
+                    if len(newest) <= count:
+                        heapq.heappush(newest, entry)
+                    elif entry > newest[0]:
+                        heapq.heapreplace(newest, entry)
+                offset = body_start + length
+        return sorted(newest)
+
+    def _read(self, segment, offset):
+        # Caller holds _read_lock and has just run _catch_up, so the map is current
+        mapped = self._maps[segment][0]
+        _crc, length = _RECORD.unpack_from(mapped, offset)
+        start = offset + _RECORD.size
+        timestamp, _pair, sender, message = _decode_body(mapped[start:start + length])
+        return {
+            "sender": sender,
+            "message": message,
+            "timestamp": datetime.utcfromtimestamp(timestamp).isoformat(),
+        }
+
+    def _record_end(self, segment, offset):
+        # Same preconditions as _read
+        return offset + _RECORD.size + _RECORD.unpack_from(self._maps[segment][0], offset)[1]
+
+    def page(self, a, b, cursor=None, limit=50):
+        """
+        Messages between a and b, newest first. cursor is the next_cursor of
+        the previous page. Returns (messages, next_cursor), or None while the
+        index is still being built.
+        """
+        pair = pair_key(a, b)
+        with self._read_lock:
+            if not self._ready():
+                return None
+            entries = self._index.get(pair, [])
+            before = _decode_cursor(cursor) if cursor else None
+            end = bisect.bisect_left(entries, before) if cursor else len(entries)
+            start = max(0, end - limit)
+            page = entries[start:end]
+            more = start > 0 or pair in self._trimmed  # may end on an empty page
+            if len(page) < limit and pair in self._trimmed:
+                # Older than anything the index keeps
+                boundary = page[0] if page else before or (float("inf"),)
+                older = self._scan_older(pair, boundary, limit - len(page))
+                more = len(older) > limit - len(page)
+                page = older[-(limit - len(page)):] + page
+            messages = [self._read(segment, offset) for _timestamp, segment, offset in reversed(page)]
+            next_cursor = _encode_cursor(page[0]) if more and page else None
+        return messages, next_cursor
+
+    def ref_for(self, a, b):
+        """
+        Byte ranges covering the last HISTORY_REPORT_MAX_RECORDS messages
+        between a and b, as a history_ref string, or None if there are none.
+        """
+        if not self.enabled:
+            return None
+        with self._read_lock:
+            if not self._ready():
+                return None  # the report keeps the client's chat_log instead
+            entries = self._index.get(pair_key(a, b), [])[-self.report_max_records:]
+            spans = {}
+            for _timestamp, segment, offset in entries:
+                end = self._record_end(segment, offset)
+                first, last = spans.get(segment, (offset, end))
+                spans[segment] = (min(first, offset), max(last, end))
+        if not spans:
+            return None
+        return ",".join(f"{segment}:{start}-{end}" for segment, (start, end) in sorted(spans.items()))
+
+    def read_ref(self, ref, a, b):
+        """The messages between a and b inside ref's byte ranges, oldest first."""
+        pair = pair_key(a, b)
+        messages = []
+        with self._read_lock:
+            for segment, start, end in parse_ref(ref):
+                try:
+                    mapped = self._map(segment)
+                except FileNotFoundError:
+                    continue
+                offset = start
+                while mapped is not None and offset + _RECORD.size <= min(end, len(mapped)):
+                    _crc, length = _RECORD.unpack_from(mapped, offset)
+                    body_start = offset + _RECORD.size
+                    timestamp, record_pair, sender, message = _decode_body(
+                        mapped[body_start:body_start + length])
+                    if record_pair == pair:
+                        messages.append({
+                            "sender": sender,
+                            "message": message,
+                            "timestamp": datetime.utcfromtimestamp(timestamp).isoformat(),
+                        })
+                    offset = body_start + length
+        messages.sort(key=lambda m: m["timestamp"])
+        return messages
+
+    # --- retention ---
+
+    def compact(self, now=None):
+        """
+        Deletes segments last written more than HISTORY_RETENTION ago, after
+        copying what reports still reference into their chat_log. Needs an
+        app context. Returns the number of segments removed.
+        """
+        now = time.time() if now is None else now
+        compress_min = self._app.config["REPORT_CHAT_LOG_COMPRESS_MIN"]
+        with self._write_lock:
+            active = self._segment
+        removed = 0
+        for segment in self._segments():
+            path = os.path.join(self.directory, segment)
+            try:
+                if segment == active or os.path.getmtime(path) >= now - self.retention:
+                    continue
+            except FileNotFoundError:
+                continue
+            rows = db.session.execute(
+                select(Report.id, Report.reporter_id, Report.reported_id, Report.history_ref)
+                .where(Report.history_ref.contains(segment))
+            ).all()
+            for row in rows:
+                chat_log = "\n".join(
+                    f"[{m['timestamp']}] {m['sender']}: {m['message']}"
+                    for m in self.read_ref(row.history_ref, row.reporter_id, row.reported_id)
+                )
+                db.session.execute(
+                    update(Report).where(Report.id == row.id)
+                    .values(chat_log=encode_chat_log(chat_log, compress_min), history_ref=None)
+                )
+            db.session.commit()
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass  # another worker got there first
+            removed += 1
+        if removed:
+            with self._read_lock:
+                self._catch_up(self.catch_up_bytes)  # drops index entries for the deleted segments
+        return removed
+
+    def _compact_loop(self, socketio, interval):
+        while True:
+            socketio.sleep(interval)
+            with self._app.app_context():
+                try:
+                    self.compact()
+                except Exception:
+                    log.exception("History compaction failed, will retry")
+                finally:
+                    db.session.remove()
+
+
+def _encode_cursor(entry):
+    timestamp, segment, offset = entry
+    return f"{timestamp!r}_{segment}_{offset}"
+
+
+def _decode_cursor(cursor):
+    timestamp, segment, offset = cursor.split("_")
+    return float(timestamp), segment, int(offset)
+
+
+message_history = MessageHistory()
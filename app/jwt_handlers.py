@@ -4,11 +4,11 @@ from flask import jsonify
 from flask import current_app
 
 def revoked_token_handler(jwt_header, jwt_payload):
-    current_app.logger.warning(f"[JWT] Revoked token used. Payload: {jwt_payload}")
+    current_app.logger.warning(f"[JWT] Revoked token used. sub={jwt_payload.get('sub')} jti={jwt_payload.get('jti')}")
     return jsonify({"error": "This token has been revoked."}), 401
 
 def expired_token_handler(jwt_header, jwt_payload):
-    current_app.logger.warning(f"[JWT] Expired token used. Payload: {jwt_payload}")
+    current_app.logger.warning(f"[JWT] Expired token used. sub={jwt_payload.get('sub')} jti={jwt_payload.get('jti')}")
     return jsonify({"error": "Token has expired."}), 401
 
 def invalid_token_handler(error_string):
@@ -0,0 +1,143 @@
+# my_flask_app/app/logs.py
+
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask.logging import default_handler
+
+
+def _os_thread_modules():
+    """
+    (queue, threading) modules backed by real OS primitives. Under eventlet
+    the writer must be a real thread, otherwise its blocking writes to stdout
+    still run on the event loop.
+    """
+    if "eventlet" in sys.modules:
+        from eventlet import patcher
+        if patcher.is_monkey_patched("thread"):
+            return patcher.original("queue"), patcher.original("threading")
+    return queue, threading
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg plus any event fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Drops (and counts) records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue, full_exception=queue.Full):
+        super().__init__(log_queue)
+        self._full = full_exception
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Same process, so the record can cross the queue as-is; only freeze the
+        # message now and leave the exception for the writer thread to format
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except self._full:
+            self.dropped += 1
+
+
+class _OSThreadListener(QueueListener):
+    def __init__(self, log_queue, threading_module, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self._threading = threading_module
+
+    def start(self):
+        self._thread = self._threading.Thread(target=self._monitor, name="log-writer", daemon=True)
+        self._thread.start()
+
+
+class LogPipeline:
+    """
+    Routes the app's loggers (app.logger and every app.* module logger)
+    through a bounded in-memory queue to a single writer thread that formats
+    JSON and writes to stdout. A log call on a request or socket handler costs
+    one put_nowait; when the writer falls behind, records are dropped rather
+    than stalling the event loop.
+    """
+
+    def __init__(self):
+        self.handler = None
+        self._listener = None
+        self.sample_rates = {}
+
+    def init_app(self, app):
+        self.stop()
+        self.sample_rates = dict(app.config["LOG_SAMPLE_RATES"])
+        queue_module, threading_module = _os_thread_modules()
+        log_queue = queue_module.Queue(maxsize=app.config["LOG_QUEUE_MAX"])
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+        self.handler = _NonBlockingQueueHandler(log_queue, queue_module.Full)
+        self._listener = _OSThreadListener(log_queue, threading_module, stream)
+        self._listener.start()
+
+        logger = app.logger
+        logger.removeHandler(default_handler)
+        for handler in [h for h in logger.handlers if isinstance(h, _NonBlockingQueueHandler)]:
+            logger.removeHandler(handler)
+        logger.addHandler(self.handler)
+        logger.setLevel(app.config["LOG_LEVEL"])
+        logger.propagate = False
+
+    def stop(self):
+        """Flushes everything queued so far; registered to run at exit."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    @property
+    def dropped(self):
+        return self.handler.dropped if self.handler else 0
+
+
+log_pipeline = LogPipeline()
+atexit.register(log_pipeline.stop)
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Logs a named event with structured fields. Events listed in
+    LOG_SAMPLE_RATES are kept with that probability, and the decision is made
+    before a record is built, so frequent events cost almost nothing when
+    sampled out. Kept records carry sample_rate so totals can be scaled back.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = log_pipeline.sample_rates.get(event, 1.0)
+    if rate < 1.0:
+        if random.random() >= rate:
+            return
+        fields["sample_rate"] = rate
+    fields["event"] = event
+    logger.log(level, event, extra={"fields": fields})
@@ -0,0 +1,219 @@
+# my_flask_app/app/mailbox.py
+
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.exc import DisconnectionError, OperationalError
+
+from .db import db
+from .logs import log_event
+from .models import OfflineMessage
+
+log = logging.getLogger(__name__)
+
+
+class Mailbox:
+    """
+    Store-and-forward for private messages whose recipient is offline.
+
+    enqueue() only appends to an in-memory buffer; a background task writes the
+    buffer out as one multi-row INSERT and one commit every
+    MAILBOX_FLUSH_INTERVAL (or as soon as MAILBOX_BATCH_SIZE messages are
+    waiting, when enqueue() wakes it), so a burst of messages costs one
+    transaction, not one each, and the sender never waits on the database.
+
+    Each recipient keeps at most MAILBOX_MAX_PER_RECIPIENT messages (oldest are
+    dropped) and nothing older than MAILBOX_MAX_AGE. take() hands a recipient
+    everything waiting for them, written or still buffered, and removes it.
+
+    If a batch can't be written it is retried one row at a time; rows the
+    database still refuses are logged and dropped (counted in dropped) so one
+    bad message can't wedge the buffer. Only connection-level errors put the
+    batch back for the next flush.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._buffer_lock = threading.Lock()
+        # Held for a whole flush so take() never reads the table while a
+        # batch it should see is half written
+        self._flush_lock = threading.Lock()
+        self._app = None
+        self.max_per_recipient = 100
+        self.max_age = None
+        self.flush_interval = 0.5
+        self.batch_size = 500
+        self._next_purge = 0.0
+        self.dropped = 0
+        self._wake = threading.Event()  # replaced by the async mode's event in init_app
+
+    def init_app(self, app, socketio):
+        self._app = app
+        self.max_per_recipient = app.config["MAILBOX_MAX_PER_RECIPIENT"]
+        self.max_age = app.config["MAILBOX_MAX_AGE"]
+        self.flush_interval = app.config["MAILBOX_FLUSH_INTERVAL"]
+        self.batch_size = app.config["MAILBOX_BATCH_SIZE"]
+        self._wake = socketio.server.eio.create_event()
+        socketio.start_background_task(self._flush_loop, socketio)
+        atexit.register(self._flush_on_exit)
+
+    def enqueue(self, recipient_id, sender_id, message):
+        with self._buffer_lock:
+            self._buffer.append({
+                "recipient_id": recipient_id,
+                "sender_id": sender_id,
+                "message": message,
+                "created_at": datetime.utcnow(),
+            })
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()  # the flusher owns the transaction and its errors
+
+    def pending(self):
+        return len(self._buffer)
+
+    def flush(self):
+        """Writes buffered messages in one transaction. Needs an app context."""
+        with self._flush_lock:
+            with self._buffer_lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+            try:
+                self._write(batch)
+            except (OperationalError, DisconnectionError):
+                self._requeue(batch)
+                raise
+            except Exception:
+                db.session.rollback()
+                return self._write_one_by_one(batch)
+            return len(batch)
+
+    def _write(self, rows):
+        try:
+            db.session.execute(insert(OfflineMessage), rows)
+            self._trim({row["recipient_id"] for row in rows})
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    def _write_one_by_one(self, batch):
+        # Caller holds _flush_lock. Finds the rows that broke the batch.
+        written = 0
+        for i, row in enumerate(batch):
+            try:
+                self._write([row])
+            except (OperationalError, DisconnectionError):
+                self._requeue(batch[i:])
+                raise
+            except Exception as e:
+                self.dropped += 1
+                log_event(log, logging.ERROR, "mailbox.row_dropped", recipient=row["recipient_id"],
+                          sender=row["sender_id"], error=type(e).__name__)
+            else:
+                written += 1
+        return written
+
+    def _requeue(self, rows):
+        with self._buffer_lock:
+            self._buffer[:0] = rows  # keep them for the next attempt
+
+    def _trim(self, recipient_ids):
+        # One grouped count, then trim only the mailboxes that overflowed
+        over = db.session.execute(
+            select(OfflineMessage.recipient_id)
+            .where(OfflineMessage.recipient_id.in_(recipient_ids))
+            .group_by(OfflineMessage.recipient_id)
+            .having(func.count() > self.max_per_recipient)
+        ).scalars().all()
+        for recipient_id in over:
+            oldest_kept = (
+                select(OfflineMessage.id)
+                .where(OfflineMessage.recipient_id == recipient_id)
+                .order_by(OfflineMessage.id.desc())
+                .offset(self.max_per_recipient - 1)
+                .limit(1)
+                .scalar_subquery()
+            )
+            db.session.execute(
+                delete(OfflineMessage).where(
+                    OfflineMessage.recipient_id == recipient_id,
+                    OfflineMessage.id < oldest_kept,
+                )
+            )
+
+    def purge_expired(self):
+        db.session.execute(
+            delete(OfflineMessage).where(OfflineMessage.created_at < datetime.utcnow() - self.max_age)
+        )
+        db.session.commit()
+
+    def take(self, recipient_id):
+        """
+        Removes and returns every message waiting for recipient_id, oldest
+        first: what is already in the table, then what is still buffered.
+        Doesn't flush, so one recipient never waits on everyone's writes.
+        """
+        with self._flush_lock:  # a flush in progress has rows in neither place
+            with self._buffer_lock:
+                buffered = [row for row in self._buffer if row["recipient_id"] == recipient_id]
+                if buffered:
+                    self._buffer = [row for row in self._buffer if row["recipient_id"] != recipient_id]
+            try:
+                rows = db.session.execute(
+                    select(OfflineMessage.id, OfflineMessage.sender_id,
+                           OfflineMessage.message, OfflineMessage.created_at)
+                    .where(OfflineMessage.recipient_id == recipient_id)
+                    .order_by(OfflineMessage.id)
+                    .limit(self.max_per_recipient)
+                ).all()
+                if rows:
+                    db.session.execute(
+                        delete(OfflineMessage).where(
+                            OfflineMessage.recipient_id == recipient_id,
+                            OfflineMessage.id <= rows[-1].id,
+                        )
+                    )
+                    db.session.commit()
+            except Exception:
+                db.session.rollback()
+                if buffered:
+                    self._requeue(buffered)
+                raise
+        messages = [
+            {"sender": r.sender_id, "message": r.message, "timestamp": r.created_at.isoformat()}
+            for r in rows
+        ]
+        messages += [
+            {"sender": row["sender_id"], "message": row["message"], "timestamp": row["created_at"].isoformat()}
+            for row in buffered
+        ]
+        return messages[-self.max_per_recipient:]  # same cap a flush would have applied
+
+    def _flush_loop(self, socketio):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            with self._app.app_context():
+                try:
+                    self.flush()
+                    now = time.monotonic()
+                    if now >= self._next_purge:
+                        self.purge_expired()
+                        self._next_purge = now + 60
+                except Exception:
+                    db.session.rollback()
+                    log.exception("Mailbox flush failed")
+
+    def _flush_on_exit(self):
+        if self._buffer and self._app is not None:
+            with self._app.app_context():
+                self.flush()
+
+
+mailbox = Mailbox()
@@ -0,0 +1,312 @@
+# my_flask_app/app/metrics.py
+
+import bisect
+import hmac
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, g, request
+from sqlalchemy import event
+
+from .db import db, observe_checkouts, pool_status
+from .logs import log_pipeline
+from .mailbox import mailbox
+from .moderation import moderation_cache
+from .report_queue import report_queue
+
+# Seconds; socket handlers and most queries land in the sub-millisecond buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            yield self.name + _labels(self.labelnames, labels), value
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. observe() is a bisect and two additions under a
+    lock; bucket counts are kept per-bucket and only made cumulative when the
+    endpoint is scraped.
+    """
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return sum(series[:-1]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = [(labels, list(series)) for labels, series in self._series.items()]
+        for labels, series in items:
+            running = 0
+            for bound, hits in zip(self.buckets + (float("inf"),), series[:-1]):
+                running += hits
+                le = f'le="{_number(bound)}"'
+                yield self.name + "_bucket" + _labels(self.labelnames, labels, le), running
+            yield self.name + "_sum" + _labels(self.labelnames, labels), series[-1]
+            yield self.name + "_count" + _labels(self.labelnames, labels), running
+
+
+class CallbackMetric:
+    """A value read from somewhere else only when /metrics is scraped."""
+
+    def __init__(self, name, help, fn, type="gauge"):
+        self.name = name
+        self.help = help
+        self.fn = fn
+        self.type = type
+
+    def samples(self):
+        yield self.name, self.fn()
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric  # re-registering replaces
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name, help, fn):
+        return self.register(CallbackMetric(name, help, fn))
+
+    def render(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            try:
+                for name, value in metric.samples():
+                    lines.append(f"{name} {_number(value)}")
+            except Exception as e:  # a broken gauge must not take the scrape down
+                lines.append(f"# error reading {metric.name}: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+socket_event_errors = registry.counter(
+    "socketio_event_errors_total", "Socket.IO handlers that raised", ("event",))
+socket_events_rejected = registry.counter(
+    "socketio_events_rejected_total", "Socket.IO events dropped by the rate limiter", ("event",))
+socket_connections_refused = registry.counter(
+    "socketio_connections_refused_total", "Sockets refused by a connection limit", ("limit",))
+socket_connections_reaped = registry.counter(
+    "socketio_connections_reaped_total", "Sockets closed by the connection sweeper", ("reason",))
+socket_event_seconds = registry.histogram(
+    "socketio_event_duration_seconds", "Socket.IO handler duration (_count = events handled)",
+    ("event",))
+http_requests = registry.counter(
+    "http_requests_total", "HTTP requests by endpoint", ("endpoint", "method", "status"))
+http_request_seconds = registry.histogram(
+    "http_request_duration_seconds", "HTTP request duration", ("endpoint",))
+db_queries = registry.counter(
+    "db_queries_total", "SQL statements executed", ("operation",))
+db_query_seconds = registry.histogram(
+    "db_query_duration_seconds", "SQL statement duration", ("operation",))
+db_pool_wait_seconds = registry.histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection")
+db_pool_timeouts = registry.counter(
+    "db_pool_checkout_timeouts_total", "Checkouts that gave up after DB_POOL_TIMEOUT")
+
+
+def instrumented(event_name):
+    """Times a Socket.IO handler; the histogram's _count doubles as the event count."""
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                socket_event_errors.inc(event_name)
+                raise
+            finally:
+                socket_event_seconds.observe(time.perf_counter() - start, event_name)
+        return decorator
+    return wrapper
+
+
+def _operation(statement):
+    # First keyword only (SELECT/INSERT/...), so label cardinality stays tiny
+    head = statement.lstrip()[:12].split(None, 1)
+    return head[0].upper() if head else "OTHER"
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if starts:
+        operation = _operation(statement)
+        db_queries.inc(operation)
+        db_query_seconds.observe(time.perf_counter() - starts.pop(), operation)
+
+
+def _handle_error(exception_context):
+    conn = exception_context.connection
+    if conn is not None and conn.info.get("metrics_query_start"):
+        conn.info["metrics_query_start"].pop()
+
+
+def _record_checkout(wait, timed_out):
+    if timed_out:
+        db_pool_timeouts.inc()
+    else:
+        db_pool_wait_seconds.observe(wait)
+
+
+def _start_timer():
+    g.metrics_start = time.perf_counter()
+
+
+def _record_request(response):
+    start = g.pop("metrics_start", None)
+    if start is not None:
+        endpoint = request.endpoint or "unmatched"
+        http_requests.inc(endpoint, request.method, response.status_code)
+        http_request_seconds.observe(time.perf_counter() - start, endpoint)
+    return response
+
+
+_LOOPBACK = {"127.0.0.1", "::1"}
+
+
+def _scrape_allowed():
+    token = current_app.config["METRICS_TOKEN"]
+    if token:
+        return hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}")
+    if current_app.config["METRICS_PUBLIC"]:
+        return True
+    # No token: only scrapers on this host. A forwarded request came in
+    # through a local proxy, so it doesn't count as local.
+    return request.remote_addr in _LOOPBACK and "X-Forwarded-For" not in request.headers
+
+
+def metrics_view():
+    if not _scrape_allowed():
+        return Response("unauthorized\n", status=401, mimetype="text/plain")
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _saturation(checked_out, capacity):
+    return checked_out / capacity if capacity else 0.0
+
+
+def init_metrics(app, presence, chat_sessions):
+    """
+    Hooks request timing, SQLAlchemy engine events and the scrape-time gauges
+    into app, and serves everything as text at /metrics. Counters are per
+    process; with several workers, scrape each one.
+    """
+    if not app.config["METRICS_ENABLED"]:
+        return
+
+    app.before_request(_start_timer)
+    app.after_request(_record_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view)
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+    observe_checkouts(_record_checkout)
+
+    if pool_status(engine) is not None:
+        registry.gauge("db_pool_checked_out", "Pooled connections in use",
+                       lambda: pool_status(engine)[0])
+        registry.gauge("db_pool_saturation", "Pooled connections in use / pool capacity",
+                       lambda: _saturation(*pool_status(engine)))
+
+    registry.gauge("chat_online_users", "Users with at least one identified socket",
+                   presence.online_count)
+    registry.gauge("chat_socket_connections", "Open Socket.IO connections on this worker",
+                   presence.connection_count)
+    registry.gauge("chat_pending_requests", "Chat requests waiting for an answer",
+                   lambda: chat_sessions.counts()[0])
+    registry.gauge("chat_active_sessions", "Accepted chat pairs",
+                   lambda: chat_sessions.counts()[1])
+    registry.gauge("mailbox_buffered_messages", "Offline messages waiting to be written",
+                   mailbox.pending)
+    registry.register(CallbackMetric("mailbox_messages_dropped_total", "Offline messages the database refused",
+                                     lambda: mailbox.dropped, type="counter"))
+    registry.gauge("report_queue_depth", "Reports waiting to be written",
+                   report_queue.depth)
+    registry.register(CallbackMetric("reports_dropped_total", "Reports the database refused",
+                                     lambda: report_queue.dropped, type="counter"))
+    registry.gauge("moderation_cache_entries", "Entries in the moderation flag cache",
+                   lambda: len(moderation_cache))
+    registry.gauge("moderation_cache_hit_ratio", "Moderation cache hits / lookups",
+                   moderation_cache.hit_rate)
+    registry.register(CallbackMetric("moderation_cache_hits_total", "Moderation cache hits",
+                                     lambda: moderation_cache.hits, type="counter"))
+    registry.register(CallbackMetric("moderation_cache_misses_total", "Moderation cache misses",
+                                     lambda: moderation_cache.misses, type="counter"))
+    registry.register(CallbackMetric("log_records_dropped_total", "Log records dropped on a full queue",
+                                     lambda: log_pipeline.dropped, type="counter"))
@@ -13,12 +13,39 @@ class User(db.Model):
     is_master_admin = db.Column(db.Boolean, default=False)
     is_banned = db.Column(db.Boolean, default=False)
     is_muted = db.Column(db.Boolean, default=False)
+    # Bumped by ban/mute/role changes; tokens carry the value they were issued at
+    moderation_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
 
 class Report(db.Model):
     __tablename__ = "reports"
+    __table_args__ = (
+        # Keyset pagination walks (timestamp, id) newest first
+        db.Index("ix_reports_timestamp_id", "timestamp", "id"),
+        db.Index("ix_reports_reported_id_timestamp", "reported_id", "timestamp"),
+    )
     id = db.Column(db.Integer, primary_key=True)
-    reporter_id = db.Column(db.String, nullable=False)
+    reporter_id = db.Column(db.String, nullable=False, index=True)
     reported_id = db.Column(db.String, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     reason = db.Column(db.Text)
-    chat_log = db.Column(db.Text)
+    # Can be large; only loaded when a single report is opened
+    chat_log = db.deferred(db.Column(db.Text))
+    # Byte ranges of the server-side message history (see app/history.py)
+    history_ref = db.Column(db.Text)
+
+class RevokedToken(db.Model):
+    __tablename__ = "revoked_tokens"
+    id = db.Column(db.Integer, primary_key=True)
+    jti = db.Column(db.String(36), unique=True, nullable=False, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class OfflineMessage(db.Model):
+    __tablename__ = "offline_messages"
+    __table_args__ = (
+        db.Index("ix_offline_messages_recipient_id_id", "recipient_id", "id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    recipient_id = db.Column(db.String(255), nullable=False)
+    sender_id = db.Column(db.String(255), nullable=False)
+    message = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
@@ -0,0 +1,196 @@
+# my_flask_app/app/moderation.py
+
+from sqlalchemy import delete, select, update
+
+from .cache import LRUCache
+from .dashboard import dashboard_cache
+from .db import db
+from .models import User
+
+# chat_id -> {"username": ..., "is_banned": ..., "is_muted": ...}
+# (or None for unknown chat_ids)
+# The admin routes invalidate entries as soon as they change a user, so the
+# TTL only bounds staleness for changes made outside this process.
+moderation_cache = LRUCache()
+# user_id -> moderation_version (None for deleted users). Access tokens carry
+# the version they were issued at, so checking one is an integer comparison;
+# the admin routes update entries directly, and other workers see a change
+# within the TTL.
+moderation_versions = LRUCache()
+_MISSING = object()
+
+
+def init_moderation_cache(app):
+    for cache in (moderation_cache, moderation_versions):
+        cache.configure(
+            maxsize=app.config["MODERATION_CACHE_SIZE"],
+            ttl=app.config["MODERATION_CACHE_TTL"],
+        )
+
+
+def _row_to_flags(row):
+    return {"username": row.username, "is_banned": row.is_banned, "is_muted": row.is_muted}
+
+
+def _flags_query():
+    return select(User.chat_id, User.username, User.is_banned, User.is_muted)
+
+
+def _load_user_flags(chat_id):
+    row = db.session.execute(_flags_query().where(User.chat_id == chat_id)).first()
+    return _row_to_flags(row) if row else None
+
+
+def get_user_flags_by_chat_id(chat_id):
+    """
+    Looks up whether the user is banned or muted by their chat_id.
+    Returns dict like {"username": "bob", "is_banned": 0, "is_muted": 1},
+    served from the moderation cache when possible.
+    """
+    return moderation_cache.get_or_load(chat_id, _load_user_flags)
+
+
+def get_users_by_chat_ids(chat_ids):
+    """
+    Batch version of get_user_flags_by_chat_id. Cache misses are loaded with a
+    single IN query on the unique chat_id index. Returns {chat_id: flags or None}.
+    """
+    found = {}
+    missing = []
+    for chat_id in dict.fromkeys(chat_ids):
+        flags = moderation_cache.get(chat_id, _MISSING)
+        if flags is _MISSING:
+            missing.append(chat_id)
+        else:
+            found[chat_id] = flags
+
+    if missing:
+        rows = db.session.execute(_flags_query().where(User.chat_id.in_(missing)))
+        loaded = {row.chat_id: _row_to_flags(row) for row in rows}
+        for chat_id in missing:
+            flags = loaded.get(chat_id)
+            moderation_cache.set(chat_id, flags)
+            found[chat_id] = flags
+    return found
+
+
+def invalidate_user_flags(chat_id):
+    moderation_cache.invalidate(chat_id)
+
+
+def _load_moderation_version(user_id):
+    return db.session.execute(
+        select(User.moderation_version).where(User.id == user_id)
+    ).scalar()
+
+
+def get_moderation_version(user_id):
+    """Current moderation_version for user_id, or None if the user is gone."""
+    return moderation_versions.get_or_load(user_id, _load_moderation_version)
+
+
+def bump_moderation_version(user):
+    """
+    Marks every token issued to user as stale. Done in SQL so two admins
+    acting at once can't both write the same value; commit afterwards and
+    then call moderation_changed().
+    """
+    user.moderation_version = User.moderation_version + 1
+
+
+def moderation_changed(user):
+    """Publishes a committed ban/mute/role change to this process's caches."""
+    moderation_versions.set(user.id, user.moderation_version)
+    invalidate_user_flags(user.chat_id)
+    dashboard_cache.invalidate()
+
+
+# action -> (column, value); "delete" removes the user
+BULK_ACTIONS = {
+    "ban": ("is_banned", True),
+    "unban": ("is_banned", False),
+    "mute": ("is_muted", True),
+    "unmute": ("is_muted", False),
+    "delete": (None, None),
+}
+
+
+def apply_bulk_moderation(actions, acting_username):
+    """
+    Applies [{"action": "ban", "username": "bob"}, ...] in one transaction:
+    one SELECT to resolve usernames, then one UPDATE per action type and one
+    DELETE, each over all the users it applies to. Actions are applied in list
+    order, so for one user a later "unban" overrides an earlier "ban".
+
+    Returns (results, removed): one {"username", "action", "status"} dict per
+    action in request order, and {chat_id: "banned" | "deleted"} for users
+    whose live sockets should be dropped.
+    """
+    usernames = {
+        a.get("username") for a in actions
+        if isinstance(a, dict) and isinstance(a.get("username"), str)
+    }
+    rows = {}
+    if usernames:
+        query = select(User.id, User.username, User.chat_id, User.is_master_admin)
+        rows = {row.username: row for row in db.session.execute(query.where(User.username.in_(usernames)))}
+
+    results = []
+    changes = {}   # user id -> {column: value}
+    deleted = {}   # user id -> row
+    for entry in actions:
+        action = entry.get("action") if isinstance(entry, dict) else None
+        username = entry.get("username") if isinstance(entry, dict) else None
+        result = {"username": username, "action": action, "status": "ok"}
+        results.append(result)
+        row = rows.get(username)
+
+        if action not in BULK_ACTIONS or not isinstance(username, str):
+            result.update(status="invalid", error="Unknown action or missing username.")
+        elif row is None or row.id in deleted:
+            result.update(status="not_found", error="User not found.")
+        elif action == "delete" and username == acting_username:
+            result.update(status="forbidden", error="Admins cannot delete themselves.")
+        elif action == "delete" and row.is_master_admin:
+            result.update(status="forbidden", error="Cannot delete the master admin.")
+        elif action == "delete":
+            deleted[row.id] = row
+            changes.pop(row.id, None)
+        else:
+            column, value = BULK_ACTIONS[action]
+            changes.setdefault(row.id, {})[column] = value
+
+    by_value = {}  # (column, value) -> [user ids]
+    for user_id, columns in changes.items():
+        for column, value in columns.items():
+            by_value.setdefault((column, value), []).append(user_id)
+    for (column, value), user_ids in by_value.items():
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(user_ids))
+            .values({column: value, "moderation_version": User.moderation_version + 1})
+            .execution_options(synchronize_session=False)
+        )
+    if deleted:
+        db.session.execute(
+            delete(User).where(User.id.in_(deleted)).execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    dashboard_cache.invalidate()
+
+    chat_ids = {row.id: row.chat_id for row in rows.values()}
+    removed = {}
+    if changes:
+        versions = db.session.execute(
+            select(User.id, User.moderation_version).where(User.id.in_(changes))
+        )
+        for user_id, version in versions:
+            moderation_versions.set(user_id, version)
+            invalidate_user_flags(chat_ids[user_id])
+            if changes[user_id].get("is_banned"):
+                removed[chat_ids[user_id]] = "banned"
+    for user_id, row in deleted.items():
+        moderation_versions.set(user_id, None)
+        invalidate_user_flags(row.chat_id)
+        removed[row.chat_id] = "deleted"
+    return results, removed
@@ -0,0 +1,82 @@
+# my_flask_app/app/passwords.py
+
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+def _green_runner():
+    """
+    Returns a function that runs a blocking call on a real OS thread without
+    blocking the green event loop, or None when no green library is patched in.
+    hashlib releases the GIL while it hashes, so these threads run in parallel.
+    """
+    if "eventlet" in sys.modules:
+        from eventlet import patcher, tpool
+        if patcher.is_monkey_patched("thread"):
+            return tpool.execute
+    if "gevent" in sys.modules:
+        from gevent import monkey, get_hub
+        if monkey.is_module_patched("threading"):
+            return lambda fn, *args: get_hub().threadpool.apply(fn, args)
+    return None
+
+
+class PasswordHasher:
+    """
+    Hashes and checks passwords off the request's green thread.
+
+    Under the eventlet worker a scrypt/pbkdf2 hash done inline stalls every
+    socket on the process for its full duration, so hashes run on a bounded
+    pool of OS threads instead (eventlet's tpool, gevent's threadpool, or a
+    plain ThreadPoolExecutor when nothing is monkey-patched).
+
+    PASSWORD_HASH_METHOD is a full werkzeug method string, e.g.
+    "scrypt:32768:8:1" or "pbkdf2:sha256:600000". Stored hashes made with any
+    other parameters are reported by needs_rehash() so login can upgrade them.
+    """
+
+    def __init__(self):
+        self.method = "scrypt:32768:8:1"
+        self.offload = True
+        self._limit = threading.BoundedSemaphore(4)
+        self._executor = None
+        self._runner = None
+
+    def init_app(self, app):
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self.offload = app.config["PASSWORD_HASH_OFFLOAD"]
+        workers = app.config["PASSWORD_HASH_WORKERS"]
+        # Created here rather than at import so it picks up monkey-patching
+        self._limit = threading.BoundedSemaphore(workers)
+        self._runner = _green_runner()
+        if self._runner is None:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pwhash")
+
+    def _run(self, fn, *args):
+        if not self.offload:
+            return fn(*args)
+        # The semaphore bounds concurrent hashes so a login storm queues here
+        # instead of oversubscribing the CPU
+        with self._limit:
+            if self._runner is not None:
+                return self._runner(fn, *args)
+            if self._executor is not None:
+                return self._executor.submit(fn, *args).result()
+            return fn(*args)
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, stored_hash, password):
+        if not stored_hash or password is None:
+            return False
+        return self._run(check_password_hash, stored_hash, password)
+
+    def needs_rehash(self, stored_hash):
+        return stored_hash.split("$", 1)[0] != self.method
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,143 @@
+# my_flask_app/app/presence.py
+
+import threading
+
+
+class PresenceRegistry:
+    """
+    Tracks which socket belongs to which chat_id.
+
+    Both directions are indexed so every lookup is O(1) no matter how many
+    sockets are connected:
+      sid -> chat_id
+      chat_id -> {sid, ...}   (one sid per open tab/device)
+
+    connect/identify/disconnect each run under a single lock so a handler
+    never sees a sid that is in one index but not the other.
+
+    The local indexes only know this worker's sockets. When a shared store is
+    attached (see app/bus.py) bindings are written through to it and
+    chat_id -> sids lookups are answered from it, so a recipient connected to
+    another worker is still found. sid -> chat_id stays local: the sender of
+    an event is always connected to the worker handling it.
+
+    Sockets that identified with the binary wire format (see app/wire.py)
+    are also recorded, so whoever puts a sid into a chat room can pick the
+    room matching its format.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._lock = threading.Lock()
+        self._chat_id_by_sid = {}
+        self._sids_by_chat_id = {}
+        self._pending = set()  # connected, not identified yet
+        self._binary_sids = set()
+
+    def connect(self, sid):
+        with self._lock:
+            if sid not in self._chat_id_by_sid:
+                self._pending.add(sid)
+
+    def identify(self, sid, chat_id, binary=False):
+        """
+        Binds sid to chat_id (re-binding it if it was identified as someone
+        else). Returns True if this is the first live socket for chat_id.
+        """
+        with self._lock:
+            self._pending.discard(sid)
+            if binary:
+                self._binary_sids.add(sid)
+            else:
+                self._binary_sids.discard(sid)
+            previous = self._chat_id_by_sid.get(sid)
+            if previous == chat_id:
+                if self.store is not None:
+                    self.store.bind(sid, chat_id, binary)
+                return False
+            if previous is not None:
+                self._unbind(sid, previous)
+            self._chat_id_by_sid[sid] = chat_id
+            sids = self._sids_by_chat_id.setdefault(chat_id, set())
+            sids.add(sid)
+            first = len(sids) == 1
+        if self.store is not None:
+            first = not self.store.is_online(chat_id)
+            self.store.bind(sid, chat_id, binary)
+        return first
+
+    def disconnect(self, sid):
+        """
+        Forgets sid. Returns (chat_id, went_offline) where chat_id is None for
+        a socket that never identified and went_offline is True when that was
+        the user's last socket.
+        """
+        with self._lock:
+            self._pending.discard(sid)
+            chat_id = self._chat_id_by_sid.get(sid)
+            if chat_id is None:
+                return None, False
+            went_offline = self._unbind(sid, chat_id)
+        if self.store is not None:
+            self.store.unbind(sid)
+            went_offline = not self.store.is_online(chat_id)
+        return chat_id, went_offline
+
+    def _unbind(self, sid, chat_id):
+        # Caller holds the lock
+        del self._chat_id_by_sid[sid]
+        self._binary_sids.discard(sid)
+        sids = self._sids_by_chat_id.get(chat_id)
+        if sids is None:
+            return False
+        sids.discard(sid)
+        if not sids:
+            del self._sids_by_chat_id[chat_id]
+            return True
+        return False
+
+    def chat_id_for(self, sid):
+        return self._chat_id_by_sid.get(sid)
+
+    def sids_for(self, chat_id):
+        """Returns a snapshot list of the chat_id's live sids (empty if offline)."""
+        if self.store is not None:
+            return self.store.sids_for(chat_id)
+        sids = self._sids_by_chat_id.get(chat_id)
+        return list(sids) if sids else []
+
+    def wants_binary(self, sid):
+        """True if sid asked for binary private_message frames."""
+        if sid in self._binary_sids:
+            return True
+        if self.store is not None and sid not in self._chat_id_by_sid:
+            return self.store.is_binary(sid)  # a socket on another worker
+        return False
+
+    def has_binary_sockets(self):
+        """False while nobody uses binary frames, so senders can skip encoding them."""
+        if self.store is not None:
+            return self.store.has_binary()
+        return bool(self._binary_sids)
+
+    def is_online(self, chat_id):
+        if self.store is not None:
+            return self.store.is_online(chat_id)
+        return chat_id in self._sids_by_chat_id
+
+    def online_count(self):
+        if self.store is not None:
+            return self.store.online_count()
+        return len(self._sids_by_chat_id)
+
+    def connection_count(self):
+        return len(self._chat_id_by_sid) + len(self._pending)
+
+    def clear(self):
+        with self._lock:
+            self._chat_id_by_sid.clear()
+            self._sids_by_chat_id.clear()
+            self._pending.clear()
+            self._binary_sids.clear()
+        if self.store is not None:
+            self.store.clear()
@@ -0,0 +1,83 @@
+# my_flask_app/app/ratelimit.py
+
+import threading
+import time
+
+
+class SocketRateLimiter:
+    """
+    Token buckets for socket events, one per (sid, event) and one per
+    (chat_id, event) so opening more tabs doesn't buy a user more throughput.
+
+    Limits come from SOCKET_RATE_LIMITS: {event: (tokens_per_second, burst)}.
+    Events without an entry are not limited. Each bucket is a two-item list
+    [tokens, last_refill], so state per connection is a handful of floats and
+    is dropped on disconnect.
+    """
+
+    def __init__(self):
+        self.limits = {}
+        self.disconnect_after = 0
+        self._lock = threading.Lock()
+        self._sid_buckets = {}      # sid -> {event: [tokens, last]}
+        self._chat_buckets = {}     # chat_id -> {event: [tokens, last]}
+        self._strikes = {}          # sid -> rejected events since connect
+
+    def init_app(self, app):
+        self.limits = dict(app.config["SOCKET_RATE_LIMITS"])
+        self.disconnect_after = app.config["SOCKET_RATE_LIMIT_DISCONNECT_AFTER"]
+        self.clear()
+
+    @staticmethod
+    def _take(buckets, event, rate, burst, now):
+        bucket = buckets.get(event)
+        if bucket is None:
+            buckets[event] = [burst - 1.0, now]
+            return True
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens < 1.0:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1.0
+        return True
+
+    def allow(self, sid, chat_id, event):
+        """Returns True if the event may run; False uses up no tokens."""
+        limit = self.limits.get(event)
+        if limit is None:
+            return True
+        rate, burst = limit
+        now = time.monotonic()
+        with self._lock:
+            sid_ok = self._take(self._sid_buckets.setdefault(sid, {}), event, rate, burst, now)
+            chat_ok = sid_ok and (
+                chat_id is None
+                or self._take(self._chat_buckets.setdefault(chat_id, {}), event, rate, burst, now)
+            )
+            if sid_ok and not chat_ok:
+                self._sid_buckets[sid][event][0] += 1.0  # refund, the event didn't run
+            if not chat_ok:
+                self._strikes[sid] = self._strikes.get(sid, 0) + 1
+            return chat_ok
+
+    def should_disconnect(self, sid):
+        return bool(self.disconnect_after) and self._strikes.get(sid, 0) >= self.disconnect_after
+
+    def forget_sid(self, sid):
+        with self._lock:
+            self._sid_buckets.pop(sid, None)
+            self._strikes.pop(sid, None)
+
+    def forget_chat_id(self, chat_id):
+        with self._lock:
+            self._chat_buckets.pop(chat_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._sid_buckets.clear()
+            self._chat_buckets.clear()
+            self._strikes.clear()
+
+
+socket_limiter = SocketRateLimiter()
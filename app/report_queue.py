@@ -0,0 +1,209 @@
+# my_flask_app/app/report_queue.py
+
+import atexit
+import logging
+import base64
+import queue
+import threading
+import zlib
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import DisconnectionError, OperationalError
+
+from .admin_feed import admin_feed
+from .dashboard import dashboard_cache
+from .db import db
+from .logs import log_event
+from .models import Report
+
+log = logging.getLogger(__name__)
+
+_COMPRESSED_PREFIX = "zlib:"
+
+
+def encode_chat_log(chat_log, min_size):
+    """Compresses chat logs of at least min_size bytes into a tagged base64 string."""
+    if not chat_log or not isinstance(chat_log, str):
+        return chat_log
+    raw = chat_log.encode("utf-8")
+    if len(raw) < min_size:
+        return chat_log
+    packed = _COMPRESSED_PREFIX + base64.b64encode(zlib.compress(raw, 6)).decode("ascii")
+    return packed if len(packed) < len(chat_log) else chat_log
+
+
+def decode_chat_log(stored):
+    if not stored or not stored.startswith(_COMPRESSED_PREFIX):
+        return stored
+    try:
+        return zlib.decompress(base64.b64decode(stored[len(_COMPRESSED_PREFIX):])).decode("utf-8")
+    except (ValueError, zlib.error):
+        return stored  # a plain log that happens to start with the prefix
+
+
+class ReportQueue:
+    """
+    Accepts reports from socket handlers without touching the database.
+
+    submit() puts the report on a bounded queue and returns False when it is
+    full, so a flood of reports is pushed back to the clients instead of
+    piling up. A background task drains the queue every REPORT_FLUSH_INTERVAL
+    and writes up to REPORT_BATCH_SIZE reports per multi-row INSERT/commit.
+    Whatever is still queued at exit is written before the process stops.
+
+    Reports are checked before they are accepted (see invalid()). If a batch
+    still fails it is retried one row at a time, and rows the database keeps
+    refusing are logged and set aside (counted in dropped) instead of
+    blocking every report behind them. A connection error keeps the batch
+    for the next flush.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue(maxsize=1000)
+        self._retry = []  # batch whose commit failed, written before anything newer
+        self._write_lock = threading.Lock()
+        self._app = None
+        self.batch_size = 200
+        self.flush_interval = 0.25
+        self.compress_min = 1024
+        self.reason_max = 1000
+        self.chat_log_max = 200_000
+        self.dropped = 0
+
+    def init_app(self, app, socketio):
+        self._app = app
+        self._queue = queue.Queue(maxsize=app.config["REPORT_QUEUE_MAX"])
+        self.batch_size = app.config["REPORT_BATCH_SIZE"]
+        self.flush_interval = app.config["REPORT_FLUSH_INTERVAL"]
+        self.compress_min = app.config["REPORT_CHAT_LOG_COMPRESS_MIN"]
+        self.reason_max = app.config["REPORT_REASON_MAX_LENGTH"]
+        self.chat_log_max = app.config["REPORT_CHAT_LOG_MAX_LENGTH"]
+        socketio.start_background_task(self._flush_loop, socketio)
+        atexit.register(self._flush_on_exit)
+
+    def invalid(self, reporter_id, reported_id, reason, chat_log):
+        """Why a report can't be stored, or None if it's fine."""
+        if not all(isinstance(v, str) and v for v in (reporter_id, reported_id)):
+            return "A report needs both chat IDs."
+        if reason is not None and (not isinstance(reason, str) or len(reason) > self.reason_max):
+            return f"The reason must be text of at most {self.reason_max} characters."
+        if chat_log is not None and (not isinstance(chat_log, str) or len(chat_log) > self.chat_log_max):
+            return f"The chat log must be text of at most {self.chat_log_max} characters."
+        return None
+
+    def submit(self, reporter_id, reported_id, reason, chat_log, history_ref=None):
+        """Queues a report; False if the queue is full. Raises ValueError for an invalid one."""
+        error = self.invalid(reporter_id, reported_id, reason, chat_log)
+        if error:
+            raise ValueError(error)
+        try:
+            self._queue.put_nowait({
+                "reporter_id": reporter_id,
+                "reported_id": reported_id,
+                "reason": reason,
+                "chat_log": chat_log,
+                "history_ref": history_ref,
+                "timestamp": datetime.utcnow(),
+            })
+        except queue.Full:
+            return False
+        return True
+
+    def depth(self):
+        return self._queue.qsize() + len(self._retry)
+
+    def _next_batch(self):
+        if self._retry:
+            batch, self._retry = self._retry, []
+            return batch
+        batch = []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Compression happens here, on the writer, not in the socket handler
+        for row in batch:
+            row["chat_log"] = encode_chat_log(row["chat_log"], self.compress_min)
+        return batch
+
+    def flush(self):
+        """Writes everything queued so far. Needs an app context."""
+        written = 0
+        with self._write_lock:
+            while True:
+                batch = self._next_batch()
+                if not batch:
+                    return written
+                try:
+                    ids = self._write(batch)
+                except (OperationalError, DisconnectionError):
+                    self._retry = batch
+                    raise
+                except Exception:
+                    batch, ids = self._write_one_by_one(batch)
+                written += len(batch)
+                self._announce(batch, ids)
+
+    def _write(self, rows):
+        """One multi-row INSERT and commit; returns the new ids if the dialect can."""
+        try:
+            if db.engine.dialect.insert_executemany_returning_sort_by_parameter_order:
+                # Ids for the admin feed, still one multi-row INSERT
+                ids = db.session.execute(
+                    insert(Report).returning(Report.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+            else:
+                ids = None
+                db.session.execute(insert(Report), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return ids
+
+    def _write_one_by_one(self, batch):
+        # Caller holds _write_lock. Returns (rows written, their ids or None).
+        written, ids = [], []
+        for i, row in enumerate(batch):
+            try:
+                row_ids = self._write([row])
+            except (OperationalError, DisconnectionError):
+                self._retry = batch[i:]
+                self._announce(written, ids)
+                raise
+            except Exception as e:
+                self.dropped += 1
+                log_event(log, logging.ERROR, "reports.row_dropped", reporter=row["reporter_id"],
+                          reported=row["reported_id"], reason=row["reason"], error=type(e).__name__)
+                continue
+            written.append(row)
+            ids = None if row_ids is None or ids is None else ids + row_ids
+        return written, ids
+
+    def _announce(self, rows, ids):
+        if not rows:
+            return
+        dashboard_cache.invalidate()
+        if ids is None:
+            admin_feed.reports_dropped(len(rows))  # admins reload the dashboard
+        else:
+            admin_feed.reports_added([{**row, "id": id_} for row, id_ in zip(rows, ids)])
+
+    def _flush_loop(self, socketio):
+        while True:
+            socketio.sleep(self.flush_interval)
+            with self._app.app_context():
+                try:
+                    self.flush()
+                except Exception:
+                    log.exception("Could not save reports, will retry")
+
+    def _flush_on_exit(self):
+        if self._app is not None and self.depth():
+            with self._app.app_context():
+                self.flush()
+
+
+report_queue = ReportQueue()
@@ -0,0 +1,177 @@
+# my_flask_app/app/revocation.py
+
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from .db import db
+from .moderation import get_moderation_version
+from .models import RevokedToken
+
+
+class BloomFilter:
+    """Fixed-size bloom filter over strings. No false negatives."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        bits = -self.capacity * math.log(error_rate) / (math.log(2) ** 2)
+        self.num_bits = max(int(bits), 8)
+        self.num_hashes = max(int(round(self.num_bits / self.capacity * math.log(2))), 1)
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: two 64-bit halves of one digest give k positions
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+class RevocationStore:
+    """
+    Revoked jtis live in the revoked_tokens table so they survive restarts and
+    are shared by every worker. Each process keeps a bloom filter of them, so
+    the usual "not revoked" answer is decided in memory; only a bloom hit
+    (a revoked token or a rare false positive) goes to the database.
+
+    The filter picks up other workers' revocations by reading rows newer than
+    the last id it saw, at most once per REVOCATION_SYNC_INTERVAL. Ids are
+    handed out before commit, so on databases with concurrent writers a lower
+    id can become visible after a higher one: each sync re-reads the last
+    REVOCATION_SYNC_OVERLAP ids as well, and the whole filter is rebuilt every
+    REVOCATION_REBUILD_INTERVAL in case a row took even longer. Rows whose
+    token has expired are purged every REVOCATION_PURGE_INTERVAL.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sync_interval = 2.0
+        self.purge_interval = 3600.0
+        self.rebuild_interval = 600.0
+        self.sync_overlap = 1000
+        self.capacity = 100000
+        self.error_rate = 0.001
+        self.default_ttl = timedelta(days=7)
+        self._reset()
+
+    def init_app(self, app):
+        self.sync_interval = app.config["REVOCATION_SYNC_INTERVAL"]
+        self.purge_interval = app.config["REVOCATION_PURGE_INTERVAL"]
+        self.rebuild_interval = app.config["REVOCATION_REBUILD_INTERVAL"]
+        self.sync_overlap = app.config["REVOCATION_SYNC_OVERLAP"]
+        self.capacity = app.config["REVOCATION_BLOOM_CAPACITY"]
+        self.error_rate = app.config["REVOCATION_BLOOM_ERROR_RATE"]
+        self.default_ttl = app.config["JWT_REFRESH_TOKEN_EXPIRES"]
+        self._reset()
+
+    def _reset(self):
+        self._bloom = None
+        self._last_id = 0
+        self._next_sync = 0.0
+        self._next_purge = 0.0
+        self._next_rebuild = 0.0
+
+    def revoke(self, jti, exp=None):
+        """Persists jti until exp (a unix timestamp, defaults to the refresh token lifetime)."""
+        if exp is not None:
+            expires_at = datetime.utcfromtimestamp(exp)
+        else:
+            expires_at = datetime.utcnow() + self.default_ttl
+        try:
+            db.session.add(RevokedToken(jti=jti, expires_at=expires_at))
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()  # already revoked
+        with self._lock:
+            if self._bloom is not None:
+                self._bloom.add(jti)
+
+    def is_revoked(self, jti):
+        self._maybe_sync()
+        if jti not in self._bloom:
+            return False
+        row = db.session.execute(
+            select(RevokedToken.id).where(RevokedToken.jti == jti)
+        ).first()
+        return row is not None
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if self._bloom is not None and now < self._next_sync:
+            return
+        with self._lock:
+            if self._bloom is not None and now < self._next_sync:
+                return
+            purged = False
+            if now >= self._next_purge:
+                purged = self._purge_expired()
+                self._next_purge = now + self.purge_interval
+            if self._bloom is None or purged or now >= self._next_rebuild:
+                # Bloom filters can't forget, so a purge means starting over
+                self._rebuild()
+                self._next_rebuild = now + self.rebuild_interval
+            else:
+                self._load_new_rows(self._bloom)
+            self._next_sync = now + self.sync_interval
+
+    def _purge_expired(self):
+        result = db.session.execute(
+            delete(RevokedToken).where(RevokedToken.expires_at < datetime.utcnow())
+        )
+        db.session.commit()
+        return result.rowcount > 0
+
+    def _rebuild(self):
+        total = db.session.query(RevokedToken.id).count()
+        bloom = BloomFilter(max(self.capacity, total * 2), self.error_rate)
+        self._last_id = 0
+        self._load_new_rows(bloom)
+        self._bloom = bloom  # swapped in whole; readers never see a partial filter
+
+    def _load_new_rows(self, bloom):
+        # The overlap catches rows committed out of id order since the last sync
+        rows = db.session.execute(
+            select(RevokedToken.id, RevokedToken.jti)
+            .where(RevokedToken.id > self._last_id - self.sync_overlap)
+            .order_by(RevokedToken.id)
+        ).all()
+        for row_id, jti in rows:
+            if jti not in bloom:
+                bloom.add(jti)
+            self._last_id = max(self._last_id, row_id)
+        if bloom.count > bloom.capacity:
+            self._rebuild()
+
+
+revocation_store = RevocationStore()
+
+
+def is_token_revoked(jwt_header, jwt_payload):
+    """Flask-JWT-Extended blocklist check, also used for tokens sent over Socket.IO."""
+    if revocation_store.is_revoked(jwt_payload["jti"]):
+        return True
+    # Access tokens are stale once the user has been banned, muted or had their
+    # role changed since issue. Refresh tokens pass so /token/refresh can hand
+    # out an access token with the current claims.
+    if jwt_payload.get("type") == "access":
+        try:
+            user_id = int(jwt_payload["sub"])
+        except (KeyError, ValueError):
+            return True
+        return get_moderation_version(user_id) != jwt_payload.get("mv", 0)
+    return False
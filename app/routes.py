@@ -1,9 +1,25 @@
 # my_flask_app/app/routes.py
 
-from flask import Blueprint, request, jsonify, current_app, render_template
+from flask import Blueprint, Response, request, jsonify, current_app, render_template, stream_with_context
 from .db import db
 from .models import User, Report
-from werkzeug.security import generate_password_hash, check_password_hash
+from .moderation import (
+    invalidate_user_flags,
+    get_users_by_chat_ids,
+    get_moderation_version,
+    bump_moderation_version,
+    moderation_changed,
+    moderation_versions,
+    apply_bulk_moderation,
+    BULK_ACTIONS,
+)
+from .sockets import disconnect_user, presence
+from .revocation import revocation_store
+from .admin_feed import admin_feed
+from .passwords import password_hasher
+from .report_queue import decode_chat_log
+from .history import message_history
+from .dashboard import dashboard_cache, dashboard_counts
 from functools import wraps
 from flask_jwt_extended import (
     create_access_token,
@@ -13,7 +29,11 @@ from flask_jwt_extended import (
     get_jwt,
     verify_jwt_in_request
 )
+import json
 import secrets
+from datetime import datetime
+from sqlalchemy import select, tuple_, update
+from sqlalchemy.orm import undefer
 from sqlalchemy.exc import IntegrityError
 
 def generate_chat_id():
@@ -21,10 +41,59 @@ def generate_chat_id():
 
 bp = Blueprint('routes', __name__)
 
-# In-memory token blacklist
-blacklisted_tokens = set()
+# Columns exposed by the admin user listings (never the password hash)
+USER_LIST_COLUMNS = (
+    User.id,
+    User.username,
+    User.role,
+    User.chat_id,
+    User.is_master_admin,
+    User.is_banned,
+    User.is_muted,
+)
+
+
+def _parse_bool(value):
+    if value is None:
+        return None
+    return value.strip().lower() in ("1", "true", "yes")
+
+
+def _user_list_query(args):
+    """Builds the projected, filtered SELECT shared by /all_users and its export."""
+    query = select(*USER_LIST_COLUMNS).order_by(User.id)
+
+    role = args.get("role")
+    if role:
+        query = query.where(User.role == role.strip().lower())
+    is_banned = _parse_bool(args.get("is_banned"))
+    if is_banned is not None:
+        query = query.where(User.is_banned == is_banned)
+    is_muted = _parse_bool(args.get("is_muted"))
+    if is_muted is not None:
+        query = query.where(User.is_muted == is_muted)
+    prefix = args.get("username")
+    if prefix:
+        query = query.where(User.username.startswith(prefix.strip(), autoescape=True))
+    return query
+
+
+def _user_row_to_dict(row):
+    return {
+        "id": row.id,
+        "username": row.username,
+        "role": row.role,
+        "chat_id": row.chat_id,
+        "is_master_admin": row.is_master_admin,
+        "is_banned": row.is_banned,
+        "is_muted": row.is_muted
+    }
+
 
-# GET all users (admin only)
+# GET all users (admin only), one page at a time.
+# ?after=<id of the last user seen>&limit=<n> walks the list by primary key, so
+# every page is an index range scan no matter how deep it is.
+# Optional filters: role, is_banned, is_muted, username (prefix).
 @bp.route("/all_users", methods=["GET"])
 @jwt_required()
 def get_all_users():
@@ -32,20 +101,57 @@ def get_all_users():
     if claims.get("role") != "admin":
         return jsonify({"error": "Admins only."}), 403
 
-    users = User.query.all()
-    users_list = [
-        {
-            "id": user.id,
-            "username": user.username,
-            "role": user.role,
-            "chat_id": user.chat_id,
-            "is_master_admin": user.is_master_admin,
-            "is_banned": user.is_banned,
-            "is_muted": user.is_muted
-        }
-        for user in users
-    ]
-    return jsonify({"users": users_list}), 200
+    try:
+        after = int(request.args.get("after", 0))
+        limit = int(request.args.get("limit", current_app.config["USERS_PAGE_SIZE"]))
+    except ValueError:
+        return jsonify({"error": "after and limit must be integers."}), 400
+    limit = max(1, min(limit, current_app.config["USERS_PAGE_SIZE_MAX"]))
+
+    query = _user_list_query(request.args).where(User.id > after).limit(limit + 1)
+    rows = db.session.execute(query).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    users_list = [_user_row_to_dict(row) for row in rows]
+    next_cursor = rows[-1].id if has_more else None
+    return jsonify({"users": users_list, "next_cursor": next_cursor}), 200
+
+
+# Bulk export of the (filtered) user list as newline-delimited JSON.
+# Rows are streamed from the database in batches instead of built up in memory.
+@bp.route("/all_users/export", methods=["GET"])
+@jwt_required()
+def export_all_users():
+    claims = get_jwt()
+    if claims.get("role") != "admin":
+        return jsonify({"error": "Admins only."}), 403
+
+    query = _user_list_query(request.args).execution_options(yield_per=1000)
+
+    def generate():
+        for row in db.session.execute(query):
+            yield json.dumps(_user_row_to_dict(row)) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+# LOOKUP users by chat_id (admin only)
+# POST {"chat_ids": [...]} -> {"users": {chat_id: {username, is_banned, is_muted} or null}}
+@bp.route("/users/lookup", methods=["POST"])
+@jwt_required()
+def lookup_users():
+    claims = get_jwt()
+    if claims.get("role") != "admin":
+        return jsonify({"error": "Admins only."}), 403
+
+    data = request.get_json(silent=True) or {}
+    chat_ids = data.get("chat_ids")
+    if not isinstance(chat_ids, list) or not all(isinstance(c, str) for c in chat_ids):
+        return jsonify({"error": "chat_ids must be a list of strings."}), 400
+    if len(chat_ids) > current_app.config["USER_LOOKUP_MAX"]:
+        return jsonify({"error": f"At most {current_app.config['USER_LOOKUP_MAX']} chat_ids per lookup."}), 400
+
+    return jsonify({"users": get_users_by_chat_ids(chat_ids)}), 200
 
 # DELETE user (admin only)
 @bp.route("/delete_user", methods=["POST"])
@@ -70,14 +176,24 @@ def delete_user():
     if user.is_master_admin:
         return jsonify({"error": "Cannot delete the master admin."}), 403
 
+    chat_id = user.chat_id
+    user_id = user.id
     db.session.delete(user)
     db.session.commit()
+    invalidate_user_flags(chat_id)
+    dashboard_cache.invalidate()
+    admin_feed.user_changed(username, deleted=True)
+    moderation_versions.set(user_id, None)  # their tokens stop working right away
+    disconnect_user(current_app.extensions["socketio"], chat_id, DISCONNECT_REASONS["deleted"])
 
     return jsonify({"message": f"User '{username}' deleted."}), 200
 
 
-def is_token_revoked(jwt_header, jwt_payload):
-    return jwt_payload["jti"] in blacklisted_tokens
+# What a user's open sockets are told before a moderator drops them
+DISCONNECT_REASONS = {
+    "banned": "You are banned from the system.",
+    "deleted": "Your account has been deleted.",
+}
 
 
 @bp.route("/", methods=["GET"])
@@ -115,13 +231,15 @@ def register():
 
     new_user = User(
         username=username,
-        password=generate_password_hash(password),
+        password=password_hasher.hash(password),
         role=role,
         chat_id=chat_id
     )
     try:
         db.session.add(new_user)
         db.session.commit()
+        invalidate_user_flags(chat_id)  # drop any cached "unknown chat_id"
+        dashboard_cache.invalidate()
         return jsonify({
             "message": f"Registered successfully as '{role}'.",
             "chat_id": chat_id,
@@ -130,6 +248,30 @@ def register():
         db.session.rollback()
         return jsonify({"error": "Username already exists or chat ID conflict"}), 400
 
+# Everything a token needs, without loading the whole User
+TOKEN_COLUMNS = (
+    User.id,
+    User.username,
+    User.role,
+    User.chat_id,
+    User.is_master_admin,
+    User.is_banned,
+    User.moderation_version,
+)
+
+
+def _token_identity(row):
+    moderation_versions.set(row.id, row.moderation_version)
+    return {
+        "user_id": row.id,
+        "username": row.username,
+        "role": row.role,
+        "chat_id": row.chat_id,
+        "is_master_admin": row.is_master_admin,
+        "moderation_version": row.moderation_version,
+    }
+
+
 # LOGIN
 @bp.route("/login", methods=["POST"])
 def login():
@@ -137,7 +279,9 @@ def login():
     username = data.get("username", "").strip()
     password = data.get("password", "")
 
-    user = User.query.filter_by(username=username).first()
+    user = db.session.execute(
+        select(*TOKEN_COLUMNS, User.password).where(User.username == username)
+    ).first()
     
     if user is None:
         return jsonify({"error": "Invalid username or password"}), 401
@@ -145,16 +289,17 @@ def login():
     if user.is_banned:
         return jsonify({"error": "This account has been banned."}), 403
 
-    if not check_password_hash(user.password, password):
+    if not password_hasher.verify(user.password, password):
         return jsonify({"error": "Invalid username or password"}), 401
 
-    identity = {
-        "user_id": user.id,
-        "username": user.username,
-        "role": user.role,
-        "chat_id": user.chat_id,
-        "is_master_admin": user.is_master_admin
-    }
+    # Upgrade hashes made with older cost parameters while we have the plaintext
+    if password_hasher.needs_rehash(user.password):
+        db.session.execute(
+            update(User).where(User.id == user.id).values(password=password_hasher.hash(password))
+        )
+        db.session.commit()
+
+    identity = _token_identity(user)
 
     access_token = create_access_token(identity=identity)
     refresh_token = create_refresh_token(identity=identity)
@@ -192,7 +337,9 @@ def change_role():
         return jsonify({"error": "Cannot change role of another master admin."}), 403
 
     user.role = new_role
+    bump_moderation_version(user)
     db.session.commit()
+    moderation_changed(user)
 
     return jsonify({"message": f"Role for '{username}' updated to '{new_role}'."}), 200
 
@@ -201,19 +348,25 @@ def change_role():
 @bp.route("/token/refresh", methods=["POST"])
 @jwt_required(refresh=True)
 def refresh_access_token():
-    import logging
-    auth_header = request.headers.get("Authorization", None)
-    current_app.logger.debug(f"[DEBUG] Refresh request. Auth: {auth_header}")
     claims = get_jwt()
-    user_id = get_jwt_identity()
-    current_app.logger.debug(f"[DEBUG] Refresh token for user_id={user_id} claims={claims}")
-    access_token = create_access_token(identity={
+    user_id = int(get_jwt_identity())
+    identity = {
         "user_id": user_id,
         "username": claims.get("username"),
         "role": claims.get("role"),
         "chat_id": claims.get("chat_id"),
-        "is_master_admin": claims.get("is_master_admin")
-    })
+        "is_master_admin": claims.get("is_master_admin"),
+        "moderation_version": claims.get("mv", 0),
+    }
+    # Moderated since this refresh token was issued: reissue with fresh claims
+    if get_moderation_version(user_id) != identity["moderation_version"]:
+        row = db.session.execute(select(*TOKEN_COLUMNS).where(User.id == user_id)).first()
+        if row is None:
+            return jsonify({"error": "User no longer exists."}), 401
+        if row.is_banned:
+            return jsonify({"error": "This account has been banned."}), 403
+        identity = _token_identity(row)
+    access_token = create_access_token(identity=identity)
     return jsonify(access_token=access_token), 200
 
 
@@ -221,8 +374,8 @@ def refresh_access_token():
 @bp.route("/logout", methods=["POST"])
 @jwt_required(refresh=True)
 def logout():
-    jti = get_jwt()["jti"]
-    blacklisted_tokens.add(jti)
+    claims = get_jwt()
+    revocation_store.revoke(claims["jti"], claims.get("exp"))
     return jsonify({"message": "Refresh token revoked. Logged out."}), 200
 
 
@@ -257,35 +410,184 @@ def update_password():
         return jsonify({"error": "Password must be at least 6 characters."}), 400
 
     user = User.query.get(user_id)
-    if not user or not check_password_hash(user.password, current_password):
+    if not user or not password_hasher.verify(user.password, current_password):
         return jsonify({"error": "Current password is incorrect."}), 401
 
-    user.password = generate_password_hash(new_password)
+    user.password = password_hasher.hash(new_password)
     db.session.commit()
 
     return jsonify({"message": "Password updated successfully."}), 200
 
 
-# ADMIN-ONLY Reports
+# Columns for report listings; chat_log is left out and fetched per report
+REPORT_LIST_COLUMNS = (
+    Report.id,
+    Report.reporter_id,
+    Report.reported_id,
+    Report.reason,
+    Report.timestamp,
+)
+
+
+def _encode_report_cursor(row):
+    return f"{row.timestamp.isoformat()}_{row.id}"
+
+
+def _decode_report_cursor(cursor):
+    timestamp, _, report_id = cursor.rpartition("_")
+    return datetime.fromisoformat(timestamp), int(report_id)
+
+
+def _parse_datetime_arg(name):
+    value = request.args.get(name)
+    return datetime.fromisoformat(value) if value else None
+
+
+# ADMIN-ONLY Reports, newest first, one page at a time.
+# ?cursor=<next_cursor from the previous page>&limit=<n>
+# Optional filters: reported_id, reporter_id, since, until (ISO 8601).
 @bp.route("/all_reports", methods=["GET"])
 @jwt_required()
 def all_reports():
     claims = get_jwt()
     if claims.get("role") != "admin":
         return jsonify({"error": "Admins only."}), 403
-    reports = Report.query.order_by(Report.timestamp.desc()).all()
+
+    try:
+        limit = int(request.args.get("limit", current_app.config["REPORTS_PAGE_SIZE"]))
+        cursor = request.args.get("cursor")
+        after = _decode_report_cursor(cursor) if cursor else None
+        since = _parse_datetime_arg("since")
+        until = _parse_datetime_arg("until")
+    except ValueError:
+        return jsonify({"error": "Invalid limit, cursor or date."}), 400
+    limit = max(1, min(limit, current_app.config["REPORTS_PAGE_SIZE_MAX"]))
+
+    query = select(*REPORT_LIST_COLUMNS).order_by(Report.timestamp.desc(), Report.id.desc())
+    if after:
+        query = query.where(tuple_(Report.timestamp, Report.id) < after)
+    if request.args.get("reported_id"):
+        query = query.where(Report.reported_id == request.args["reported_id"])
+    if request.args.get("reporter_id"):
+        query = query.where(Report.reporter_id == request.args["reporter_id"])
+    if since:
+        query = query.where(Report.timestamp >= since)
+    if until:
+        query = query.where(Report.timestamp < until)
+
+    rows = db.session.execute(query.limit(limit + 1)).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
     reports_list = [
         {
             "id": r.id,
             "reporter_id": r.reporter_id,
             "reported_id": r.reported_id,
             "reason": r.reason,
-            "chat_log": r.chat_log,
             "timestamp": r.timestamp.isoformat()
         }
-        for r in reports
+        for r in rows
     ]
-    return jsonify({"reports": reports_list}), 200
+    next_cursor = _encode_report_cursor(rows[-1]) if has_more else None
+    return jsonify({"reports": reports_list, "next_cursor": next_cursor}), 200
+
+
+def _build_dashboard():
+    limit = current_app.config["REPORTS_PAGE_SIZE"]
+    rows = db.session.execute(
+        select(*REPORT_LIST_COLUMNS, User.username, User.is_banned, User.is_muted)
+        .outerjoin(User, User.chat_id == Report.reported_id)
+        .order_by(Report.timestamp.desc(), Report.id.desc())
+        .limit(limit + 1)
+    ).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return {
+        "counts": dashboard_counts(),
+        "reports": [
+            {
+                "id": r.id,
+                "reporter_id": r.reporter_id,
+                "reported_id": r.reported_id,
+                "reason": r.reason,
+                "timestamp": r.timestamp.isoformat(),
+                "reported_username": r.username,
+                "reported_is_banned": bool(r.is_banned),
+                "reported_is_muted": bool(r.is_muted),
+            }
+            for r in rows
+        ],
+        "next_cursor": _encode_report_cursor(rows[-1]) if has_more else None,
+    }
+
+
+# ADMIN dashboard: counts and the first page of reports in one response.
+# Sends an ETag; polls with If-None-Match get 304 while nothing has changed,
+# without touching the database. ?cursor pages continue via /all_reports.
+@bp.route("/admin/dashboard", methods=["GET"])
+@jwt_role_required("admin")
+def admin_dashboard():
+    online = presence.online_count()
+    data, etag = dashboard_cache.get(_build_dashboard)
+    etag = f"{etag}-{online}"
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={"ETag": f'"{etag}"', "Cache-Control": "private, no-cache"})
+
+    response = jsonify({**data, "counts": {**data["counts"], "online": online}})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# Single report including its chat log (admin only)
+@bp.route("/reports/<int:report_id>", methods=["GET"])
+@jwt_required()
+def get_report(report_id):
+    claims = get_jwt()
+    if claims.get("role") != "admin":
+        return jsonify({"error": "Admins only."}), 403
+
+    report = db.session.get(Report, report_id, options=[undefer(Report.chat_log)])
+    if report is None:
+        return jsonify({"error": "Report not found."}), 404
+
+    # Server-side history, when the report points at it; read straight from
+    # the referenced byte ranges
+    history = None
+    if report.history_ref:
+        history = message_history.read_ref(report.history_ref, report.reporter_id, report.reported_id)
+
+    return jsonify({
+        "id": report.id,
+        "reporter_id": report.reporter_id,
+        "reported_id": report.reported_id,
+        "reason": report.reason,
+        "chat_log": decode_chat_log(report.chat_log),
+        "history": history,
+        "timestamp": report.timestamp.isoformat()
+    }), 200
+
+
+# Server-side message history between two users, newest first (admin only).
+# ?a=<chat_id>&b=<chat_id>&cursor=<next_cursor from the previous page>&limit=<n>
+@bp.route("/admin/history", methods=["GET"])
+@jwt_role_required("admin")
+def message_history_page():
+    if not current_app.config["HISTORY_ENABLED"]:
+        return jsonify({"error": "Message history is not enabled."}), 404
+    a, b = request.args.get("a"), request.args.get("b")
+    if not a or not b:
+        return jsonify({"error": "Both a and b chat IDs are required."}), 400
+    try:
+        limit = int(request.args.get("limit", current_app.config["HISTORY_PAGE_SIZE"]))
+        limit = max(1, min(limit, current_app.config["HISTORY_PAGE_SIZE_MAX"]))
+        page = message_history.page(a, b, request.args.get("cursor"), limit)
+    except ValueError:
+        return jsonify({"error": "Invalid limit or cursor."}), 400
+    if page is None:
+        return jsonify({"error": "Message history is still loading, try again shortly."}), 503
+    messages, next_cursor = page
+    return jsonify({"messages": messages, "next_cursor": next_cursor}), 200
 
 
 @bp.route("/admin_only", methods=["GET"])
@@ -317,7 +619,11 @@ def ban_user():
         return jsonify({"error": "User not found."}), 404
 
     user.is_banned = True
+    bump_moderation_version(user)
     db.session.commit()
+    moderation_changed(user)
+    admin_feed.user_moderated(user)
+    disconnect_user(current_app.extensions["socketio"], user.chat_id, DISCONNECT_REASONS["banned"])
 
     return jsonify({"message": f"User '{username}' has been banned."}), 200
 
@@ -340,7 +646,10 @@ def mute_user():
         return jsonify({"error": "User not found."}), 404
 
     user.is_muted = True
+    bump_moderation_version(user)
     db.session.commit()
+    moderation_changed(user)
+    admin_feed.user_moderated(user)
 
     return jsonify({"message": f"User '{username}' has been muted."}), 200
 
@@ -363,7 +672,10 @@ def unban_user():
         return jsonify({"error": "User not found."}), 404
 
     user.is_banned = False
+    bump_moderation_version(user)
     db.session.commit()
+    moderation_changed(user)
+    admin_feed.user_moderated(user)
 
     return jsonify({"message": f"User '{username}' has been unbanned."}), 200
 
@@ -386,6 +698,43 @@ def unmute_user():
         return jsonify({"error": "User not found."}), 404
 
     user.is_muted = False
+    bump_moderation_version(user)
     db.session.commit()
+    moderation_changed(user)
+    admin_feed.user_moderated(user)
 
     return jsonify({"message": f"User '{username}' has been unmuted."}), 200
+
+
+# BULK MODERATION (admin only)
+@bp.route("/moderation/bulk", methods=["POST"])
+@jwt_role_required("admin")
+def bulk_moderation():
+    """
+    Body: {"actions": [{"action": "ban" | "unban" | "mute" | "unmute" | "delete",
+                        "username": "..."}, ...]}
+    Everything is applied in one transaction; the response has one result per
+    action, in order, and banned or deleted users are disconnected right away.
+    """
+    data = request.get_json(silent=True) or {}
+    actions = data.get("actions")
+    if not isinstance(actions, list) or not actions:
+        return jsonify({"error": "actions must be a non-empty list."}), 400
+    if len(actions) > current_app.config["MODERATION_BULK_MAX"]:
+        return jsonify({"error": f"At most {current_app.config['MODERATION_BULK_MAX']} actions per request."}), 400
+
+    results, removed = apply_bulk_moderation(actions, get_jwt().get("username"))
+    for r in results:
+        if r["status"] == "ok":
+            column, value = BULK_ACTIONS[r["action"]]
+            admin_feed.user_changed(r["username"], **({column: value} if column else {"deleted": True}))
+
+    socketio = current_app.extensions["socketio"]
+    disconnected = sum(
+        disconnect_user(socketio, chat_id, DISCONNECT_REASONS[why]) for chat_id, why in removed.items()
+    )
+    return jsonify({
+        "results": results,
+        "applied": sum(1 for r in results if r["status"] == "ok"),
+        "disconnected": disconnected,
+    }), 200
@@ -1,58 +1,186 @@
-from flask_socketio import SocketIO, emit
-from flask import request
-from .db import db
-from .models import User, Report
+import logging
+from functools import wraps
+from flask_socketio import SocketIO, emit, disconnect, join_room, leave_room
+from flask import current_app, request
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import PyJWTError
+from .presence import PresenceRegistry
+from .chat_sessions import ChatSessionTable, room_for, binary_room_for
+from .moderation import get_user_flags_by_chat_id
+from .mailbox import mailbox
+from .history import message_history
+from .report_queue import report_queue
+from .admin_feed import admin_feed, ADMIN_ROOM
+from .revocation import is_token_revoked
+from .ratelimit import socket_limiter
+from .metrics import instrumented, socket_events_rejected, socket_connections_refused
+from .connections import connection_manager
+from .logs import log_event
+from .db import released_session
+from .wire import BINARY, JSON, encode_message, decode_client_message
 
-connected_users = {}  # {chat_id: socket.sid}
+log = logging.getLogger(__name__)
 
-def get_user_flags_by_chat_id(chat_id):
+presence = PresenceRegistry()  # sid <-> chat_id, O(1) both ways
+chat_sessions = ChatSessionTable()  # pending requests and accepted pairs
+
+# Per-event flood control, limits from Config.SOCKET_RATE_LIMITS
+def rate_limited(event):
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            sid = request.sid
+            connection_manager.touch(sid)
+            if not socket_limiter.allow(sid, presence.chat_id_for(sid), event):
+                socket_events_rejected.inc(event)
+                emit("error", {"error": "You are sending too fast. Please slow down."}, to=sid)
+                if socket_limiter.should_disconnect(sid):
+                    log_event(log, logging.WARNING, "socket.flood_disconnect", sid=sid, socket_event=event)
+                    disconnect()
+                return
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
+
+def disconnect_user(socketio, chat_id, reason):
+    """
+    Tells every live socket of chat_id why, then drops it. Works from HTTP
+    routes, and reaches sockets on other workers through the client manager.
+    Returns how many sockets were disconnected.
+    """
+    sids = presence.sids_for(chat_id)
+    if sids:
+        socketio.emit("error", {"error": reason}, to=sids)
+        for sid in sids:
+            socketio.server.disconnect(sid)
+    return len(sids)
+
+def verified_claims(token):
+    """Claims of a valid, unrevoked access token sent over the socket, else None."""
+    if not isinstance(token, str) or not token:
+        return None
+    try:
+        claims = decode_token(token)
+    except (JWTExtendedException, PyJWTError):
+        return None
+    if claims.get("type") != "access" or is_token_revoked(None, claims):
+        return None
+    return claims
+
+def _join_chat(session_id, sid):
+    """Puts sid in the session's room for its wire format."""
+    if presence.wants_binary(sid):
+        join_room(binary_room_for(session_id), sid=sid)
+    else:
+        join_room(room_for(session_id), sid=sid)
+
+def _end_chat(socketio, session_id, ended_by, skip_sid=None, reason="ended"):
+    """
+    Tells the room the chat is over and closes it. Caller has already ended
+    session_id. reason is "ended" or "offline"; after "offline" the partner
+    can still leave messages by recipient (see handle_private_message).
+    """
+    rooms = [room_for(session_id), binary_room_for(session_id)]
+    socketio.emit("chat_ended_notice", {"from": ended_by, "session_id": session_id, "reason": reason},
+                  to=rooms, skip_sid=skip_sid)
+    for room in rooms:
+        socketio.close_room(room)
+
+def forget_socket(socketio, sid):
     """
-    Looks up whether the user is banned or muted by their chat_id.
-    Returns dict like {"is_banned": 0, "is_muted": 1}
+    Drops everything kept for sid and ends the user's chats if it was their
+    last socket. Runs on disconnect, and from the connection sweeper for a
+    sid whose disconnect handler never ran.
     """
-    user = User.query.filter_by(chat_id=chat_id).first()
-    if user:
-        return {"is_banned": user.is_banned, "is_muted": user.is_muted}
-    return None
+    connection_manager.forget(sid)
+    admin_feed.unsubscribe(sid)
+    socket_limiter.forget_sid(sid)
+    chat_id, went_offline = presence.disconnect(sid)
+    if went_offline:
+        socket_limiter.forget_chat_id(chat_id)
+        for session_id, _partner in chat_sessions.went_offline(chat_id):
+            _end_chat(socketio, session_id, chat_id, reason="offline")
+        log_event(log, logging.INFO, "socket.offline", chat_id=chat_id)
 
 def register_socket_handlers(socketio):
     @socketio.on("connect")
-    def handle_connect():
-        print(f"[Socket] Connected: {request.sid}")
+    @instrumented("connect")
+    @released_session
+    def handle_connect(auth=None):
+        if not connection_manager.admit(request.sid):
+            socket_connections_refused.inc("worker")
+            log_event(log, logging.WARNING, "socket.refused", sid=request.sid, limit="worker")
+            return False
+        presence.connect(request.sid)
+        log_event(log, logging.DEBUG, "socket.connect", sid=request.sid)
 
     @socketio.on("disconnect")
-    def handle_disconnect():
-        for chat_id, sid in list(connected_users.items()):
-            if sid == request.sid:
-                print(f"[-] {chat_id} disconnected")
-                del connected_users[chat_id]
+    @instrumented("disconnect")
+    @released_session
+    def handle_disconnect(reason=None):
+        # Flask-SocketIO 5.5+ passes why the socket went away
+        forget_socket(socketio, request.sid)
 
     @socketio.on("identify")
+    @instrumented("identify")
+    @released_session
+    @rate_limited("identify")
     def handle_identify(data):
-        chat_id = data.get("chat_id")
-        if chat_id:
-            flags = get_user_flags_by_chat_id(chat_id)
-            if flags:
-                if flags["is_banned"]:
-                    print(f"[!] Banned user {chat_id} tried to connect. Disconnecting.")
-                    emit("error", {"error": "You are banned from the system."}, to=request.sid)
-                    socketio.disconnect(request.sid)
-                    return
-            connected_users[chat_id] = request.sid
-            print(f"[+] {chat_id} is now connected with sid {request.sid}")
+        # Who this socket is comes from the access token, never from a
+        # client-supplied chat_id. A valid token also means the user hasn't
+        # been banned since it was issued (see is_token_revoked).
+        claims = verified_claims((data or {}).get("access_token"))
+        chat_id = claims.get("chat_id") if claims else None
+        if not chat_id:
+            log_event(log, logging.INFO, "socket.identify_rejected", sid=request.sid)
+            emit("identify_error", {"error": "Invalid or expired access token."}, to=request.sid)
+            return
+        if presence.chat_id_for(request.sid) != chat_id and \
+                not connection_manager.user_has_room(len(presence.sids_for(chat_id))):
+            socket_connections_refused.inc("user")
+            log_event(log, logging.WARNING, "socket.refused", chat_id=chat_id, limit="user")
+            emit("error", {"error": "Too many open connections for this account."}, to=request.sid)
+            disconnect()
+            return
+
+        # Clients that know about wire formats ask for one; others get JSON
+        wire = data.get("wire")
+        presence.identify(request.sid, chat_id, binary=wire == BINARY)
+        log_event(log, logging.INFO, "socket.identify", chat_id=chat_id, sid=request.sid)
+        if wire is not None:
+            emit("wire_format", {"wire": BINARY if wire == BINARY else JSON}, to=request.sid)
+
+        # A new tab joins the chats the user already has open
+        for session_id in chat_sessions.sessions_for(chat_id):
+            _join_chat(session_id, request.sid)
+
+        # Everything sent while they were away, in one emit
+        waiting = mailbox.take(chat_id)
+        if waiting:
+            emit("offline_messages", {"messages": waiting}, to=request.sid)
 
     @socketio.on("private_message")
+    @instrumented("private_message")
+    @released_session
+    @rate_limited("private_message")
     def handle_private_message(data):
+        if isinstance(data, (bytes, bytearray)):
+            data = decode_client_message(data)
+            if data is None:
+                emit("error", {"error": "Malformed message."}, to=request.sid)
+                return
+        session_id = data.get("session_id")
         recipient_id = data.get("recipient")
         message = data.get("message")
         sender_sid = request.sid
+        max_length = current_app.config["MESSAGE_MAX_LENGTH"]
+        if not isinstance(message, str) or not message or len(message) > max_length:
+            emit("error", {"error": f"Messages must be text of at most {max_length} characters."},
+                 to=sender_sid)
+            return
 
-        sender_id = None
-        for cid, sid in connected_users.items():
-            if sid == sender_sid:
-                sender_id = cid
-                break
-
+        sender_id = presence.chat_id_for(sender_sid)
         if not sender_id:
             emit("error", {"error": "Sender not identified"})
             return
@@ -60,84 +188,170 @@ def register_socket_handlers(socketio):
         # Check if sender is muted
         flags = get_user_flags_by_chat_id(sender_id)
         if flags and flags["is_muted"]:
-            print(f"[!] Muted user {sender_id} tried to send message.")
+            log_event(log, logging.INFO, "socket.muted_message", chat_id=sender_id)
             emit("error", {"error": "You are muted and cannot send messages."}, to=sender_sid)
             return
 
-        recipient_sid = connected_users.get(recipient_id)
-        if recipient_sid:
-            emit("private_message", {
-                "sender": sender_id,
-                "message": message
-            }, to=recipient_sid)
+        # Older clients name the recipient; that only reaches a live user
+        # they already have an accepted chat with
+        if not isinstance(recipient_id, str):
+            recipient_id = None
+        if not session_id and recipient_id:
+            session_id = chat_sessions.session_between(sender_id, recipient_id)
+
+        if session_id:
+            partner_id = chat_sessions.partner(session_id, sender_id)
+            if partner_id is None:
+                emit("error", {"error": "That chat has ended or isn't yours."}, to=sender_sid)
+                return
+            message_history.append(sender_id, partner_id, message)
+            # The rooms hold both users' sockets; the sender's other tabs see it too
+            payload = {"sender": sender_id, "message": message, "session_id": session_id}
+            emit("private_message", payload, to=room_for(session_id), skip_sid=sender_sid)
+            if presence.has_binary_sockets():
+                frame = encode_message(sender_id, session_id, message)
+                emit("private_message", payload if frame is None else frame,
+                     to=binary_room_for(session_id), skip_sid=sender_sid)
+        elif not recipient_id or presence.is_online(recipient_id) or \
+                not chat_sessions.are_contacts(sender_id, recipient_id):
+            emit("error", {"error": "Start a chat with that user first."}, to=sender_sid)
+        elif get_user_flags_by_chat_id(recipient_id) is not None:
+            # Someone they chatted with, just offline: hold it until they identify
+            mailbox.enqueue(recipient_id, sender_id, message)
+            message_history.append(sender_id, recipient_id, message)
         else:
-            print(f"[!] Recipient not online: {recipient_id}")
+            log_event(log, logging.DEBUG, "socket.recipient_unknown", recipient=recipient_id)
 
     @socketio.on("message_request")
+    @instrumented("message_request")
+    @released_session
+    @rate_limited("message_request")
     def handle_message_request(data):
         target_chat_id = data.get("target")
         sender_sid = request.sid
 
-        # Find sender's chat ID
-        sender_id = next((cid for cid, sid in connected_users.items() if sid == sender_sid), None)
+        sender_id = presence.chat_id_for(sender_sid)
 
         if not sender_id or not target_chat_id:
             return
 
-        recipient_sid = connected_users.get(target_chat_id)
-        if not recipient_sid:
+        recipient_sids = presence.sids_for(target_chat_id)
+        if not recipient_sids:
             emit("request_result", {"status": "offline"}, to=sender_sid)
         else:
-            emit("request_received", {"from": sender_id}, to=recipient_sid)
+            chat_sessions.request(sender_id, target_chat_id)
+            emit("request_received", {"from": sender_id}, to=recipient_sids)
 
     @socketio.on("request_response")
+    @instrumented("request_response")
+    @released_session
+    @rate_limited("request_response")
     def handle_request_response(data):
         accepted = data.get("accepted")
         requester_id = data.get("to")  # Chat ID of the original requester
         responder_sid = request.sid
 
-        responder_id = next((cid for cid, sid in connected_users.items() if sid == responder_sid), None)
-        requester_sid = connected_users.get(requester_id)
+        responder_id = presence.chat_id_for(responder_sid)
+        requester_sids = presence.sids_for(requester_id)
 
-        if not responder_id or not requester_sid:
+        if not responder_id or not requester_sids:
             return
 
+        if not accepted:
+            if chat_sessions.decline(requester_id, responder_id):
+                emit("request_result", {"status": "rejected", "by": responder_id}, to=requester_sids)
+            return
+
+        # Only a request that was really sent, and hasn't expired, can be accepted
+        session_id = chat_sessions.accept(requester_id, responder_id)
+        if session_id is None:
+            emit("error", {"error": "That chat request is no longer valid."}, to=responder_sid)
+            return
+
+        for sid in requester_sids + presence.sids_for(responder_id):
+            _join_chat(session_id, sid)
+        emit("chat_started", {"session_id": session_id, "partner": requester_id},
+             to=presence.sids_for(responder_id))
         emit("request_result", {
-            "status": "accepted" if accepted else "rejected",
-            "by": responder_id
-        }, to=requester_sid)
+            "status": "accepted",
+            "by": responder_id,
+            "session_id": session_id,
+        }, to=requester_sids)
 
     @socketio.on("chat_ended_notice")
+    @instrumented("chat_ended_notice")
+    @released_session
+    @rate_limited("chat_ended_notice")
     def handle_chat_end(data):
-        partner_id = data.get("recipient")  # who to notify
-
-        partner_sid = connected_users.get(partner_id)
-        sender_sid = request.sid
-
-        sender_id = next((cid for cid, sid in connected_users.items() if sid == sender_sid), None)
+        session_id = data.get("session_id")
+        sender_id = presence.chat_id_for(request.sid)
+        if not sender_id:
+            return
+        recipient_id = data.get("recipient")
+        if not isinstance(recipient_id, str):
+            recipient_id = None
+        if not session_id and recipient_id:  # older clients, or a partner who went offline
+            session_id = chat_sessions.session_between(sender_id, recipient_id)
 
-        if partner_sid and sender_id:
-            print(f"{sender_id} ended chat with {partner_id}")
-            emit("chat_ended_notice", {"from": sender_id}, to=partner_sid)
+        partner_id = chat_sessions.partner(session_id, sender_id)
+        if partner_id is None:
+            if recipient_id:
+                chat_sessions.drop_contact(sender_id, recipient_id)  # no more offline messages
+            return
+        chat_sessions.end(session_id)
+        log_event(log, logging.INFO, "socket.chat_ended", chat_id=sender_id, partner=partner_id)
+        _end_chat(socketio, session_id, sender_id, skip_sid=request.sid)
 
     @socketio.on("report_user")
+    @instrumented("report_user")
+    @released_session
+    @rate_limited("report_user")
     def handle_report_user(data):
         reporter_id = data.get("reporter_id")
         reported_id = data.get("reported_id")
         reason = data.get("reason")
         chat_log = data.get("chat_log", "")  # Optional
 
-        try:
-            new_report = Report(
-                reporter_id=reporter_id,
-                reported_id=reported_id,
-                reason=reason,
-                chat_log=chat_log
-            )
-            db.session.add(new_report)
-            db.session.commit()
-            # Optionally notify admins or emit event here
-        except Exception as e:
-            db.session.rollback()
-            print(f"[Error] Could not save report: {e}")
-            emit("error", {"error": "Failed to submit report."}, to=request.sid)
+        error = report_queue.invalid(reporter_id, reported_id, reason, chat_log)
+        if error:
+            emit("error", {"error": f"Failed to submit report. {error}"}, to=request.sid)
+            return
+
+        # With server-side history the report points at what was actually
+        # relayed between the two, instead of storing the client's copy
+        history_ref = None
+        if presence.chat_id_for(request.sid) == reporter_id:
+            history_ref = message_history.ref_for(reporter_id, reported_id)
+        if history_ref is not None:
+            chat_log = None
+
+        # Written to the database in batches by report_queue's background task
+        if not report_queue.submit(reporter_id, reported_id, reason, chat_log, history_ref):
+            log_event(log, logging.WARNING, "reports.queue_full", reporter=reporter_id)
+            emit("error", {"error": "Too many reports right now, please try again shortly."}, to=request.sid)
+
+    @socketio.on("admin_subscribe")
+    @instrumented("admin_subscribe")
+    @released_session
+    @rate_limited("admin_subscribe")
+    def handle_admin_subscribe(data):
+        """
+        {"access_token": ...} from an admin: the socket joins the admin room
+        and gets "admin_feed" frames (see app/admin_feed.py) until it sends
+        admin_unsubscribe or the token stops being valid.
+        """
+        claims = verified_claims((data or {}).get("access_token"))
+        if claims is None or claims.get("role") != "admin":
+            emit("error", {"error": "Admins only."}, to=request.sid)
+            return
+        join_room(ADMIN_ROOM)
+        admin_feed.subscribe(request.sid, claims)
+        log_event(log, logging.INFO, "socket.admin_subscribe", sid=request.sid, user=claims.get("username"))
+        emit("admin_feed_subscribed", {"interval": admin_feed.interval}, to=request.sid)
+
+    @socketio.on("admin_unsubscribe")
+    @instrumented("admin_unsubscribe")
+    @released_session
+    def handle_admin_unsubscribe(data=None):
+        if admin_feed.unsubscribe(request.sid):
+            leave_room(ADMIN_ROOM)
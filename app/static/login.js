@@ -2,7 +2,50 @@
 
 let socket = null;
 let currentChatPartnerId = null;
+let currentSessionId = null;  // server-side chat session, set once a request is accepted
 const BASE_URL = window.location.origin; 
+const WIRE_FORMAT = "binary";  // asked for on identify; "json" keeps private_message as JSON text
+let binaryFrames = false;      // true once the server confirms on "wire_format"
+
+// Binary private_message frames (see app/wire.py):
+//   server -> client  version:u8  sender:u32  session_id:8 bytes  message:utf-8
+//   client -> server  version:u8  session_id:8 bytes  message:utf-8
+const FRAME_VERSION = 1;
+const textDecoder = new TextDecoder();
+const textEncoder = new TextEncoder();
+
+function decodeMessageFrame(buffer) {
+  const view = new DataView(buffer);
+  if (view.getUint8(0) !== FRAME_VERSION) return null;
+  const session = new Uint8Array(buffer, 5, 8);
+  return {
+    sender: view.getUint32(1).toString(16).padStart(8, "0"),
+    session_id: Array.from(session, b => b.toString(16).padStart(2, "0")).join(""),
+    message: textDecoder.decode(new Uint8Array(buffer, 13))
+  };
+}
+
+function encodeMessageFrame(sessionId, text) {
+  const body = textEncoder.encode(text);
+  const frame = new Uint8Array(9 + body.length);
+  frame[0] = FRAME_VERSION;
+  for (let i = 0; i < 8; i++) {
+    frame[1 + i] = parseInt(sessionId.substr(i * 2, 2), 16);
+  }
+  frame.set(body, 9);
+  return frame.buffer;
+}
+
+function sendChatMessage(text) {
+  if (!currentSessionId) {
+    // Partner went offline: the server keeps it for them if we're contacts
+    socket.emit("private_message", { recipient: currentChatPartnerId, message: text });
+    return;
+  }
+  socket.emit("private_message", binaryFrames
+    ? encodeMessageFrame(currentSessionId, text)
+    : { session_id: currentSessionId, message: text });
+}
 
 function setLoginState(isLoggedIn, userData = null) {
   document.getElementById("loginForm").style.display = isLoggedIn ? "none" : "block";
@@ -32,15 +75,18 @@ function setLoginState(isLoggedIn, userData = null) {
   }
 }
 
+function lookupUsersByChatIds(chatIds) {
+  // Resolves with { chat_id: { username, is_banned, is_muted } | null } in one round trip
+  return apiFetchWithRefresh(`${BASE_URL}/users/lookup`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ chat_ids: [...new Set(chatIds)] }),
+  }).then(data => data.users || {});
+}
+
 function fetchUsernameByChatId(chatId) {
   // Returns a Promise that resolves with { username, ... }, or null if not found
-  return apiFetchWithRefresh(`${BASE_URL}/all_users`)
-    .then(data => {
-      if (data.users && data.users.length > 0) {
-        return data.users.find(user => user.chat_id === chatId) || null;
-      }
-      return null;
-    });
+  return lookupUsersByChatIds([chatId]).then(users => users[chatId] || null);
 }
 
 function showSection(sectionId) {
@@ -201,13 +247,65 @@ document.addEventListener("DOMContentLoaded", () => {
         // Connect to socket AFTER login
         socket = io(BASE_URL);  // or whatever your server hostname is
 
+        // The server takes our chat_id from the access token
+        let identifyRetried = false;
+        const identifySocket = () => socket.emit("identify", {
+          access_token: localStorage.getItem("access_token"),
+          wire: WIRE_FORMAT
+        });
+
         socket.on("connect", () => {
-          socket.emit("identify", { chat_id: user.chat_id });
+          binaryFrames = false;
+          identifyRetried = false;
+          identifySocket();
+          if (document.getElementById("adminSection").style.display !== "none") {
+            subscribeAdminFeed();  // reconnected with the admin panel open
+          }
+        });
+
+        socket.on("identify_error", () => {
+          if (identifyRetried) {
+            showToast("Chat authentication failed. Please log in again.", "error");
+            return;
+          }
+          // Usually an access token that expired while we were away: any
+          // authenticated request refreshes it, then identify again
+          identifyRetried = true;
+          apiFetchWithRefresh(`${BASE_URL}/users`)
+            .then(identifySocket)
+            .catch(() => showToast("Chat authentication failed. Please log in again.", "error"));
+        });
+
+        // Admin panel updates pushed by the server (see app/admin_feed.py)
+        socket.on("admin_feed_subscribed", () => { adminFeedActive = true; });
+        socket.on("admin_feed", applyAdminFeed);
+        socket.on("admin_feed_closed", () => {
+          // Usually an expired access token: reloading the dashboard refreshes it
+          adminFeedActive = false;
+          loadDashboard().then(subscribeAdminFeed);
+        });
+
+        socket.on("wire_format", ({ wire }) => {
+          binaryFrames = wire === "binary";
         });
 
         // Place all listeners right after socket is initialized
-        socket.on("private_message", ({ sender, message }) => {
-          appendMessage(sender, message);
+        socket.on("private_message", (data) => {
+          // Binary frames arrive as an ArrayBuffer, anything else as JSON
+          const decoded = data instanceof ArrayBuffer ? decodeMessageFrame(data) : data;
+          if (!decoded) return;
+          const { sender, message } = decoded;
+          // Our own messages arrive here too when sent from another tab
+          appendMessage(sender === user.chat_id ? "You" : sender, message);
+        });
+
+        // Messages that arrived while this user was offline, delivered in one batch
+        socket.on("offline_messages", ({ messages }) => {
+          if (!messages || messages.length === 0) return;
+          messages.forEach(({ sender, message, timestamp }) => {
+            appendMessage(sender, `${message} (${new Date(timestamp + "Z").toLocaleString()})`);
+          });
+          showToast(`You have ${messages.length} message(s) received while offline.`, "info");
         });
 
         socket.on("request_received", ({ from }) => {
@@ -219,6 +317,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
           if (accept) {
             currentChatPartnerId = from;
+            currentSessionId = null;  // set by "chat_started"
             document.getElementById("currentChatUser").textContent = from;
             document.getElementById("chatWithBox").style.display = "block";
             document.getElementById("chatWindow").style.display = "block";
@@ -229,15 +328,34 @@ document.addEventListener("DOMContentLoaded", () => {
           }
         });
 
+        // Sent to the accepting side once the server has paired us
+        socket.on("chat_started", ({ session_id, partner }) => {
+          currentSessionId = session_id;
+          currentChatPartnerId = partner;
+        });
+
+        // Server-side rejections (muted, rate limited, ...)
+        socket.on("error", ({ error }) => {
+          showToast(error || "Something went wrong.", "error");
+        });
+
         socket.on("disconnect", () => {
+          adminFeedActive = false;
           showToast("Disconnected from chat server.", "error");
         });
 
-        socket.on("chat_ended_notice", ({ from }) => {
+        socket.on("chat_ended_notice", ({ from, reason }) => {
+          if (reason === "offline" && from === currentChatPartnerId) {
+            // Keep the window open; messages now wait in their mailbox
+            currentSessionId = null;
+            appendMessage("system", `User ${from} went offline. New messages will be delivered when they return.`);
+            return;
+          }
           appendMessage("system", `User ${from} has ended the chat.`);
 
           // Gracefully end the session
           currentChatPartnerId = null;
+          currentSessionId = null;
           document.getElementById("chatWithBox").style.display = "none";
           document.getElementById("chatWindow").style.display = "none";
           document.getElementById("reportChatBtn").style.display = "none";
@@ -247,9 +365,10 @@ document.addEventListener("DOMContentLoaded", () => {
         });
 
 
-        socket.on("request_result", ({ status, by }) => {
+        socket.on("request_result", ({ status, by, session_id }) => {
           if (status === "accepted") {
             currentChatPartnerId = by;
+            currentSessionId = session_id;
             document.getElementById("currentChatUser").textContent = by;
             document.getElementById("chatWithBox").style.display = "block";
             document.getElementById("chatWindow").style.display = "block";
@@ -333,204 +452,385 @@ document.addEventListener("DOMContentLoaded", () => {
     navChat.addEventListener("click", () => showSection("chatSection"));
   }
 
-  document.getElementById("navAdmin").addEventListener("click", () => {
-    showSection("adminSection");
+  // Reports are paged newest-first; chat logs are fetched only when opened.
+  let reportsNextCursor = null;
+
+  function reportRowHtml(r, reportedUser) {
+    const reportedUsername = reportedUser ? reportedUser.username : "[Unknown]";
+    const isBanned = reportedUser ? reportedUser.is_banned : 0;
+    const isMuted = reportedUser ? reportedUser.is_muted : 0;
+    return `
+      <tr>
+        <td>${r.id}</td>
+        <td>${r.reporter_id}</td>
+        <td>${r.reported_id}</td>
+        <td>${reportedUsername}</td>
+        <td>${r.timestamp}</td>
+        <td>${r.reason}</td>
+        <td class="chatLogCell"><button class="viewLogBtn" data-report-id="${r.id}">View</button></td>
+        <td>
+          ${reportedUser
+            ? `<button class="banUserBtn" data-username="${reportedUsername}">${isBanned ? "Unban" : "Ban"}</button>
+              <button class="muteUserBtn" data-username="${reportedUsername}">${isMuted ? "Unmute" : "Mute"}</button>`
+            : `<span style="color:#888;">No actions</span>`}
+        </td>
+      </tr>`;
+  }
+
+  function attachModerationButton(btn, actions) {
+    btn.addEventListener("click", function() {
+      const username = this.dataset.username;
+      const action = this.textContent.trim().toLowerCase();
+      const url = actions[action];
+      if (confirm(`Are you sure you want to ${action} '${username}'?`)) {
+        apiFetchWithRefresh(`${BASE_URL}/${url}`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({ username })
+        })
+        .then(res => {
+          showToast(res.message || res.error || "Unexpected response", res.error ? "error" : "success");
+        })
+        .catch(err => {
+          console.error(err);
+          showToast("Failed to process request", "error");
+        });
+      }
+    });
+  }
+
+  function attachReportRowHandlers(table) {
+    table.querySelectorAll(".viewLogBtn:not([data-bound])").forEach(btn => {
+      btn.dataset.bound = "1";
+      btn.addEventListener("click", function() {
+        const cell = this.closest(".chatLogCell");
+        cell.textContent = "Loading...";
+        apiFetchWithRefresh(`${BASE_URL}/reports/${this.dataset.reportId}`)
+          .then(report => {
+            if (report.history) {
+              // Server-side history: what was actually relayed between the two
+              cell.style.whiteSpace = "pre-wrap";
+              cell.textContent = report.history.length
+                ? report.history.map(m => `[${m.timestamp}] ${m.sender}: ${m.message}`).join("\n")
+                : "Empty";
+              return;
+            }
+            cell.innerHTML = report.chat_log ? report.chat_log.replace(/\n/g, "<br>") : "<em>Empty</em>";
+          })
+          .catch(() => { cell.textContent = "Failed to load."; });
+      });
+    });
+
+    table.querySelectorAll(".banUserBtn:not([data-bound])").forEach(btn => {
+      btn.dataset.bound = "1";
+      attachModerationButton(btn, { ban: "ban_user", unban: "unban_user" });
+    });
 
+    table.querySelectorAll(".muteUserBtn:not([data-bound])").forEach(btn => {
+      btn.dataset.bound = "1";
+      attachModerationButton(btn, { mute: "mute_user", unmute: "unmute_user" });
+    });
+  }
+
+  const REPORTS_TABLE_HTML = `
+    <table><tbody>
+    <tr>
+      <th>ID</th>
+      <th>Reporter</th>
+      <th>Reported Chat ID</th>
+      <th>Reported Username</th>
+      <th>Time</th>
+      <th>Reason</th>
+      <th>Chat Log</th>
+      <th>Actions</th>
+    </tr></tbody></table>`;
+
+  function loadReportsPage(reset) {
     const reportItems = document.getElementById("reportItems");
+    const loadMoreBtn = document.getElementById("loadMoreReportsBtn");
     if (!reportItems) return;
-    reportItems.textContent = "Loading reports...";
 
-    apiFetchWithRefresh(`${BASE_URL}/all_reports`)
+    if (reset) {
+      reportsNextCursor = null;
+      reportItems.textContent = "Loading reports...";
+    }
+    const query = reportsNextCursor ? `?cursor=${encodeURIComponent(reportsNextCursor)}` : "";
+
+    apiFetchWithRefresh(`${BASE_URL}/all_reports${query}`)
       .then(reportData => {
-        if (!reportData.reports || reportData.reports.length === 0) {
+        const reports = reportData.reports || [];
+        if (reset && reports.length === 0) {
           reportItems.textContent = "No reports found.";
+          loadMoreBtn.style.display = "none";
           return;
         }
 
-        // Also fetch all users so we can map chat_id -> username and ban/mute status
-        apiFetchWithRefresh(`${BASE_URL}/all_users`)
-          .then(userData => {
-            const users = userData.users || [];
-
-            let html = `
-              <table>
-              <tr>
-                <th>ID</th>
-                <th>Reporter</th>
-                <th>Reported Chat ID</th>
-                <th>Reported Username</th>
-                <th>Time</th>
-                <th>Reason</th>
-                <th>Chat Log</th>
-                <th>Actions</th>
-              </tr>`;
-
-            reportData.reports.forEach(r => {
-              const reportedUser = users.find(u => u.chat_id === r.reported_id);
-              const reportedUsername = reportedUser ? reportedUser.username : "[Unknown]";
-              const isBanned = reportedUser ? reportedUser.is_banned : 0;
-              const isMuted = reportedUser ? reportedUser.is_muted : 0;
-
-              html += `
-                <tr>
-                  <td>${r.id}</td>
-                  <td>${r.reporter_id}</td>
-                  <td>${r.reported_id}</td>
-                  <td>${reportedUsername}</td>
-                  <td>${r.timestamp}</td>
-                  <td>${r.reason}</td>
-                  <td>${r.chat_log ? r.chat_log.replace(/\n/g, "<br>") : ""}</td>
-                  <td>
-                    ${reportedUser 
-                      ? `<button class="banUserBtn" data-username="${reportedUsername}">${isBanned ? "Unban" : "Ban"}</button>
-                        <button class="muteUserBtn" data-username="${reportedUsername}">${isMuted ? "Unmute" : "Mute"}</button>`
-                      : `<span style="color:#888;">No actions</span>`}
-                  </td>
-                </tr>`;
-            });
-
-            html += "</table>";
-            reportItems.innerHTML = html;
-
-            // Attach Ban/Unban handlers
-            document.querySelectorAll(".banUserBtn").forEach(btn => {
-              btn.addEventListener("click", function() {
-                const username = this.dataset.username;
-                const action = this.textContent.trim().toLowerCase();
-                const url = action === "ban" ? "ban_user" : "unban_user";
-                if (confirm(`Are you sure you want to ${action} '${username}'?`)) {
-                  apiFetchWithRefresh(`${BASE_URL}/${url}`, {
-                    method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({ username })
-                  })
-                  .then(res => {
-                    showToast(res.message || res.error || "Unexpected response", res.error ? "error" : "success");
-                  })
-                  .catch(err => {
-                    console.error(err);
-                    showToast("Failed to process request", "error");
-                  });
-                }
-              });
-            });
-
-            // Attach Mute/Unmute handlers
-            document.querySelectorAll(".muteUserBtn").forEach(btn => {
-              btn.addEventListener("click", function() {
-                const username = this.dataset.username;
-                const action = this.textContent.trim().toLowerCase();
-                const url = action === "mute" ? "mute_user" : "unmute_user";
-                if (confirm(`Are you sure you want to ${action} '${username}'?`)) {
-                  apiFetchWithRefresh(`${BASE_URL}/${url}`, {
-                    method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({ username })
-                  })
-                  .then(res => {
-                    showToast(res.message || res.error || "Unexpected response", res.error ? "error" : "success");
-                  })
-                  .catch(err => {
-                    console.error(err);
-                    showToast("Failed to process request", "error");
-                  });
-                }
-              });
-            });
+        // Resolve just the reported chat_ids -> username and ban/mute status
+        return lookupUsersByChatIds(reports.map(r => r.reported_id))
+          .then(users => {
+            if (reset) {
+              reportItems.innerHTML = REPORTS_TABLE_HTML;
+            }
+            const tbody = reportItems.querySelector("tbody");
+            tbody.insertAdjacentHTML("beforeend", reports.map(r => reportRowHtml(r, users[r.reported_id])).join(""));
+            attachReportRowHandlers(tbody);
 
+            reportsNextCursor = reportData.next_cursor;
+            loadMoreBtn.style.display = reportsNextCursor ? "inline-block" : "none";
           });
       })
       .catch(() => {
         reportItems.textContent = "Error loading reports.";
       });
+  }
+
+  // Admin dashboard: counts and the first page of reports (usernames already
+  // resolved) in one request. After that the socket's admin feed pushes new
+  // reports, ban/mute changes and counts; polling with If-None-Match (a 304
+  // when nothing changed) is only the fallback while the feed isn't running.
+  // "Load more" continues from next_cursor via /all_reports.
+  const DASHBOARD_POLL_MS = 15000;
+  let dashboardEtag = null;
+  let dashboardTimer = null;
+  let dashboardCounts = {};
+  let adminFeedActive = false;
+
+  function renderCounts() {
+    const c = dashboardCounts;
+    document.getElementById("dashboardCounts").textContent =
+      `Users: ${c.users} · Banned: ${c.banned} · Muted: ${c.muted} · ` +
+      `Open reports: ${c.open_reports} of ${c.reports} · Online now: ${c.online}`;
+  }
+
+  function reportedUserOf(r) {
+    return r.reported_username ? {
+      username: r.reported_username,
+      is_banned: r.reported_is_banned,
+      is_muted: r.reported_is_muted
+    } : null;
+  }
+
+  function renderDashboard(data) {
+    dashboardCounts = { ...data.counts };
+    renderCounts();
+
+    const reportItems = document.getElementById("reportItems");
+    const loadMoreBtn = document.getElementById("loadMoreReportsBtn");
+    const reports = data.reports || [];
+    if (reports.length === 0) {
+      reportItems.textContent = "No reports found.";
+      loadMoreBtn.style.display = "none";
+      return;
+    }
+    reportItems.innerHTML = REPORTS_TABLE_HTML;
+    const tbody = reportItems.querySelector("tbody");
+    tbody.insertAdjacentHTML("beforeend", reports.map(r => reportRowHtml(r, reportedUserOf(r))).join(""));
+    attachReportRowHandlers(tbody);
+
+    reportsNextCursor = data.next_cursor;
+    loadMoreBtn.style.display = reportsNextCursor ? "inline-block" : "none";
+  }
+
+  function loadDashboard() {
+    const headers = { "Authorization": "Bearer " + localStorage.getItem("access_token") };
+    if (dashboardEtag) headers["If-None-Match"] = dashboardEtag;
+    return fetch(`${BASE_URL}/admin/dashboard`, { headers })
+      .then(res => {
+        if (res.status === 304) return;  // nothing changed
+        if (res.status === 401 || res.status === 422) {
+          // Expired access token: the shared helper refreshes it
+          dashboardEtag = null;
+          return apiFetchWithRefresh(`${BASE_URL}/admin/dashboard`).then(renderDashboard);
+        }
+        if (!res.ok) throw new Error("Dashboard request failed");
+        dashboardEtag = res.headers.get("ETag");
+        return res.json().then(renderDashboard);
+      })
+      .catch(() => {
+        document.getElementById("reportItems").textContent = "Error loading reports.";
+      });
+  }
+
+  function subscribeAdminFeed() {
+    if (socket && socket.connected) {
+      socket.emit("admin_subscribe", { access_token: localStorage.getItem("access_token") });
+    }
+  }
+
+  function applyAdminFeed(frame) {
+    if (frame.counts) Object.assign(dashboardCounts, frame.counts);
+    if (frame.online !== undefined) dashboardCounts.online = frame.online;
+    if (frame.counts || frame.online !== undefined) renderCounts();
+
+    if (frame.reports_dropped) {
+      // Too many new reports for one frame: fetch the first page instead
+      dashboardEtag = null;
+      loadDashboard();
+      return;
+    }
+
+    const reportItems = document.getElementById("reportItems");
+    if (frame.reports) {
+      if (!reportItems.querySelector("tbody")) reportItems.innerHTML = REPORTS_TABLE_HTML;
+      const tbody = reportItems.querySelector("tbody");
+      // Newest first, right below the header row; skip any the dashboard fetch already showed
+      const fresh = frame.reports.filter(r => !tbody.querySelector(`.viewLogBtn[data-report-id="${r.id}"]`));
+      tbody.rows[0].insertAdjacentHTML("afterend", fresh.map(r => reportRowHtml(r, reportedUserOf(r))).join(""));
+      attachReportRowHandlers(tbody);
+    }
+
+    Object.entries(frame.users || {}).forEach(([username, change]) => {
+      const selector = `[data-username="${CSS.escape(username)}"]`;
+      if (change.deleted) {
+        reportItems.querySelectorAll(`.banUserBtn${selector}`).forEach(btn => {
+          btn.parentElement.innerHTML = `<span style="color:#888;">No actions</span>`;
+        });
+        return;
+      }
+      if (change.is_banned !== undefined) {
+        reportItems.querySelectorAll(`.banUserBtn${selector}`).forEach(btn => {
+          btn.textContent = change.is_banned ? "Unban" : "Ban";
+        });
+      }
+      if (change.is_muted !== undefined) {
+        reportItems.querySelectorAll(`.muteUserBtn${selector}`).forEach(btn => {
+          btn.textContent = change.is_muted ? "Unmute" : "Mute";
+        });
+      }
+    });
+  }
+
+  document.getElementById("navAdmin").addEventListener("click", () => {
+    showSection("adminSection");
+    dashboardEtag = null;  // always render on open
+    document.getElementById("reportItems").textContent = "Loading reports...";
+    loadDashboard();
+    if (!adminFeedActive) subscribeAdminFeed();
+    if (!dashboardTimer) {
+      dashboardTimer = setInterval(() => {
+        if (adminFeedActive) return;  // the feed is pushing changes
+        if (document.getElementById("adminSection").style.display !== "none") loadDashboard();
+      }, DASHBOARD_POLL_MS);
+    }
   });
 
+  document.getElementById("loadMoreReportsBtn").addEventListener("click", () => loadReportsPage(false));
+
 
   document.getElementById("navAccount").addEventListener("click", () => {
     showSection("accountSection");
   });
   
-  document.getElementById("navUsers").addEventListener("click", () => {
-    
-    showSection("usersSection");
+  // Users list is paged by the server; "Load more" follows next_cursor.
+  let usersNextCursor = null;
+
+  function userRowHtml(user) {
+    const isAdmin = user.role === "admin";
+    const disableDelete = user.is_master_admin ? "disabled style='opacity:0.5; cursor:not-allowed;'" : "";
+    return `
+      <tr>
+        <td>${user.username}</td>
+        <td>${user.role}</td>
+        <td>
+          <button class="deleteUserBtn" data-username="${user.username}" ${disableDelete}>Delete</button>
+        </td>
+        <td>
+          ${window.isMasterAdmin && !user.is_master_admin && user.username.trim() !== (document.getElementById("dashboardUsername").textContent.trim()) ? `<button class="promoteBtn ${isAdmin ? 'demote' : 'promote'}" data-username="${user.username}">  ${isAdmin ? "Demote" : "Promote"}</button>` : "Not allowed"}
+        </td>
+      </tr>`;
+  }
 
-    const allUsersList = document.getElementById("allUsersList");
-    allUsersList.innerHTML = "Loading...";
+  function attachUserRowHandlers(tbody) {
+    tbody.querySelectorAll(".deleteUserBtn:not([data-bound])").forEach(btn => {
+      btn.dataset.bound = "1";
+      if (!btn.disabled) {
+        btn.addEventListener("click", function () {
+          const username = this.dataset.username;
+          if (confirm(`Delete user '${username}'?`)) {
+            apiFetchWithRefresh(`${BASE_URL}/delete_user`, {
+              method: "POST",
+              headers: { "Content-Type": "application/json" },
+              body: JSON.stringify({ username }),
+            })
+              .then(() => {
+                showToast("User deleted.", "success");
+                document.getElementById("navUsers").click();
+              })
+              .catch(() => showToast("Failed to delete user.", "error"));
+          }
+        });
+      }
+    });
 
-    apiFetchWithRefresh(`${BASE_URL}/all_users`)
-      .then((data) => {
-        console.log("Fetched users:", data.users);
-        if (data.users && data.users.length > 0) {
-          let html = "<table><tr><th>Username</th><th>Role</th><th>Action</th><th>Change Role</th></tr>";
-          data.users.forEach((user) => {
-            const isAdmin = user.role === "admin";
-            const disableDelete = user.is_master_admin ? "disabled style='opacity:0.5; cursor:not-allowed;'" : "";
-            html += `
-              <tr>
-                <td>${user.username}</td>
-                <td>${user.role}</td>
-                <td>
-                  <button class="deleteUserBtn" data-username="${user.username}" ${disableDelete}>Delete</button>
-                </td>
-                <td>
-                  ${window.isMasterAdmin && !user.is_master_admin && user.username.trim() !== (document.getElementById("dashboardUsername").textContent.trim()) ? `<button class="promoteBtn ${isAdmin ? 'demote' : 'promote'}" data-username="${user.username}">  ${isAdmin ? "Demote" : "Promote"}</button>` : "Not allowed"}
-                </td>
-              </tr>`;
-          });
-          html += "</table>";
-          allUsersList.innerHTML = html;
-
-          document.querySelectorAll(".deleteUserBtn").forEach(btn => {
-            if (!btn.disabled) {
-              btn.addEventListener("click", function () {
-                const username = this.dataset.username;
-                if (confirm(`Delete user '${username}'?`)) {
-                  apiFetchWithRefresh(`${BASE_URL}/delete_user`, {
-                    method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({ username }),
-                  })
-                    .then(() => {
-                      showToast("User deleted.", "success");
-                      document.getElementById("navUsers").click();
-                    })
-                    .catch(() => showToast("Failed to delete user.", "error"));
-                }
-              });
+    tbody.querySelectorAll(".promoteBtn:not([data-bound])").forEach(btn => {
+      btn.dataset.bound = "1";
+      btn.addEventListener("click", function () {
+        const username = this.dataset.username;
+        const newRole = this.textContent.trim().toLowerCase() === "promote" ? "admin" : "user";
+        if (confirm(`Are you sure you want to change ${username}'s role to ${newRole}?`)) {
+          apiFetchWithRefresh(`${BASE_URL}/change_role`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ username, role: newRole }),
+          })
+          .then((res) => {
+            if (res.message) {
+              showToast(res.message, "success");
+              document.getElementById("navUsers").click(); // Reload table
+            } else {
+              showToast(res.error || "Failed to change role", "error");
             }
           });
-          
-          document.querySelectorAll(".promoteBtn").forEach(btn => {
-            btn.addEventListener("click", function () {
-              const username = this.dataset.username;
-              const newRole = this.textContent.trim().toLowerCase() === "promote" ? "admin" : "user";
-              if (confirm(`Are you sure you want to change ${username}'s role to ${newRole}?`)) {
-                apiFetchWithRefresh(`${BASE_URL}/change_role`, {
-                  method: "POST",
-                  headers: { "Content-Type": "application/json" },
-                  body: JSON.stringify({ username, role: newRole }),
-                })
-                .then((res) => {
-                  if (res.message) {
-                    showToast(res.message, "success");
-                    document.getElementById("navUsers").click(); // Reload table
-                  } else {
-                    showToast(res.error || "Failed to change role", "error");
-                  }
-                });
-              }
-            });
-          });
+        }
+      });
+    });
+  }
 
-        } else {
-          allUsersList.textContent = "No users found.";
+  function loadUsersPage(reset) {
+    const allUsersList = document.getElementById("allUsersList");
+    const loadMoreBtn = document.getElementById("loadMoreUsersBtn");
+    const prefix = document.getElementById("userSearchInput").value.trim();
+
+    if (reset) {
+      usersNextCursor = null;
+      allUsersList.innerHTML = "Loading...";
+    }
+
+    const params = new URLSearchParams();
+    if (usersNextCursor) params.set("after", usersNextCursor);
+    if (prefix) params.set("username", prefix);
+
+    apiFetchWithRefresh(`${BASE_URL}/all_users?${params}`)
+      .then((data) => {
+        const users = data.users || [];
+        if (reset) {
+          if (users.length === 0) {
+            allUsersList.textContent = "No users found.";
+            loadMoreBtn.style.display = "none";
+            return;
+          }
+          allUsersList.innerHTML = "<table><tbody><tr><th>Username</th><th>Role</th><th>Action</th><th>Change Role</th></tr></tbody></table>";
         }
+        const tbody = allUsersList.querySelector("tbody");
+        tbody.insertAdjacentHTML("beforeend", users.map(userRowHtml).join(""));
+        attachUserRowHandlers(tbody);
+
+        usersNextCursor = data.next_cursor;
+        loadMoreBtn.style.display = usersNextCursor ? "inline-block" : "none";
       })
       .catch(() => {
         allUsersList.textContent = "Failed to fetch users.";
       });
+  }
+
+  document.getElementById("navUsers").addEventListener("click", () => {
+    showSection("usersSection");
+    loadUsersPage(true);
   });
 
+  document.getElementById("loadMoreUsersBtn").addEventListener("click", () => loadUsersPage(false));
+  document.getElementById("userSearchBtn").addEventListener("click", () => loadUsersPage(true));
+
   document.getElementById("copyIdBtn").addEventListener("click", () => {
     const idSpan = document.getElementById("dashboardUserId");
     if (navigator.clipboard) {
@@ -610,13 +910,10 @@ document.addEventListener("DOMContentLoaded", () => {
   document.getElementById("chatSendBtn").addEventListener("click", () => {
     const input = document.getElementById("chatInput");
     const text = input.value.trim();
-    if (!text || !currentChatPartnerId || !socket) return;
+    if (!text || !(currentSessionId || currentChatPartnerId) || !socket) return;
 
-    // Emit message to server
-    socket.emit("private_message", {
-      recipient: currentChatPartnerId,
-      message: text
-    });
+    // Emit message to server; it routes by session, or by recipient once the partner is offline
+    sendChatMessage(text);
 
     // Also render locally
     appendMessage("You", text);
@@ -624,17 +921,18 @@ document.addEventListener("DOMContentLoaded", () => {
   });
 
   document.getElementById("endChatBtn").addEventListener("click", () => {
-    if (currentChatPartnerId && socket) {
+    if (currentSessionId && socket) {
       // NEW: Notify the other recipient
-      socket.emit("private_message", {
-        recipient: currentChatPartnerId,
-        message: `[System] ${document.getElementById("dashboardUsername").textContent} has ended the chat.`
-      });
+      sendChatMessage(`[System] ${document.getElementById("dashboardUsername").textContent} has ended the chat.`);
+      socket.emit("chat_ended_notice", { session_id: currentSessionId });
+    } else if (currentChatPartnerId && socket) {
+      // Partner is offline: stop leaving them messages
       socket.emit("chat_ended_notice", { recipient: currentChatPartnerId });
     }
 
     // Clear local chat session
     currentChatPartnerId = null;
+    currentSessionId = null;
     document.getElementById("chatMessages").innerHTML = "";
     document.getElementById("chatInput").value = "";
     document.getElementById("chatWithBox").style.display = "none";
@@ -0,0 +1,77 @@
+# my_flask_app/app/tokens.py
+
+import hashlib
+import time
+
+from flask_jwt_extended import JWTManager
+
+from .cache import LRUCache
+
+
+class VerifiedTokenCache:
+    """
+    sha256(token) -> claims for tokens whose signature and claims have
+    already been verified, so the same token presented again (every HTTP
+    request of a session, socket reconnects, dashboard polls) skips the
+    decode and HMAC check.
+
+    Entries expire with the token: an entry lives for TOKEN_CACHE_TTL or
+    until the token's exp, whichever comes first, and an expired token is
+    never served from here. Revocation is not cached; is_token_revoked still
+    runs on every use.
+    """
+
+    def __init__(self):
+        self._cache = LRUCache(maxsize=10000, ttl=300.0)
+
+    def init_app(self, app):
+        self.configure(app.config["TOKEN_CACHE_SIZE"], app.config["TOKEN_CACHE_TTL"])
+
+    def configure(self, maxsize=None, ttl=None):
+        self._cache.configure(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, token):
+        claims = self._cache.get(self._key(token))
+        if claims is None or claims.get("exp", 0) <= time.time():
+            return None
+        return dict(claims)
+
+    def put(self, token, claims):
+        exp = claims.get("exp")
+        if exp is None:
+            return  # tokens that never expire are always verified in full
+        ttl = min(self._cache.ttl, exp - time.time())
+        if ttl > 0:
+            self._cache.set(self._key(token), dict(claims), ttl=ttl)
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def hit_rate(self):
+        return self._cache.hit_rate()
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager whose decoding (HTTP requests and decode_token()) goes through verified_tokens."""
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # Only the plain case is cached: CSRF values and allow_expired change the answer
+        cacheable = csrf_value is None and not allow_expired
+        if cacheable:
+            claims = verified_tokens.get(encoded_token)
+            if claims is not None:
+                return claims
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        if cacheable:
+            verified_tokens.put(encoded_token, claims)
+        return claims
@@ -0,0 +1,84 @@
+# my_flask_app/app/wire.py
+#
+# Compact binary frames for private_message, for clients that ask for them
+# on identify ({"access_token": ..., "wire": "binary"}; the chat_id comes from
+# the token). Frames travel as Socket.IO binary attachments, so every other
+# event and every other client stays JSON.
+#
+# server -> client   version:u8  sender:u32  session_id:8 bytes  message:utf-8
+# client -> server   version:u8  session_id:8 bytes  message:utf-8
+#
+# chat_ids are 8 hex digits and session_ids 16, so they pack into 4 and 8
+# bytes. A message whose ids don't fit (older accounts, hand-made ids) goes
+# out as JSON instead, which binary clients also understand.
+
+import struct
+
+BINARY = "binary"
+JSON = "json"
+VERSION = 1
+
+_OUTGOING = struct.Struct(">BI8s")   # to the client
+_INCOMING = struct.Struct(">B8s")    # from the client
+
+
+def chat_id_to_int(chat_id):
+    """chat_id as a 4-byte int, or None unless it's exactly 8 lowercase hex digits."""
+    if not isinstance(chat_id, str) or len(chat_id) != 8:
+        return None
+    try:
+        value = int(chat_id, 16)
+    except ValueError:
+        return None
+    # int() also accepts "+1f", " 1f", "0x1f" and "1_f"; only take ids that round-trip
+    return value if f"{value:08x}" == chat_id else None
+
+
+def int_to_chat_id(value):
+    return f"{value:08x}"
+
+
+def _session_bytes(session_id):
+    if not isinstance(session_id, str) or len(session_id) != 16:
+        return None
+    try:
+        raw = bytes.fromhex(session_id)
+    except ValueError:
+        return None
+    return raw if raw.hex() == session_id else None
+
+
+def encode_message(sender_id, session_id, message):
+    """Frame for a delivered private_message, or None if it has to go as JSON."""
+    sender = chat_id_to_int(sender_id)
+    session = _session_bytes(session_id)
+    if sender is None or session is None or not isinstance(message, str):
+        return None
+    return _OUTGOING.pack(VERSION, sender, session) + message.encode("utf-8")
+
+
+def decode_message(frame):
+    """(sender_id, session_id, message) from encode_message's output."""
+    version, sender, session = _OUTGOING.unpack_from(frame)
+    if version != VERSION:
+        raise ValueError(f"Unknown frame version {version}")
+    return int_to_chat_id(sender), session.hex(), bytes(frame[_OUTGOING.size:]).decode("utf-8")
+
+
+def encode_client_message(session_id, message):
+    """What a binary client sends; used by the benchmark."""
+    return _INCOMING.pack(VERSION, bytes.fromhex(session_id)) + message.encode("utf-8")
+
+
+def decode_client_message(frame):
+    """A client's binary private_message as the dict the JSON path receives, or None if malformed."""
+    if len(frame) < _INCOMING.size:
+        return None
+    version, session = _INCOMING.unpack_from(frame)
+    if version != VERSION:
+        return None
+    try:
+        message = bytes(frame[_INCOMING.size:]).decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+    return {"session_id": session.hex(), "message": message}
@@ -0,0 +1,104 @@
+# my_flask_app/benchmarks/common.py
+# Shared setup for the scripts in this folder. Run them from the repo root:
+#   python -m benchmarks.<name>
+
+import os
+import tempfile
+import time
+
+# app.config reads these at import time, so they must exist before `import app`
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+os.environ.setdefault("JWT_SECRET_KEY", "bench-jwt-secret-key-with-enough-bytes")
+
+
+def make_app(database_url=None):
+    """
+    Builds the real app from create_app() against a throwaway SQLite file
+    (or database_url if given) with all tables created.
+    """
+    if database_url is None:
+        fd, path = tempfile.mkstemp(prefix="bench-", suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{path}"
+    os.environ["DATABASE_URL"] = database_url
+
+    from app import create_app, db
+    from app.config import Config
+    Config.SQLALCHEMY_DATABASE_URI = database_url
+
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def create_users(app, count, prefix="bench"):
+    """Inserts count users directly (no password hashing) and returns their chat_ids."""
+    from app import db
+    from app.models import User
+
+    chat_ids = [f"{i:08x}" for i in range(1, count + 1)]
+    with app.app_context():
+        db.session.bulk_insert_mappings(User, [
+            {"username": f"{prefix}{i}", "password": "x", "role": "user", "chat_id": cid}
+            for i, cid in enumerate(chat_ids)
+        ])
+        db.session.commit()
+    return chat_ids
+
+
+def access_tokens(app, chat_ids):
+    """{chat_id: access token} for users made by create_users, for socket identify."""
+    from flask_jwt_extended import create_access_token
+    from app.models import User
+
+    with app.app_context():
+        users = User.query.filter(User.chat_id.in_(chat_ids)).all()
+        return {
+            u.chat_id: create_access_token(identity={
+                "user_id": u.id,
+                "username": u.username,
+                "role": u.role,
+                "chat_id": u.chat_id,
+                "is_master_admin": False,
+                "moderation_version": u.moderation_version,
+            })
+            for u in users
+        }
+
+
+def pair_test_clients(a, a_id, b, b_id):
+    """
+    Pairs two identified socketio test clients through message_request and
+    request_response, and returns the session_id that private_message needs.
+    """
+    a.emit("message_request", {"target": b_id})
+    b.get_received()
+    b.emit("request_response", {"accepted": True, "to": a_id})
+    b.get_received()
+    result = [e for e in a.get_received() if e["name"] == "request_result"][0]
+    return result["args"][0]["session_id"]
+
+
+def timed(fn, repeat):
+    """Runs fn repeat times and returns the mean cost per call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def percentile(values, pct):
+    """pct in [0, 1]; nearest-rank on a sorted copy."""
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct))] if values else 0.0
+
+
+def rss_kb(pid="self"):
+    """Resident set size of a process in KiB (Linux)."""
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
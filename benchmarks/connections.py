@@ -0,0 +1,106 @@
+# my_flask_app/benchmarks/connections.py
+# Memory per websocket connection on one eventlet worker, and whether the
+# worker gives it back: RSS is sampled after a round of identified clients,
+# after the sweeper has closed clients that never identify, and after a
+# second full connect/disconnect round.
+#
+#   python -m benchmarks.connections [--clients 500]
+#
+# The per-connection figure is what SOCKET_CONNECTION_BYTES should be set to
+# (with some headroom) so that SOCKET_MEMORY_BUDGET_MB turns into a sensible
+# per-worker connection cap.
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import socketio as python_socketio
+
+from benchmarks.common import access_tokens, make_app, create_users, rss_kb
+from benchmarks.loadtest import free_port, wait_for_port
+
+IDENTIFY_TIMEOUT = 2
+SWEEP_INTERVAL = 1
+
+
+def connect(port, count, tokens=None):
+    clients = []
+    for i in range(count):
+        client = python_socketio.Client(reconnection=False)
+        client.connect(f"http://127.0.0.1:{port}", transports=["websocket"])
+        if tokens is not None:
+            client.emit("identify", {"access_token": tokens[i]})
+        clients.append(client)
+    return clients
+
+
+def close(clients):
+    for client in clients:
+        if client.connected:
+            client.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=500)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(prefix="bench-", suffix=".db")
+    os.close(fd)
+    database_url = f"sqlite:///{path}"
+    app = make_app(database_url)
+    chat_ids = create_users(app, args.clients)
+    tokens = access_tokens(app, chat_ids)
+    tokens = [tokens[chat_id] for chat_id in chat_ids]
+
+    env = dict(os.environ, SOCKET_IDENTIFY_TIMEOUT=str(IDENTIFY_TIMEOUT),
+               SOCKET_SWEEP_INTERVAL=str(SWEEP_INTERVAL))
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "-m", "benchmarks.loadtest", "--serve",
+         "--port", str(port), "--database-url", database_url],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        time.sleep(0.5)
+        idle_rss = rss_kb(server.pid)
+
+        clients = connect(port, args.clients, tokens)
+        time.sleep(1)
+        connected_rss = rss_kb(server.pid)
+        per_connection = (connected_rss - idle_rss) * 1024 / args.clients
+
+        lurkers = connect(port, args.clients // 5)
+        time.sleep(IDENTIFY_TIMEOUT + SWEEP_INTERVAL * 2 + 1)
+        reaped = sum(1 for client in lurkers if not client.connected)
+        close(lurkers)
+
+        close(clients)
+        time.sleep(1)
+        after_first_rss = rss_kb(server.pid)
+        close(connect(port, args.clients, tokens))
+        time.sleep(1)
+        after_second_rss = rss_kb(server.pid)
+
+        print(f"clients:                     {args.clients}")
+        print(f"idle worker RSS:             {idle_rss / 1024:.1f} MiB")
+        print(f"with clients connected:      {connected_rss / 1024:.1f} MiB")
+        print(f"memory/connection:           {per_connection / 1024:.1f} KiB")
+        print(f"unidentified reaped:         {reaped}/{len(lurkers)} within {IDENTIFY_TIMEOUT + SWEEP_INTERVAL * 2 + 1}s")
+        print(f"RSS after round 1 / round 2: {after_first_rss / 1024:.1f} / {after_second_rss / 1024:.1f} MiB")
+        budget = 1024 * 1024 * 1024
+        print(f"connections per 1 GiB:       {int(budget // per_connection) if per_connection > 0 else 'n/a'}")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
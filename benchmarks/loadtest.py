@@ -0,0 +1,252 @@
+# my_flask_app/benchmarks/loadtest.py
+# Load generator for the Socket.IO chat path. Every simulated client
+# identifies, clients pair up through message_request/request_response, and
+# each pair then exchanges private_message traffic over its chat session.
+#
+# In-process (default): thousands of Flask-SocketIO test clients against the
+# app from create_app(), on one eventlet loop. Measures the handler path.
+#   python -m benchmarks.loadtest --clients 2000 --seconds 10
+#
+# Websocket: starts real eventlet servers in subprocesses and connects real
+# python-socketio clients over websockets, spread across the workers.
+# Memory per connection is read from the servers' RSS.
+#   python -m benchmarks.loadtest --transport websocket --clients 500 --workers 1
+#   python -m benchmarks.loadtest --transport websocket --clients 500 --workers 2
+#
+# Rate limits are switched off unless --keep-rate-limits is given, so the
+# numbers show the chat path rather than the limiter.
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.common import access_tokens, make_app, create_users, percentile, rss_kb
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transport", choices=("test", "websocket"), default="test")
+    parser.add_argument("--clients", type=int, default=1000, help="simulated clients (even)")
+    parser.add_argument("--seconds", type=float, default=10, help="length of the traffic phase")
+    parser.add_argument("--rate", type=float, default=2.0, help="messages/sec sent by each client")
+    parser.add_argument("--workers", type=int, default=1, help="server processes (websocket only)")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--keep-rate-limits", action="store_true")
+    # Internal: run one server worker
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = []
+        self.delivered = 0
+
+    def record(self, sent_at):
+        self.latencies.append((time.perf_counter() - sent_at) * 1000)
+        self.delivered += 1
+
+    def report(self, seconds, connections, bytes_per_connection):
+        print(f"clients:            {connections}")
+        print(f"delivered messages: {self.delivered}")
+        print(f"messages/sec:       {self.delivered / seconds:.1f}")
+        print(f"latency p50:        {percentile(self.latencies, 0.50):.2f} ms")
+        print(f"latency p99:        {percentile(self.latencies, 0.99):.2f} ms")
+        print(f"memory/connection:  {bytes_per_connection / 1024:.1f} KiB")
+
+
+def encode(sent_at):
+    return f"t={sent_at!r}"
+
+
+def decode(message):
+    return float(message[2:])
+
+
+# ---------------------------------------------------------------- in-process
+
+def run_test_clients(args, app, chat_ids, tokens):
+    from app import socketio
+    from app.ratelimit import socket_limiter
+
+    if not args.keep_rate_limits:
+        socket_limiter.limits = {}
+    stats = Stats()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    clients = []
+    for chat_id in chat_ids:
+        client = socketio.test_client(app)
+        client.emit("identify", {"access_token": tokens[chat_id]})
+        clients.append(client)
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / len(clients)
+    tracemalloc.stop()
+
+    pairs = []
+    for i in range(0, len(clients) - 1, 2):
+        a, b = clients[i], clients[i + 1]
+        a.emit("message_request", {"target": chat_ids[i + 1]})
+        b.get_received()
+        b.emit("request_response", {"accepted": True, "to": chat_ids[i]})
+        b.get_received()
+        result = [e for e in a.get_received() if e["name"] == "request_result"][0]
+        pairs.append((a, b, result["args"][0]["session_id"]))
+
+    deadline = time.perf_counter() + args.seconds
+    interval = 1.0 / args.rate
+
+    def talk(sender, session_id, recipient):
+        eventlet.sleep(interval * (hash(session_id) % 100) / 100)  # spread the start
+        while time.perf_counter() < deadline:
+            sender.emit("private_message", {"session_id": session_id,
+                                            "message": encode(time.perf_counter())})
+            for event in recipient.get_received():
+                if event["name"] == "private_message":
+                    stats.record(decode(event["args"][0]["message"]))
+            eventlet.sleep(interval)
+
+    pool = eventlet.GreenPool(len(pairs) * 2)
+    for a, b, session_id in pairs:
+        pool.spawn(talk, a, session_id, b)
+        pool.spawn(talk, b, session_id, a)
+    pool.waitall()
+    stats.report(args.seconds, len(clients), per_connection)
+
+
+# ----------------------------------------------------------------- websocket
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=20):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def serve(args):
+    app = make_app(args.database_url)
+    from app import socketio
+    from app.ratelimit import socket_limiter
+    if not args.keep_rate_limits:
+        socket_limiter.limits = {}
+    socketio.run(app, host="127.0.0.1", port=args.port, log_output=False)
+
+
+def run_websocket_clients(args, chat_ids, tokens):
+    import socketio as python_socketio
+
+    env = dict(os.environ)
+    if args.workers > 1:
+        env["SOCKETIO_BACKEND"] = "sqlite"
+        env["SOCKETIO_BACKEND_PATH"] = tempfile.mktemp(prefix="bench-bus-", suffix=".db")
+
+    servers = []
+    for _ in range(args.workers):
+        port = free_port()
+        cmd = [sys.executable, "-W", "ignore", "-m", "benchmarks.loadtest", "--serve",
+               "--port", str(port), "--database-url", args.database_url]
+        if args.keep_rate_limits:
+            cmd.append("--keep-rate-limits")
+        proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL)
+        servers.append((port, proc))
+    try:
+        for port, _ in servers:
+            wait_for_port(port)
+        rss_before = sum(rss_kb(proc.pid) for _, proc in servers)
+
+        stats = Stats()
+        clients = []
+        sessions = {}  # client index -> session_id
+        for i, chat_id in enumerate(chat_ids):
+            port = servers[i % len(servers)][0]
+            client = python_socketio.Client(reconnection=False)
+            client.on("private_message",
+                      lambda data: stats.record(decode(data["message"])))
+            client.on("request_received",
+                      lambda data, c=client: c.emit("request_response",
+                                                    {"accepted": True, "to": data["from"]}))
+            client.on("request_result",
+                      lambda data, i=i: sessions.__setitem__(i, data.get("session_id")))
+            client.on("chat_started",
+                      lambda data, i=i: sessions.__setitem__(i, data["session_id"]))
+            client.connect(f"http://127.0.0.1:{port}", transports=["websocket"])
+            client.emit("identify", {"access_token": tokens[chat_id]})
+            clients.append(client)
+        time.sleep(1)
+        rss_after = sum(rss_kb(proc.pid) for _, proc in servers)
+        per_connection = (rss_after - rss_before) * 1024 / len(clients)
+
+        for i in range(0, len(clients) - 1, 2):
+            clients[i].emit("message_request", {"target": chat_ids[i + 1]})
+        time.sleep(1)
+
+        deadline = time.perf_counter() + args.seconds
+        interval = 1.0 / args.rate
+
+        def talk(i):
+            session_id = sessions.get(i)
+            if session_id is None:
+                return  # pairing didn't finish in time
+            eventlet.sleep(interval * (hash(session_id) % 100) / 100)
+            while time.perf_counter() < deadline:
+                clients[i].emit("private_message", {"session_id": session_id,
+                                                    "message": encode(time.perf_counter())})
+                eventlet.sleep(interval)
+
+        pool = eventlet.GreenPool(len(clients))
+        for i in range(len(clients)):
+            pool.spawn(talk, i)
+        pool.waitall()
+        time.sleep(0.5)  # let in-flight messages land
+
+        print(f"workers:            {args.workers}")
+        stats.report(args.seconds, len(clients), per_connection)
+        for client in clients:
+            client.disconnect()
+    finally:
+        for _, proc in servers:
+            proc.terminate()
+            proc.wait()
+
+
+def main():
+    args = parse_args()
+    if args.serve:
+        serve(args)
+        return
+
+    if args.database_url is None:
+        fd, path = tempfile.mkstemp(prefix="bench-", suffix=".db")
+        os.close(fd)
+        args.database_url = f"sqlite:///{path}"
+    app = make_app(args.database_url)
+    chat_ids = create_users(app, args.clients - args.clients % 2)
+    tokens = access_tokens(app, chat_ids)
+
+    if args.transport == "test":
+        run_test_clients(args, app, chat_ids, tokens)
+    else:
+        run_websocket_clients(args, chat_ids, tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# my_flask_app/benchmarks/login_storm.py
+# Login throughput and private_message latency while a login storm runs on the
+# same eventlet worker, with password hashing inline vs offloaded to tpool.
+#
+#   python -m benchmarks.login_storm [--seconds 5] [--concurrency 16]
+#
+# Message latency is measured as the delay between when a ping greenlet wanted
+# to send (every 20ms) and when the paired recipient received its
+# private_message, i.e. how long a socket waits behind the hashes. The socket
+# rate limiter is off, so every ping must arrive.
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import statistics
+import time
+
+from benchmarks.common import access_tokens, make_app, create_users, pair_test_clients, percentile
+from app import db, socketio
+from app.models import User
+from app.passwords import password_hasher
+from app.ratelimit import socket_limiter
+
+PASSWORD = "bench-password"
+PING_INTERVAL = 0.02
+PING = "ping "
+
+
+def run(app, sender, recipient, offload, seconds, concurrency):
+    password_hasher.offload = offload
+    done = {"logins": 0}
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    def login_loop(i):
+        client = app.test_client()
+        while time.perf_counter() < deadline:
+            res = client.post("/login", json={"username": f"storm{i}", "password": PASSWORD})
+            assert res.status_code == 200, res.json
+            done["logins"] += 1
+
+    a = socketio.test_client(app)
+    b = socketio.test_client(app)
+    tokens = access_tokens(app, [sender, recipient])
+    a.emit("identify", {"access_token": tokens[sender]})
+    b.emit("identify", {"access_token": tokens[recipient]})
+    session_id = pair_test_clients(a, sender, b, recipient)
+
+    pings = {"sent": 0}
+
+    def receive():
+        for event in b.get_received():
+            message = event["args"][0].get("message", "") if event["name"] == "private_message" else ""
+            if message.startswith(PING):
+                latencies.append((time.perf_counter() - float(message[len(PING):])) * 1000)
+
+    def ping_loop():
+        while time.perf_counter() < deadline:
+            wanted = time.perf_counter() + PING_INTERVAL
+            eventlet.sleep(PING_INTERVAL)
+            a.emit("private_message", {"session_id": session_id, "message": f"{PING}{wanted!r}"})
+            pings["sent"] += 1
+            receive()
+
+    pool = eventlet.GreenPool()
+    pool.spawn(ping_loop)
+    for i in range(concurrency):
+        pool.spawn(login_loop, i)
+    pool.waitall()
+    receive()
+    for client in (a, b):
+        if client.is_connected():
+            client.disconnect()
+    assert len(latencies) == pings["sent"], f"{len(latencies)}/{pings['sent']} pings delivered"
+
+    mode = "offloaded" if offload else "inline"
+    print(f"{mode:>10} {done['logins'] / seconds:>11.1f} {pings['sent']:>6} "
+          f"{statistics.median(latencies):>12.1f} {percentile(latencies, 0.99):>12.1f} "
+          f"{max(latencies):>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    app = make_app()
+    socket_limiter.limits = {}  # measuring the hashing, not the limiter
+    sender, recipient = create_users(app, 2)
+    with app.app_context():
+        stored = password_hasher.hash(PASSWORD)
+        db.session.bulk_insert_mappings(User, [
+            {"username": f"storm{i}", "password": stored, "role": "user", "chat_id": f"s{i:07d}"}
+            for i in range(args.concurrency)
+        ])
+        db.session.commit()
+
+    print(f"hash method: {password_hasher.method}, workers: {app.config['PASSWORD_HASH_WORKERS']}")
+    print(f"{'hashing':>10} {'logins/sec':>11} {'pings':>6} {'msg p50 ms':>12} {'msg p99 ms':>12} {'msg max ms':>12}")
+    for offload in (False, True):
+        run(app, sender, recipient, offload, args.seconds, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# my_flask_app/benchmarks/presence_lookup.py
+# Per-message cost of resolving the sender's chat_id as the number of live
+# sockets grows: the old linear scan over {chat_id: sid} vs PresenceRegistry,
+# plus the full private_message handler with the registry pre-filled.
+#
+#   python -m benchmarks.presence_lookup
+
+import random
+
+from benchmarks.common import access_tokens, make_app, create_users, timed
+from app.presence import PresenceRegistry
+
+SIZES = (100, 1_000, 10_000, 50_000)
+LOOKUPS = 2_000
+
+
+def linear_scan(connected_users, sid):
+    return next((cid for cid, s in connected_users.items() if s == sid), None)
+
+
+def bench_lookups():
+    print(f"{'sockets':>8} {'linear scan (us)':>18} {'registry (us)':>15}")
+    for size in SIZES:
+        connected_users = {f"{i:08x}": f"sid-{i}" for i in range(size)}
+        registry = PresenceRegistry()
+        for cid, sid in connected_users.items():
+            registry.connect(sid)
+            registry.identify(sid, cid)
+
+        sids = [f"sid-{random.randrange(size)}" for _ in range(LOOKUPS)]
+        it = iter(sids * 2)
+        scan = timed(lambda: linear_scan(connected_users, next(it)), LOOKUPS)
+        it = iter(sids * 2)
+        reg = timed(lambda: registry.chat_id_for(next(it)), LOOKUPS)
+        print(f"{size:>8} {scan:>18.2f} {reg:>15.3f}")
+
+
+def bench_handler():
+    from app import socketio
+    from app.ratelimit import socket_limiter
+    from app.sockets import presence
+
+    app = make_app()
+    socket_limiter.limits = {}  # measuring the handler, not the limiter
+    sender, recipient = create_users(app, 2)
+    tokens = access_tokens(app, [sender, recipient])
+    print(f"\n{'sockets':>8} {'private_message (us)':>21}")
+    for size in SIZES:
+        presence.clear()
+        for i in range(size):
+            presence.connect(f"filler-{i}")
+            presence.identify(f"filler-{i}", f"f{i:07x}")
+        a = socketio.test_client(app)
+        b = socketio.test_client(app)
+        a.emit("identify", {"access_token": tokens[sender]})
+        b.emit("identify", {"access_token": tokens[recipient]})
+        a.emit("message_request", {"target": recipient})
+        b.emit("request_response", {"accepted": True, "to": sender})
+        result = [e for e in a.get_received() if e["name"] == "request_result"][0]
+
+        payload = {"session_id": result["args"][0]["session_id"], "message": "hi"}
+        cost = timed(lambda: a.emit("private_message", payload), 500)
+        b.get_received()
+        print(f"{size:>8} {cost:>21.1f}")
+        a.disconnect()
+        b.disconnect()
+
+
+if __name__ == "__main__":
+    bench_lookups()
+    bench_handler()
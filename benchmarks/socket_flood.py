@@ -0,0 +1,111 @@
+# my_flask_app/benchmarks/socket_flood.py
+# Latency seen by well-behaved clients while one client floods private_message,
+# with SOCKET_RATE_LIMITS disabled vs enabled, on a single eventlet worker.
+#
+#   python -m benchmarks.socket_flood [--seconds 5] [--pairs 20]
+#
+# Each well-behaved client sends one message every 250ms, inside the default
+# private_message limit, to a paired partner. Latency is the delay between
+# when it wanted to send and when the partner received the message; every
+# message must arrive, or the run fails.
+
+import eventlet
+eventlet.monkey_patch()
+
+import argparse
+import statistics
+import time
+
+from benchmarks.common import access_tokens, make_app, create_users, pair_test_clients, percentile
+from app import socketio
+from app.ratelimit import socket_limiter
+
+INTERVAL = 0.25
+HELLO = "hello "
+
+
+def run(app, chat_ids, pairs, seconds, limits):
+    latencies = []
+    flood = {"sent": 0}
+    polite_counts = {"sent": 0, "delivered": 0}
+
+    clients = []
+    socket_limiter.limits = {}  # pairing isn't what's measured
+    tokens = access_tokens(app, chat_ids[:pairs * 2 + 2])
+    for chat_id in chat_ids[:pairs * 2 + 2]:
+        client = socketio.test_client(app)
+        client.emit("identify", {"access_token": tokens[chat_id]})
+        clients.append((chat_id, client))
+    (flooder_id, flooder), (victim_id, victim) = clients[0], clients[1]
+    flood_session = pair_test_clients(flooder, flooder_id, victim, victim_id)
+    polite = []
+    for i in range(2, len(clients) - 1, 2):
+        (a_id, a), (b_id, b) = clients[i], clients[i + 1]
+        polite.append((a, pair_test_clients(a, a_id, b, b_id), b))
+    socket_limiter.limits = limits
+    socket_limiter.clear()
+    deadline = time.perf_counter() + seconds
+
+    def flood_loop():
+        while time.perf_counter() < deadline and flooder.is_connected():
+            flooder.emit("private_message", {"session_id": flood_session, "message": "spam" * 20})
+            flood["sent"] += 1
+            eventlet.sleep(0)
+
+    def receive(partner):
+        for event in partner.get_received():
+            message = event["args"][0].get("message", "") if event["name"] == "private_message" else ""
+            if message.startswith(HELLO):
+                latencies.append((time.perf_counter() - float(message[len(HELLO):])) * 1000)
+                polite_counts["delivered"] += 1
+
+    def polite_loop(client, session_id, partner):
+        while time.perf_counter() < deadline:
+            wanted = time.perf_counter() + INTERVAL
+            eventlet.sleep(INTERVAL)
+            client.emit("private_message", {"session_id": session_id, "message": f"{HELLO}{wanted!r}"})
+            polite_counts["sent"] += 1
+            receive(partner)
+
+    def drain_victim():
+        while time.perf_counter() < deadline:
+            victim.get_received()
+            eventlet.sleep(0.01)
+
+    pool = eventlet.GreenPool()
+    pool.spawn(flood_loop)
+    pool.spawn(drain_victim)
+    for a, session_id, b in polite:
+        pool.spawn(polite_loop, a, session_id, b)
+    pool.waitall()
+    for _, _, partner in polite:
+        receive(partner)
+    for _, client in clients:
+        if client.is_connected():
+            client.disconnect()
+
+    label = "limited" if limits else "unlimited"
+    assert polite_counts["delivered"] == polite_counts["sent"], \
+        f"{label}: {polite_counts['delivered']}/{polite_counts['sent']} messages delivered"
+    print(f"{label:>10} {flood['sent']:>12} {polite_counts['delivered']:>10} "
+          f"{statistics.median(latencies):>12.2f} "
+          f"{percentile(latencies, 0.99):>12.2f} {max(latencies):>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--pairs", type=int, default=20)
+    args = parser.parse_args()
+
+    app = make_app()
+    chat_ids = create_users(app, args.pairs * 2 + 2)
+    configured = dict(app.config["SOCKET_RATE_LIMITS"])
+
+    print(f"{'limits':>10} {'flood sent':>12} {'delivered':>10} {'p50 ms':>12} {'p99 ms':>12} {'max ms':>12}")
+    run(app, chat_ids, args.pairs, args.seconds, {})
+    run(app, chat_ids, args.pairs, args.seconds, configured)
+
+
+if __name__ == "__main__":
+    main()
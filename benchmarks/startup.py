@@ -0,0 +1,88 @@
+# my_flask_app/benchmarks/startup.py
+# Cold-start cost of each way the app gets built, plus an import-time report
+# of where that time goes.
+#
+#   python -m benchmarks.startup [--runs 5] [--top 15]
+#
+# Every measurement is a fresh interpreter, like a new gunicorn worker or an
+# admin script run. Wall time is the best of --runs; the report parses
+# `python -X importtime` for the same snippet and lists the slowest imports
+# (top level and one below) by cumulative time.
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+MODES = [
+    ("import app", "import app"),
+    ("create_db_app()", "from app import create_db_app; create_db_app()"),
+    ("create_app()", "from app import create_app; create_app()"),
+    ("create_app(cli=True)", "from app import create_app; create_app(cli=True)"),
+]
+
+
+def _env():
+    fd, path = tempfile.mkstemp(prefix="bench-", suffix=".db")
+    os.close(fd)
+    env = dict(os.environ)
+    env.setdefault("SECRET_KEY", "bench-secret")
+    env.setdefault("JWT_SECRET_KEY", "bench-jwt-secret-key-with-enough-bytes")
+    env["DATABASE_URL"] = f"sqlite:///{path}"
+    env["PYTHONWARNINGS"] = "ignore"
+    return env
+
+
+def wall_time(code, runs, env):
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def import_report(code, env):
+    """[(module, cumulative ms)] for imports at nesting depth 0 and 1, from -X importtime."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env,
+                            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # One leading space, then two more per level of nesting
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append((name.strip(), int(cumulative) / 1000))
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    env = _env()
+
+    print(f"{'mode':>22} {'wall ms':>9} {'modules':>8}")
+    reports = {}
+    for label, code in MODES:
+        ms = wall_time(code, args.runs, env)
+        count = subprocess.run([sys.executable, "-c", code + "; import sys; print(len(sys.modules))"],
+                               env=env, check=True, capture_output=True, text=True)
+        print(f"{label:>22} {ms:>9.0f} {count.stdout.split()[-1]:>8}")
+        reports[label] = import_report(code, env)
+
+    for label in ("create_db_app()", "create_app()"):
+        print(f"\nslowest imports for {label} (cumulative ms):")
+        for name, ms in reports[label][:args.top]:
+            print(f"  {name:<24} {ms:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+# my_flask_app/benchmarks/token_verify.py
+# Cost of authenticating a request with an access token, with the verified
+# token cache (app/tokens.py) switched off vs on.
+#
+#   python -m benchmarks.token_verify
+#
+# "decode" is decode_token() alone: parsing plus the HMAC check. "socket
+# auth" adds the revocation check that identify and admin_subscribe run.
+# "GET /admin_only" and "identify" are whole requests through the test
+# clients, presenting the same token every time, as a polling page or a
+# reconnecting socket does.
+
+from benchmarks.common import access_tokens, make_app, create_users, timed
+from app import db, socketio
+from app.models import User
+from app.ratelimit import socket_limiter
+from app.sockets import verified_claims
+from app.tokens import verified_tokens
+from flask_jwt_extended import decode_token
+
+REPEAT = 2000
+
+
+def main():
+    app = make_app()
+    socket_limiter.limits = {}  # measuring authentication, not the limiter
+    user_id, admin_id = create_users(app, 2)
+    with app.app_context():
+        User.query.filter_by(chat_id=admin_id).update({"role": "admin"})
+        db.session.commit()
+    tokens = access_tokens(app, [user_id, admin_id])
+    token, admin_token = tokens[user_id], tokens[admin_id]
+
+    http = app.test_client()
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    client = socketio.test_client(app)
+
+    def identify():
+        client.emit("identify", {"access_token": token})
+        client.get_received()
+
+    size, ttl = verified_tokens._cache.maxsize, verified_tokens._cache.ttl
+    results = {}
+    for label, maxsize in (("uncached", 0), ("cached", size)):
+        verified_tokens.configure(maxsize=maxsize, ttl=ttl)
+        with app.app_context():
+            verified_claims(token)  # warm the revocation filter and caches
+            decode_cost = timed(lambda: decode_token(token), REPEAT)
+            auth_cost = timed(lambda: verified_claims(token), REPEAT)
+        assert http.get("/admin_only", headers=headers).status_code == 200
+        http_cost = timed(lambda: http.get("/admin_only", headers=headers), REPEAT)
+        identify_cost = timed(identify, REPEAT)
+        results[label] = (decode_cost, auth_cost, http_cost, identify_cost)
+
+    print(f"{'us per call':>18} {'uncached':>10} {'cached':>10} {'saved':>7}")
+    names = ("decode", "socket auth", "GET /admin_only", "identify")
+    for i, name in enumerate(names):
+        before, after = results["uncached"][i], results["cached"][i]
+        print(f"{name:>18} {before:>10.1f} {after:>10.1f} {1 - after / before:>7.0%}")
+    client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# my_flask_app/benchmarks/wire_format.py
+# Bytes on the wire and serialization CPU for one delivered private_message:
+# the JSON event vs the binary frame from app/wire.py.
+#
+#   python -m benchmarks.wire_format
+#
+# Sizes are what a websocket client receives: Engine.IO "4" message prefix,
+# the Socket.IO packet and the websocket frame header. A binary event is two
+# websocket frames (the packet header, then the attachment). JSON escapes
+# non-ASCII text as \uXXXX, so that is where the frame saves the most. CPU is
+# the server's cost to build the packet from sender, session_id and message.
+
+from benchmarks.common import timed
+from socketio.packet import EVENT, Packet
+from app.wire import encode_message, decode_client_message, encode_client_message
+
+SENDER = "00c0ffee"
+SESSION_ID = "0123456789abcdef"
+MESSAGES = [
+    ("short", "hey, you there?"),
+    ("sentence", "Sure, let's move the call to 3pm, I'll send the link in a minute."),
+    ("paragraph", "lorem ipsum dolor sit amet " * 20),
+    ("emoji", "ok 👍🎉🔥 " * 8),
+]
+REPEAT = 20_000
+
+
+def _ws_frame(payload_len):
+    return payload_len + (2 if payload_len < 126 else 4 if payload_len < 65536 else 10)
+
+
+def json_packet(message):
+    return Packet(EVENT, data=["private_message", {
+        "sender": SENDER, "message": message, "session_id": SESSION_ID,
+    }]).encode()
+
+
+def binary_packet(message):
+    return Packet(EVENT, data=["private_message",
+                               encode_message(SENDER, SESSION_ID, message)]).encode()
+
+
+def wire_bytes(encoded):
+    if isinstance(encoded, list):  # header packet + binary attachments
+        header, *attachments = encoded
+        return _ws_frame(len(("4" + header).encode())) + sum(_ws_frame(len(a)) for a in attachments)
+    return _ws_frame(len(("4" + encoded).encode()))
+
+
+def main():
+    print(f"{'message':>10} {'chars':>6} {'json B':>7} {'binary B':>9} {'saved':>6} "
+          f"{'json us':>8} {'binary us':>10}")
+    for label, message in MESSAGES:
+        json_size = wire_bytes(json_packet(message))
+        binary_size = wire_bytes(binary_packet(message))
+        json_cost = timed(lambda: json_packet(message), REPEAT)
+        binary_cost = timed(lambda: binary_packet(message), REPEAT)
+        print(f"{label:>10} {len(message):>6} {json_size:>7} {binary_size:>9} "
+              f"{1 - binary_size / json_size:>6.0%} {json_cost:>8.2f} {binary_cost:>10.2f}")
+
+    frame = encode_client_message(SESSION_ID, MESSAGES[1][1])
+    print(f"\nserver decode of a client frame: {timed(lambda: decode_client_message(frame), REPEAT):.2f} us")
+
+
+if __name__ == "__main__":
+    main()
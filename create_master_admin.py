@@ -1,15 +1,15 @@
 # create_master_admin.py
 
-from app import create_app, db
+from app import create_db_app, db
 from app.models import User
-from werkzeug.security import generate_password_hash
+from app.passwords import password_hasher
 
 # Customize these values:
 USERNAME = "masteradmin"
 PASSWORD = "ChangeThisPassword!"   # Choose a secure password!
 CHAT_ID = "00000000"         # Choose something unique
 
-app = create_app()
+app = create_db_app()  # DB only: no sockets, routes or background workers
 with app.app_context():
     existing = User.query.filter_by(username=USERNAME).first()
     if existing:
@@ -18,11 +18,11 @@ with app.app_context():
         existing.is_master_admin = True
         existing.is_banned = False
         existing.is_muted = False
-        existing.password = generate_password_hash(PASSWORD)
+        existing.password = password_hasher.hash(PASSWORD)
     else:
         master_admin = User(
             username=USERNAME,
-            password=generate_password_hash(PASSWORD),
+            password=password_hasher.hash(PASSWORD),
             role="admin",
             chat_id=CHAT_ID,
             is_master_admin=True,
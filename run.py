@@ -1,8 +1,10 @@
 #my_flask_app/run.py
 # For development/testing only. Use wsgi.py with Gunicorn in production.
 
+import os
 from dotenv import load_dotenv
 load_dotenv() 
+os.environ.setdefault("APP_ENV", "development")
 
 from app import create_app, socketio  # ⬅ make sure socketio is imported from __init__.py
 
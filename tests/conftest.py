@@ -0,0 +1,98 @@
+# my_flask_app/tests/conftest.py
+# One app per test session against a throwaway SQLite file. Run from the repo
+# root with `python -m pytest`.
+
+import os
+import tempfile
+
+import pytest
+
+# app.config reads these at import time, so they must exist before `import app`
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("JWT_SECRET_KEY", "test-jwt-secret-key-with-enough-bytes")
+_fd, _db_path = tempfile.mkstemp(prefix="test-", suffix=".db")
+os.close(_fd)
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+os.environ.setdefault("HISTORY_DIR", tempfile.mkdtemp(prefix="test-history-"))
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import create_app, db
+
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+@pytest.fixture(autouse=True)
+def clean_state(app):
+    """Every test starts with no sockets, sessions or rate limits."""
+    from app.ratelimit import socket_limiter
+    from app.sockets import chat_sessions, presence
+
+    limits = socket_limiter.limits
+    socket_limiter.limits = {}
+    yield
+    socket_limiter.limits = limits
+    socket_limiter.clear()
+    presence.clear()
+    chat_sessions.clear()
+
+
+_next_user = [1]
+
+
+@pytest.fixture
+def make_users(app):
+    """make_users(n) -> n new chat_ids, unique across the session."""
+    from app import db
+    from app.models import User
+
+    def make(count):
+        start = _next_user[0]
+        _next_user[0] += count
+        chat_ids = [f"{i:08x}" for i in range(start, start + count)]
+        with app.app_context():
+            db.session.add_all([
+                User(username=f"user-{cid}", password="x", role="user", chat_id=cid)
+                for cid in chat_ids
+            ])
+            db.session.commit()
+        return chat_ids
+
+    return make
+
+
+@pytest.fixture
+def socket_client(app):
+    """socket_client(chat_id) -> a test client identified with a real access token."""
+    from flask_jwt_extended import create_access_token
+    from app import socketio
+    from app.models import User
+
+    clients = []
+
+    def connect(chat_id):
+        with app.app_context():
+            user = User.query.filter_by(chat_id=chat_id).one()
+            token = create_access_token(identity={
+                "user_id": user.id,
+                "username": user.username,
+                "role": user.role,
+                "chat_id": user.chat_id,
+                "is_master_admin": False,
+                "moderation_version": user.moderation_version,
+            })
+        client = socketio.test_client(app)
+        client.emit("identify", {"access_token": token})
+        client.identify_events = client.get_received()  # e.g. offline_messages
+        clients.append(client)
+        return client
+
+    yield connect
+    for client in clients:
+        if client.is_connected():
+            client.disconnect()
@@ -0,0 +1,37 @@
+# my_flask_app/tests/test_dashboard.py
+
+import threading
+import time
+
+from app.dashboard import DashboardCache
+
+
+def test_concurrent_requests_on_a_stale_snapshot_build_once():
+    cache = DashboardCache()
+    cache.get(lambda: {"users": 0})
+    cache.invalidate()  # stale for everyone now
+
+    builds = []
+    started = threading.Event()
+
+    def build():
+        builds.append(1)
+        started.set()
+        time.sleep(0.2)  # the aggregate queries
+        return {"users": len(builds)}
+
+    results = []
+
+    def request():
+        results.append(cache.get(build))
+
+    first = threading.Thread(target=request)
+    first.start()
+    started.wait(1)
+    second = threading.Thread(target=request)  # arrives while the first is building
+    second.start()
+    first.join()
+    second.join()
+
+    assert len(builds) == 1
+    assert results[0] == results[1] == ({"users": 1}, results[0][1])
@@ -0,0 +1,50 @@
+# my_flask_app/tests/test_history.py
+
+from app.history import MessageHistory
+
+
+class _Sleeper:
+    """Stands in for socketio in _warm_up; counts how often it yielded."""
+
+    def __init__(self):
+        self.yields = 0
+
+    def sleep(self, seconds):
+        self.yields += 1
+
+
+def _history(directory, **settings):
+    history = MessageHistory()
+    history.enabled = True
+    history.directory = str(directory)
+    for name, value in settings.items():
+        setattr(history, name, value)
+    return history
+
+
+def test_cold_index_is_built_in_chunks_across_segments(tmp_path):
+    writer = _history(tmp_path, segment_bytes=2000)
+    for i in range(300):
+        writer.append("aaaa0001", "bbbb0002", f"message {i}")
+        writer.append("cccc0003", "aaaa0001", f"other {i}")
+    writer.close()
+    assert len(writer._segments()) > 1
+
+    # A fresh worker: nothing indexed, and each read may scan only 1 KiB
+    reader = _history(tmp_path, catch_up_bytes=1024)
+    assert reader.ref_for("aaaa0001", "bbbb0002") is None
+    assert reader.page("aaaa0001", "bbbb0002") is None
+
+    sleeper = _Sleeper()
+    reader._warm_up(sleeper)
+    assert sleeper.yields > 5  # built a chunk at a time, yielding in between
+
+    assert reader.ref_for("aaaa0001", "bbbb0002") is not None
+    messages, cursor = [], None
+    while True:
+        page, cursor = reader.page("bbbb0002", "aaaa0001", cursor, limit=40)
+        messages += [m["message"] for m in page]
+        if cursor is None:
+            break
+    assert messages == [f"message {i}" for i in reversed(range(300))]
+    reader.close()
@@ -0,0 +1,24 @@
+# my_flask_app/tests/test_mailbox.py
+
+from sqlalchemy.exc import OperationalError
+
+from app.mailbox import mailbox
+
+
+def test_full_buffer_wakes_the_flusher_instead_of_flushing_inline(app, make_users, monkeypatch):
+    sender, recipient = make_users(2)
+
+    def failing_flush():
+        raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+    monkeypatch.setattr(mailbox, "flush", failing_flush)
+    monkeypatch.setattr(mailbox, "batch_size", 3)
+    mailbox._wake.clear()
+    with app.app_context():
+        for i in range(3):
+            mailbox.enqueue(recipient, sender, f"m{i}")  # must not raise
+
+    assert mailbox._wake.is_set()
+    monkeypatch.undo()
+    with app.app_context():
+        assert [m["message"] for m in mailbox.take(recipient)] == ["m0", "m1", "m2"]
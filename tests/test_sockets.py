@@ -0,0 +1,64 @@
+# my_flask_app/tests/test_sockets.py
+
+from app.metrics import socket_event_errors, socket_event_seconds
+
+
+def test_disconnect_handler_does_not_raise(app, make_users, socket_client):
+    (chat_id,) = make_users(1)
+    client = socket_client(chat_id)
+    errors = socket_event_errors.value("disconnect")
+    handled = socket_event_seconds.count("disconnect")
+
+    client.disconnect()
+
+    assert socket_event_errors.value("disconnect") == errors
+    assert socket_event_seconds.count("disconnect") == handled + 1
+
+
+def pair(a, a_id, b, b_id):
+    a.emit("message_request", {"target": b_id})
+    b.get_received()
+    b.emit("request_response", {"accepted": True, "to": a_id})
+    b.get_received()
+    result = [e for e in a.get_received() if e["name"] == "request_result"][0]
+    return result["args"][0]["session_id"]
+
+
+def test_partner_going_offline_keeps_them_reachable_by_recipient(app, make_users, socket_client):
+    a_id, b_id = make_users(2)
+    a, b = socket_client(a_id), socket_client(b_id)
+    session_id = pair(a, a_id, b, b_id)
+
+    b.disconnect()
+    notices = [e["args"][0] for e in a.get_received() if e["name"] == "chat_ended_notice"]
+    assert notices == [{"from": b_id, "session_id": session_id, "reason": "offline"}]
+
+    # What login.js sends once the session is gone
+    a.emit("private_message", {"recipient": b_id, "message": "while you were out"})
+    assert not [e for e in a.get_received() if e["name"] == "error"]
+
+    b = socket_client(b_id)
+    waiting = [e["args"][0]["messages"] for e in b.identify_events if e["name"] == "offline_messages"]
+    assert [m["message"] for m in waiting[0]] == ["while you were out"]
+
+
+def test_ending_the_chat_stops_offline_messages(app, make_users, socket_client):
+    a_id, b_id = make_users(2)
+    a, b = socket_client(a_id), socket_client(b_id)
+    pair(a, a_id, b, b_id)
+    b.disconnect()
+    a.get_received()
+
+    # login.js's End Chat once the partner is offline
+    a.emit("chat_ended_notice", {"recipient": b_id})
+    a.emit("private_message", {"recipient": b_id, "message": "still there?"})
+    errors = [e["args"][0]["error"] for e in a.get_received() if e["name"] == "error"]
+    assert errors == ["Start a chat with that user first."]
+
+
+def test_strangers_cannot_leave_offline_messages(app, make_users, socket_client):
+    a_id, b_id = make_users(2)
+    a = socket_client(a_id)
+    a.emit("private_message", {"recipient": b_id, "message": "hi"})
+    errors = [e["args"][0]["error"] for e in a.get_received() if e["name"] == "error"]
+    assert errors == ["Start a chat with that user first."]